@@ -0,0 +1,185 @@
+"""Headless batch entry point.
+
+Runs one model without any plotting and writes its output, e.g.:
+
+    python batch.py --penguins 50 --fish 500 --seals 5 --timesteps 300 --seed 1 --output out.parquet
+
+The model and its dependencies are only imported after the arguments are parsed (so the
+config dicts in `process` can be set first), and matplotlib / PIL are only imported with
+`--plot`. Import, construction, run and write times are reported separately.
+"""
+from argparse import ArgumentParser
+from json import dump as json_dump
+from time import perf_counter
+
+START_TIME = perf_counter()
+
+
+def get_parser() -> ArgumentParser:
+    from process import POPULATION, TOTAL_TIMESTEPS, MAP_SIZE
+
+    parser = ArgumentParser(description="Run the seal-penguin-fish model headless.")
+    parser.add_argument("--penguins", type=int, default=POPULATION["penguin"], help="number of penguins")
+    parser.add_argument("--seals", type=int, default=POPULATION["seal"], help="number of seals")
+    parser.add_argument("--fish", type=int, default=POPULATION["fish"], help="number of fish")
+    parser.add_argument("--timesteps", type=int, default=TOTAL_TIMESTEPS, help="number of steps")
+    parser.add_argument("--map-size", type=int, default=MAP_SIZE, help="grid width and height")
+    parser.add_argument("--seed", type=int, default=None, help="random seed")
+    parser.add_argument(
+        "--output", default=None,
+        help="agent output (.csv, .parquet, .pkl, or a .store directory for `TrajectoryStore.load`), "
+             "or the event log (.pkl.gz) with --events")
+    parser.add_argument("--terrain-output", default=None, help="land cells per step (.pkl)")
+    parser.add_argument("--events", action="store_true", help="record an event log instead of agent rows")
+    parser.add_argument(
+        "--heatmaps", default=None,
+        help="occupancy and kill heatmaps (.npz, or .tif GeoTIFFs: one for the run, one per window)")
+    parser.add_argument(
+        "--heatmap-windows", default=None,
+        help="also accumulate the heatmaps over these step ranges, e.g. 0:100,100:300")
+    parser.add_argument("--space-backend", choices=["dense", "sparse"], default=None)
+    parser.add_argument(
+        "--placement", choices=["batch", "rejection"], default=None,
+        help="initial placement (default rejection; batch places exactly N agents, with other positions)")
+    parser.add_argument(
+        "--homing", choices=["flow", "greedy"], default=None,
+        help="how agents head home (default greedy; flow routes around the terrain, with other trajectories)")
+    parser.add_argument("--kernels", choices=["auto", "numba", "numpy"], default=None)
+    parser.add_argument(
+        "--melt-timeline", default=None,
+        help="replay the ice melt from this .npz file (generated and saved there if missing)")
+    parser.add_argument("--melt-seed", type=int, default=None, help="seed used to generate the melt timeline")
+    parser.add_argument("--terrain-cache-dir", default=None, help="cache the terrain masks in this directory")
+    parser.add_argument("--timings", default=None, help="write the timings to this JSON file")
+    parser.add_argument("--plot", action="store_true", help="also draw the frames and summary charts")
+    parser.add_argument("--verbose", action="store_true", help="print every step")
+    return parser
+
+
+def main(argv: list or None = None) -> dict:
+    args = get_parser().parse_args(argv)
+
+    # the config dicts are read when the model modules are imported
+    import process
+    if args.map_size != process.MAP_SIZE:
+        process.MAP_SIZE = args.map_size
+    if args.space_backend is not None:
+        process.SPACE_VARS["backend"] = args.space_backend
+    if args.kernels is not None:
+        process.KERNEL_VARS["backend"] = args.kernels
+    if args.placement is not None:
+        process.PLACEMENT_VARS["method"] = args.placement
+    if args.homing is not None:
+        process.HOMING_VARS["method"] = args.homing
+    if args.terrain_cache_dir is not None:
+        process.SPACE_VARS["terrain_cache_dir"] = args.terrain_cache_dir
+
+    timings = {}
+    start = perf_counter()
+    from random import seed as random_seed
+    from process.utils import run_model
+    from process.events import run_model_events
+    from process.heatmap import SpatialHeatmaps, run_model_heatmaps
+    from run import SealPenguinFishModel
+    timings["import"] = perf_counter() - start
+    timings["startup"] = perf_counter() - START_TIME
+
+    # a saved timeline is checked (size, terrain, stability, length) by the model
+    melt_timeline = None
+    if args.melt_timeline is not None:
+        start = perf_counter()
+        from os.path import exists
+        from process.melt import MeltTimeline
+        if exists(args.melt_timeline):
+            melt_timeline = MeltTimeline.load(args.melt_timeline)
+            melt_timeline.check(timesteps=args.timesteps)
+        timings["melt_timeline"] = perf_counter() - start
+
+    start = perf_counter()
+    if args.seed is not None:
+        random_seed(args.seed)
+    model = SealPenguinFishModel(
+        N_penguins=args.penguins,
+        N_seals=args.seals,
+        N_fish=args.fish,
+        width=args.map_size,
+        height=args.map_size,
+        space_backend=process.SPACE_VARS["backend"],
+        melt_timeline=melt_timeline)
+    if args.seed is not None:
+        model.random.seed(args.seed)
+    timings["construction"] = perf_counter() - start
+
+    if args.melt_timeline is not None and melt_timeline is None:
+        # generated on the model's own terrain, then saved for the next runs
+        start = perf_counter()
+        melt_timeline = MeltTimeline.from_model(model, args.timesteps, seed=args.melt_seed)
+        melt_timeline.save(args.melt_timeline)
+        model.set_melt_timeline(melt_timeline, timesteps=args.timesteps)
+        timings["melt_timeline"] += perf_counter() - start
+
+    windows = None
+    if args.heatmap_windows is not None:
+        windows = [tuple(int(step) for step in window.split(":")) for window in args.heatmap_windows.split(",")]
+    # heatmaps alone do not need the trajectories
+    heatmaps_only = args.heatmaps is not None and not (
+        args.events or args.plot or args.output is not None or args.terrain_output is not None)
+
+    if args.heatmaps is not None and not heatmaps_only:
+        model.heatmaps = heatmaps = SpatialHeatmaps.from_model(model, windows=windows)
+
+    start = perf_counter()
+    if heatmaps_only:
+        heatmaps = run_model_heatmaps(model, windows=windows, timesteps=args.timesteps, verbose=args.verbose)
+    elif args.events:
+        event_log = run_model_events(model, timesteps=args.timesteps, verbose=args.verbose)
+    else:
+        output, terrain_history = run_model(model, timesteps=args.timesteps, verbose=args.verbose)
+    timings["run"] = perf_counter() - start
+
+    start = perf_counter()
+    if args.events:
+        if args.output is not None:
+            event_log.save(args.output)
+        if args.plot or args.terrain_output is not None:
+            output, terrain_history = event_log.to_trajectory()
+    elif args.output is not None:
+        if args.output.endswith(".csv"):
+            output.to_csv(args.output, index=False)
+        elif args.output.endswith(".parquet"):
+            output.to_parquet(args.output, index=False)
+        elif args.output.endswith(".store"):
+            from process.store import TrajectoryStore
+            TrajectoryStore.from_output(output).save(args.output)
+        else:
+            output.to_pickle(args.output)
+    if args.heatmaps is not None:
+        if args.heatmaps.endswith(".tif"):
+            for name in heatmaps.windows:
+                path = args.heatmaps if name == "all" else args.heatmaps[:-len(".tif")] + f"_{name}.tif"
+                heatmaps.to_geotiff(path, window=name)
+        else:
+            heatmaps.save(args.heatmaps)
+    if args.terrain_output is not None:
+        from pandas import to_pickle
+        to_pickle(terrain_history, args.terrain_output)
+    timings["write"] = perf_counter() - start
+
+    if args.plot:
+        start = perf_counter()
+        from vis import simple_vis, plot_summary_charts
+        simple_vis(output, terrain_history)
+        plot_summary_charts(output)
+        timings["plot"] = perf_counter() - start
+
+    timings["total"] = perf_counter() - START_TIME
+    print(" ".join(f"{name}={value:.3f}s" for name, value in timings.items()))
+    if args.timings is not None:
+        with open(args.timings, "w") as fid:
+            json_dump(timings, fid, indent=2)
+
+    return timings
+
+
+if __name__ == "__main__":
+    main()
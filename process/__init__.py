@@ -6,6 +6,67 @@ LAND_LOCATIONS = [
     [(150, 175), (25, 50)]
 ]
 
+SPACE_VARS = {
+    # "dense": Mesa MultiGrid and an object terrain array (fine for MAP_SIZE ~200)
+    # "sparse": only occupied cells and coastal terrain tiles are materialised,
+    #           use it for large maps (e.g. the 1200 x 1200 native basemap resolution)
+    "backend": "dense",
+    "terrain_tile_size": 64,
+    # sparse backend only: the terrain is read lazily from a land/water pyramid of the basemap
+    "basemap": "scott_base.tif",
+    "terrain_region": None,        # (col_off, row_off, n_cols, n_rows) in basemap pixels, None for all
+    "terrain_coarse_level": 3,     # tiles all land/water at 1/8 resolution are never read at full resolution
+    # both backends: e.g. "cache" to keep the terrain masks (pyramid levels) on disk
+    "terrain_cache_dir": None,
+}
+
+PLACEMENT_VARS = {
+    # "rejection": per-agent gauss draws until the terrain matches, agents dropped after
+    #              50 misses
+    # "batch": each population is drawn at once among the valid cells, weighted by a
+    #          Gaussian around INITIAL_LOCATIONS (exactly N agents are placed, faster for
+    #          large populations, but other initial positions than "rejection")
+    "method": "rejection",
+}
+
+HOMING_VARS = {
+    # "greedy": a step towards the home over the neighborhood, blind to obstacles (the
+    #           only one on the sparse backend)
+    # "flow": agents heading home follow shared distance fields to their home cluster,
+    #         routed around the terrain they cannot cross (see process/homing.py), other
+    #         trajectories than "greedy"
+    "method": "greedy",
+    "cluster_size": 8,     # homes within the same square of cells share a field
+}
+
+PREY_SEARCH_VARS = {
+    # how hunting predators find their nearest prey in their vision:
+    # "exact": best-first descent of a count pyramid of the live prey (blocks of 2, 4, 8...
+    #          cells), the same prey are chosen as with "scan"
+    # "approximate": the descent stops at blocks of 2 ** approximate_level cells, taken
+    #                whole (nearest blocks first, not the nearest prey within them)
+    # "scan": every prey in the vision window is listed (the search of older runs)
+    "mode": "exact",
+    "approximate_level": 2,
+    # below this many occupied cells, scanning the set is cheaper than the descent
+    "min_cells": 1000,
+}
+
+KERNEL_VARS = {
+    # "auto": Numba-compiled kernels when numba is installed, NumPy otherwise
+    # "numba" / "numpy": force one of them (same results either way)
+    "backend": "auto",
+}
+
+MONITOR_VARS = {
+    # opt-in live view of a running model (see process/monitor.py), e.g. open
+    # http://127.0.0.1:8765/ in a browser or run `curl -N http://127.0.0.1:8765/stream`
+    "enabled": False,
+    "host": "127.0.0.1",
+    "port": 8765,
+    "queue_size": 64,   # messages buffered per client before a slow client is resynced
+}
+
 CLIMATE_VARS = {
     # Reduced drastically. At 1 timestep = 1 hour, a 3% melt rate would destroy 
     # the land in days. 0.1% per hour allows for gradual melting over 3 months.
@@ -36,6 +97,11 @@ PARAMS = {
             "speed": {"walk": 2.0 * SPEED_SCALER, "run": 4.0 * SPEED_SCALER},     # 2 km/h cruise, 4 km/h burst
             "vision": {"escape": 3.0, "home": None}, #  6km vision (2 grids * 3km)
             "hunt_success_rate": None,
+            # Spawning: every `interval` steps each live fish spawns one fry (at its cell,
+            # sharing its home) with probability `rate`, up to `capacity` live fish (None
+            # for no limit). Dead fish are recycled as the fry after `retire_after` steps
+            # (see process/pool.py). A rate of 0 disables it.
+            "reproduction": {"rate": 0.0, "interval": 1, "capacity": None, "retire_after": 1},
     },
     "penguin": {
             # A 5-day foraging trip = 120 hours.
@@ -45,9 +111,16 @@ PARAMS = {
             "speed": {"walk": 7.0 * SPEED_SCALER, "run": 15.0 * SPEED_SCALER},    # 7 km/h cruise, 15 km/h sprint
             "vision": {"hunt": 60.0, "escape": 2.0}, # 12 km hunt vision, 6 km escape vision
             "hunt_success_rate": 0.5,
+            # A hunting penguin keeps chasing its fish (while alive and in vision) and only
+            # rescans its whole hunt vision every N steps (e.g. 10, fewer searches but other
+            # trajectories than older runs). None rescans every step.
+            "target_rescan_interval": None,
             # Max real-world travel distance ~1000 km.
             # 1000 km / 3 km per grid = 333 grid units.
             # "max_travel_distance": 333.0 
+            # Fledging: every `interval` steps (240 = a month) each live penguin on land
+            # raises one chick with probability `rate`, same rules as the fish spawning.
+            "reproduction": {"rate": 0.0, "interval": 240, "capacity": None, "retire_after": 1},
         },
     "seal": {
             "energy": {"max": 60, 
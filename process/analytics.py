@@ -0,0 +1,392 @@
+from numpy import argsort as np_argsort
+from numpy import asarray as np_asarray
+from numpy import bincount as np_bincount
+from numpy import concatenate as np_concatenate
+from numpy import full as np_full
+from numpy import hypot as np_hypot
+from numpy import int64 as np_int64
+from numpy import lexsort as np_lexsort
+from numpy import nonzero as np_nonzero
+from numpy import ones as np_ones
+from numpy import searchsorted as np_searchsorted
+from numpy import unique as np_unique
+from numpy import zeros as np_zeros
+from pandas import Categorical, DataFrame, MultiIndex
+from pandas import concat as pandas_concat
+from process.animal import TYPE_NAMES, STATUS_NAMES, DEAD, FULL
+
+# agents are keyed by (type, id), packed into one integer
+_KEY_SHIFT = 32
+
+AGENT_METRICS = ["steps", "alive_steps", "water_steps", "land_steps", "distance", "kills"]
+TRIP_COLUMNS = ["type", "id", "start", "end", "duration", "outcome"]
+
+
+def get_agent_keys(type_codes, ids):
+    """Packs (type code, id) pairs into int64 keys."""
+    return (np_asarray(type_codes, dtype=np_int64) << _KEY_SHIFT) | np_asarray(ids, dtype=np_int64)
+
+
+def split_agent_keys(keys) -> tuple:
+    """Inverse of `get_agent_keys`: returns (type codes, ids)."""
+    keys = np_asarray(keys, dtype=np_int64)
+    return keys >> _KEY_SHIFT, keys & ((1 << _KEY_SHIFT) - 1)
+
+
+def _agent_index(keys) -> MultiIndex:
+    type_codes, ids = split_agent_keys(keys)
+    names = np_asarray(TYPE_NAMES, dtype=object)[type_codes] if len(keys) else []
+    return MultiIndex.from_arrays([names, ids], names=["type", "id"])
+
+
+def _encode(output: DataFrame) -> dict:
+    """Turns a `run_model` output (or a chunk of it) into numpy arrays with integer codes."""
+    type_codes = Categorical(output["type"], categories=TYPE_NAMES).codes
+    status_codes = Categorical(output["status"], categories=STATUS_NAMES).codes
+    return {
+        "key": get_agent_keys(type_codes, output["id"].to_numpy()),
+        "time": output["time"].to_numpy(dtype=np_int64),
+        "x": output["x"].to_numpy(dtype=float),
+        "y": output["y"].to_numpy(dtype=float),
+        "status": status_codes.astype(np_int64),
+        "water": output["terrain"].to_numpy() == "water",
+    }
+
+
+class TrajectoryAnalytics:
+    """Per-agent and per-type metrics of a run, computed in vectorized passes over its output.
+
+    The output of `run_model` (one row per agent per step) can be given in one go
+    (`from_output`) or as a sequence of chunks (`from_chunks`, `update`), e.g. the row
+    groups of a file too large for memory. Chunks can be cut anywhere as long as the rows
+    of each agent come in time order (the `run_model` outputs are ordered by time). The
+    last state of every agent is carried from one chunk to the next, so distances, status
+    transitions and trips spanning two chunks are counted exactly once.
+
+    Metrics:
+
+    - `agent_metrics`: steps, alive steps, steps in water / on land (while alive),
+      distance travelled and kills, per (type, id),
+    - `type_metrics`: the same summed and averaged per type, with kill rates,
+    - `census` / `survival`: agents by type and status at every step,
+    - `foraging_trips`: every continuous stretch spent in water by a live agent.
+
+    Kills are counted from status changes: a predator turning "full" has just eaten.
+    """
+
+    def __init__(self):
+        self._metrics = None
+        self._census = None
+        self._trips = []
+        # last row of every agent seen so far
+        self._carry = {
+            "key": np_zeros(0, dtype=np_int64),
+            "time": np_zeros(0, dtype=np_int64),
+            "x": np_zeros(0),
+            "y": np_zeros(0),
+            "status": np_zeros(0, dtype=np_int64),
+            "water": np_zeros(0, dtype=bool),
+            "trip_start": np_zeros(0, dtype=np_int64)}
+
+    @classmethod
+    def from_output(cls, output: DataFrame):
+        analytics = cls()
+        analytics.update(output)
+        return analytics
+
+    @classmethod
+    def from_chunks(cls, chunks):
+        """Builds the metrics from an iterable of output chunks (see `iter_output_chunks`)."""
+        analytics = cls()
+        for chunk in chunks:
+            analytics.update(chunk)
+        return analytics
+
+    def update(self, chunk: DataFrame, presorted: bool = False):
+        """Adds a chunk of rows (columns of `run_model`: id, time, type, status, x, y, terrain).
+
+        Args:
+            chunk (DataFrame): The rows to add.
+            presorted (bool): The rows are already ordered by agent then time (skips a sort).
+        """
+        if len(chunk) == 0:
+            return
+        self.update_arrays(_encode(chunk), presorted=presorted)
+
+    def update_arrays(self, rows: dict, presorted: bool = False):
+        """Same as `update` on already encoded arrays (see `TrajectoryIndex`)."""
+        carry = self._carry
+        in_chunk = np_searchsorted(carry["key"], rows["key"])
+        carried = np_zeros(len(carry["key"]), dtype=bool)
+        found = in_chunk < len(carry["key"])
+        carried[in_chunk[found][carry["key"][in_chunk[found]] == rows["key"][found]]] = True
+
+        n_carry = int(carried.sum())
+        data = {name: np_concatenate((carry[name][carried], rows[name])) for name in rows}
+        is_carry = np_zeros(len(data["key"]), dtype=bool)
+        is_carry[:n_carry] = True
+        trip_start = np_full(len(data["key"]), -1, dtype=np_int64)
+        trip_start[:n_carry] = carry["trip_start"][carried]
+
+        if not presorted or n_carry:
+            order = np_lexsort((~is_carry, data["time"], data["key"]))
+            data = {name: values[order] for name, values in data.items()}
+            is_carry = is_carry[order]
+            trip_start = trip_start[order]
+
+        key = data["key"]
+        n_rows = len(key)
+        first = np_ones(n_rows, dtype=bool)
+        first[1:] = key[1:] != key[:-1]
+        last = np_ones(n_rows, dtype=bool)
+        last[:-1] = first[1:]
+        agent_keys, group = np_unique(key, return_inverse=True)
+        n_agents = len(agent_keys)
+
+        alive = data["status"] != DEAD
+        counted = ~is_carry
+
+        # moves (between two consecutive rows of the same agent)
+        step_length = np_zeros(n_rows)
+        step_length[1:] = np_hypot(data["x"][1:] - data["x"][:-1], data["y"][1:] - data["y"][:-1])
+        step_length[first] = 0.0
+
+        # kills: the predator turns "full"
+        prev_status = np_zeros(n_rows, dtype=np_int64)
+        prev_status[1:] = data["status"][:-1]
+        kills = counted & ~first & (data["status"] == FULL) & (prev_status != FULL)
+
+        metrics = DataFrame({
+            "steps": np_bincount(group, weights=counted, minlength=n_agents),
+            "alive_steps": np_bincount(group, weights=counted & alive, minlength=n_agents),
+            "water_steps": np_bincount(group, weights=counted & alive & data["water"], minlength=n_agents),
+            "land_steps": np_bincount(group, weights=counted & alive & ~data["water"], minlength=n_agents),
+            "distance": np_bincount(group, weights=step_length, minlength=n_agents),
+            "kills": np_bincount(group, weights=kills, minlength=n_agents),
+        }, index=agent_keys)
+        if self._metrics is None:
+            self._metrics = metrics
+        else:
+            self._metrics = self._metrics.add(metrics, fill_value=0)
+
+        # census by (time, type, status)
+        census_rows = DataFrame({
+            "time": data["time"][counted],
+            "type": (key >> _KEY_SHIFT)[counted],
+            "status": data["status"][counted]})
+        census = census_rows.groupby(["time", "type", "status"]).size()
+        self._census = census if self._census is None else self._census.add(census, fill_value=0)
+
+        # trips: runs of consecutive rows in water (while alive)
+        at_sea = alive & data["water"]
+        prev_at_sea = np_zeros(n_rows, dtype=bool)
+        prev_at_sea[1:] = at_sea[:-1]
+        next_at_sea = np_zeros(n_rows, dtype=bool)
+        next_at_sea[:-1] = at_sea[1:]
+        starts = np_nonzero(at_sea & (first | ~prev_at_sea))[0]
+        ends = np_nonzero(at_sea & (last | ~next_at_sea))[0]
+        start_times = data["time"][starts]
+        resumed = trip_start[starts] >= 0
+        start_times[resumed] = trip_start[starts][resumed]
+
+        closed = ~last[ends]
+        if closed.any():
+            closed_ends = ends[closed]
+            after = closed_ends + 1
+            trips = DataFrame({
+                "key": key[closed_ends],
+                "start": start_times[closed],
+                "end": data["time"][closed_ends],
+                "outcome": np_asarray(["returned", "died"], dtype=object)[
+                    (data["status"][after] == DEAD).astype(int)]})
+            self._trips.append(trips)
+
+        # new carry: the last row of each agent in this chunk (+ the start of its open trip)
+        new_trip_start = np_full(n_rows, -1, dtype=np_int64)
+        open_ends = ends[~closed]
+        new_trip_start[open_ends] = start_times[~closed]
+        new_carry = {name: values[last] for name, values in data.items()}
+        new_carry["trip_start"] = new_trip_start[last]
+
+        kept = {name: values[~carried] for name, values in carry.items()}
+        merged = {name: np_concatenate((kept[name], new_carry[name])) for name in carry}
+        order = np_argsort(merged["key"], kind="stable")
+        self._carry = {name: values[order] for name, values in merged.items()}
+
+    def agent_metrics(self) -> DataFrame:
+        """Metrics per agent, indexed by (type, id)."""
+        metrics = DataFrame(columns=AGENT_METRICS, dtype=float) if self._metrics is None else self._metrics.copy()
+        metrics.index = _agent_index(metrics.index.to_numpy())
+        for col in ["steps", "alive_steps", "water_steps", "land_steps", "kills"]:
+            metrics[col] = metrics[col].astype(int)
+        metrics["water_fraction"] = metrics["water_steps"] / metrics["alive_steps"].where(metrics["alive_steps"] > 0)
+        metrics["kill_rate"] = metrics["kills"] / metrics["alive_steps"].where(metrics["alive_steps"] > 0)
+        return metrics
+
+    def type_metrics(self) -> DataFrame:
+        """Metrics per type: totals, means per agent and kills per alive step."""
+        metrics = self.agent_metrics()
+        grouped = metrics.groupby(level="type")
+        summary = grouped[AGENT_METRICS].sum()
+        summary["agents"] = grouped.size()
+        summary["mean_distance"] = grouped["distance"].mean()
+        summary["mean_kills"] = grouped["kills"].mean()
+        summary["water_fraction"] = summary["water_steps"] / summary["alive_steps"].where(summary["alive_steps"] > 0)
+        summary["kill_rate"] = summary["kills"] / summary["alive_steps"].where(summary["alive_steps"] > 0)
+        return summary
+
+    def census(self) -> DataFrame:
+        """Number of agents by time (rows) and (type, status) (columns)."""
+        if self._census is None:
+            return DataFrame()
+        census = self._census.astype(int).unstack(["type", "status"], fill_value=0).sort_index(axis=1)
+        census.columns = MultiIndex.from_arrays([
+            [TYPE_NAMES[code] for code in census.columns.get_level_values("type")],
+            [STATUS_NAMES[code] for code in census.columns.get_level_values("status")]],
+            names=["type", "status"])
+        return census
+
+    def survival(self, agent_type: str = "fish") -> DataFrame:
+        """Survival curve of one type: alive count, total and fraction alive at every step."""
+        census = self.census()
+        if agent_type not in census.columns.get_level_values("type"):
+            return DataFrame(columns=["alive", "total", "fraction"])
+        counts = census[agent_type]
+        total = counts.sum(axis=1)
+        alive = total - (counts["dead"] if "dead" in counts else 0)
+        return DataFrame({"alive": alive, "total": total, "fraction": alive / total})
+
+    def foraging_trips(self, agent_type: str or None = "penguin", include_open: bool = True) -> DataFrame:
+        """Continuous stretches spent in water by a live agent.
+
+        Args:
+            agent_type (str, optional): Only the trips of this type (default: "penguin"),
+                None for all types.
+            include_open (bool): Also list the trips still going on at the end of the data.
+
+        Returns:
+            DataFrame: type, id, start, end (first and last step in water), duration (steps)
+                and outcome ("returned" to land, "died" at sea or "ongoing").
+        """
+        trips = list(self._trips)
+        if include_open:
+            carry = self._carry
+            is_open = carry["trip_start"] >= 0
+            trips.append(DataFrame({
+                "key": carry["key"][is_open],
+                "start": carry["trip_start"][is_open],
+                "end": carry["time"][is_open],
+                "outcome": "ongoing"}))
+        trips = [proc_trips for proc_trips in trips if len(proc_trips)]
+        if not trips:
+            return DataFrame(columns=TRIP_COLUMNS)
+
+        trips = pandas_concat(trips, ignore_index=True)
+        type_codes, ids = split_agent_keys(trips["key"].to_numpy())
+        trips["type"] = np_asarray(TYPE_NAMES, dtype=object)[type_codes]
+        trips["id"] = ids
+        trips["duration"] = trips["end"] - trips["start"] + 1
+        if agent_type is not None:
+            trips = trips[trips["type"] == agent_type]
+        return trips.sort_values(["type", "id", "start"], ignore_index=True)[TRIP_COLUMNS]
+
+
+class TrajectoryIndex:
+    """A `run_model` output indexed once by (agent, time) and by time.
+
+    The rows are sorted once by agent then time. `agent(type, id)` and `frame(time)` are
+    then slices (no filtering of the whole output), and the metrics of
+    `TrajectoryAnalytics` are computed without sorting again.
+
+    Args:
+        output (DataFrame): Output of `run_model` (or `EventLog.to_trajectory`).
+    """
+
+    def __init__(self, output: DataFrame):
+        rows = _encode(output)
+        self.order = np_lexsort((rows["time"], rows["key"]))
+        self.output = output.iloc[self.order].reset_index(drop=True)
+        self.rows = {name: values[self.order] for name, values in rows.items()}
+
+        key = self.rows["key"]
+        self.agent_keys, self.agent_offsets = np_unique(key, return_index=True)
+        self.agent_offsets = np_concatenate((self.agent_offsets, [len(key)]))
+
+        self.time_order = np_argsort(self.rows["time"], kind="stable")
+        sorted_times = self.rows["time"][self.time_order]
+        self.times = np_unique(sorted_times)
+        # (an empty output has no times, and a single offset 0)
+        self.time_offsets = np_concatenate((np_searchsorted(sorted_times, self.times), [len(sorted_times)]))
+
+        self._analytics = None
+
+    def agent(self, agent_type: str, agent_id: int) -> DataFrame:
+        """Trajectory of one agent (rows ordered by time)."""
+        key = get_agent_keys([TYPE_NAMES.index(agent_type)], [agent_id])[0]
+        i = np_searchsorted(self.agent_keys, key)
+        if i == len(self.agent_keys) or self.agent_keys[i] != key:
+            raise KeyError((agent_type, agent_id))
+        return self.output.iloc[self.agent_offsets[i]:self.agent_offsets[i + 1]]
+
+    def frame(self, time: int) -> DataFrame:
+        """All the agents at one time step."""
+        i = np_searchsorted(self.times, time)
+        if i == len(self.times) or self.times[i] != time:
+            raise KeyError(time)
+        return self.output.iloc[self.time_order[self.time_offsets[i]:self.time_offsets[i + 1]]]
+
+    def positions(self, agent_type: str, agent_id: int) -> tuple:
+        """(time, x, y) arrays of one agent."""
+        trajectory = self.agent(agent_type, agent_id)
+        return trajectory["time"].to_numpy(), trajectory["x"].to_numpy(), trajectory["y"].to_numpy()
+
+    @property
+    def analytics(self) -> TrajectoryAnalytics:
+        if self._analytics is None:
+            self._analytics = TrajectoryAnalytics()
+            self._analytics.update_arrays(self.rows, presorted=True)
+        return self._analytics
+
+    def agent_metrics(self) -> DataFrame:
+        return self.analytics.agent_metrics()
+
+    def type_metrics(self) -> DataFrame:
+        return self.analytics.type_metrics()
+
+    def census(self) -> DataFrame:
+        return self.analytics.census()
+
+    def survival(self, agent_type: str = "fish") -> DataFrame:
+        return self.analytics.survival(agent_type)
+
+    def foraging_trips(self, agent_type: str or None = "penguin", include_open: bool = True) -> DataFrame:
+        return self.analytics.foraging_trips(agent_type, include_open)
+
+
+def iter_output_chunks(paths, chunksize: int = 1_000_000):
+    """Reads run outputs chunk by chunk, for `TrajectoryAnalytics.from_chunks`.
+
+    Args:
+        paths (str or list): One or more .csv / .parquet files (e.g. one per time range),
+            read in the given order.
+        chunksize (int): Rows per chunk (default: 1,000,000).
+
+    Yields:
+        DataFrame: Consecutive rows of the outputs.
+
+    Raises:
+        ImportError: If a .parquet file is given and pyarrow is not installed.
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    for path in paths:
+        if path.endswith(".parquet"):
+            try:
+                from pyarrow.parquet import ParquetFile
+            except ImportError:
+                raise ImportError(f"reading {path} in chunks needs pyarrow (see env.yml), or use a .csv output")
+            for batch in ParquetFile(path).iter_batches(batch_size=chunksize):
+                yield batch.to_pandas()
+        else:
+            from pandas import read_csv
+            yield from read_csv(path, chunksize=chunksize)
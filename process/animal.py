@@ -0,0 +1,91 @@
+from enum import IntEnum
+from mesa import Agent
+from numpy import array as np_array
+
+
+class AgentType(IntEnum):
+    FISH = 0
+    PENGUIN = 1
+    SEAL = 2
+
+
+class Status(IntEnum):
+    ALIVE = 0
+    DEAD = 1
+    HUNT = 2
+    FULL = 3
+
+
+class SpeedMode(IntEnum):
+    WALK = 0
+    RUN = 1
+
+
+# module level aliases: looking a member up on the enum class is much slower than a global
+FISH, PENGUIN, SEAL = AgentType
+ALIVE, DEAD, HUNT, FULL = Status
+WALK, RUN = SpeedMode
+
+# names used in the outputs (and in PARAMS), indexed by code
+TYPE_NAMES = tuple(member.name.lower() for member in AgentType)
+STATUS_NAMES = tuple(member.name.lower() for member in Status)
+SPEED_MODE_NAMES = tuple(member.name.lower() for member in SpeedMode)
+
+
+def decode_output(output: dict) -> dict:
+    """Replaces the type and status codes of a recorded output (see `run_model`) by their names."""
+    if output["type"]:
+        output["type"] = np_array(TYPE_NAMES, dtype=object)[np_array(output["type"])]
+        output["status"] = np_array(STATUS_NAMES, dtype=object)[np_array(output["status"])]
+    return output
+
+
+class Animal(Agent):
+    """Base class of `Fish`, `Penguin` and `Seal`.
+
+    Status changes (`agent.status = ...`) and moves (`agent.move(...)`) are reported to the
+    model's prey registry, so predators can query their eligible prey directly. Deaths are
+    also reported to the model (`model.on_death`), which recycles dead agents as newborns
+    when reproduction is enabled (see process/pool.py).
+
+    The subclasses keep `type` (class attribute), `status` and `speed_mode` as small
+    integer enums, see `TYPE_NAMES` etc. for the names. They are not slotted: Mesa's
+    `Agent` keeps a `__dict__` anyway, which left slots saving ~8 bytes per agent.
+    """
+
+    type = None
+
+    @property
+    def status(self) -> Status:
+        return self._status
+
+    @status.setter
+    def status(self, value: Status):
+        changed = getattr(self, "_status", None) != value
+        self._status = value
+        if changed and self.pos is not None:
+            self.model.registry.refresh(self)
+            if value == DEAD:
+                self.model.on_death(self)
+
+    def move(self, new_position: tuple):
+        self.model.grid.move_agent(self, new_position)
+        self.model.registry.refresh(self, moved=True)
+
+    def get_state(self) -> dict:
+        """Returns a picklable copy of the agent's attributes (without the model or other agents)."""
+        state = {key: value for key, value in vars(self).items() if key != "model"}
+        state["type"] = self.type
+        if "target" in state:
+            state["target"] = None
+        return state
+
+    def set_state(self, state: dict):
+        """Restores the attributes from `get_state`, except the grid position.
+
+        References to other agents (e.g. a penguin's locked fish) are not carried over.
+        """
+        for key, value in state.items():
+            if key not in ("pos", "_status", "type"):
+                setattr(self, key, value)
+        self.status = state["_status"]
@@ -0,0 +1,718 @@
+from numpy import arange as np_arange
+from numpy import argsort as np_argsort
+from numpy import array as np_array
+from numpy import bincount as np_bincount
+from numpy import clip as np_clip
+from numpy import concatenate as np_concatenate
+from numpy import cumsum as np_cumsum
+from numpy import full as np_full
+from numpy import inf as np_inf
+from numpy import int64 as np_int64
+from numpy import lexsort as np_lexsort
+from numpy import maximum as np_maximum
+from numpy import minimum as np_minimum
+from numpy import nonzero as np_nonzero
+from numpy import ones as np_ones
+from numpy import repeat as np_repeat
+from numpy import sqrt as np_sqrt
+from numpy import stack as np_stack
+from numpy import take_along_axis as np_take_along_axis
+from numpy import trunc as np_trunc
+from numpy import where as np_where
+from numpy import zeros as np_zeros
+from numpy.random import SeedSequence, default_rng
+from process import CLIMATE_VARS, INITIAL_LOCATIONS, MAP_SIZE, PARAMS, POPULATION
+from process.animal import TYPE_NAMES, STATUS_NAMES, FISH, PENGUIN, SEAL, ALIVE, DEAD, HUNT, FULL, WALK, RUN
+from process.utils import get_terrain_type
+
+NEAREST_WEIGHTS = np_array([0.3, 0.3, 0.2, 0.1, 0.1])
+
+# bin edge (in cells) of the nearest prey searches (see `EnsembleModel._in_sight`)
+NEAREST_BIN_SIZE = 8
+
+_OFFSETS = {}
+
+
+def get_moore_offsets(radius: int, include_center: bool):
+    """(K, 2) offsets of a Moore neighborhood, in the order of `MultiGrid.get_neighborhood`."""
+    key = (radius, include_center)
+    if key not in _OFFSETS:
+        _OFFSETS[key] = np_array([
+            (dx, dy) for dx in range(-radius, radius + 1) for dy in range(-radius, radius + 1)
+            if include_center or dx != 0 or dy != 0], dtype=np_int64).reshape(-1, 2)
+    return _OFFSETS[key]
+
+
+def get_ring_offsets(ring: int):
+    """(B, 2) offsets of the bins at Chebyshev distance `ring` of a bin."""
+    key = ("ring", ring)
+    if key not in _OFFSETS:
+        _OFFSETS[key] = np_array([
+            (dx, dy) for dx in range(-ring, ring + 1) for dy in range(-ring, ring + 1)
+            if max(abs(dx), abs(dy)) == ring], dtype=np_int64).reshape(-1, 2)
+    return _OFFSETS[key]
+
+
+def pick_weighted(valid, score, weights, u):
+    """Vectorized `random.choices` over the best ranked valid candidates of each row.
+
+    Row i ranks its valid candidates by increasing `score` (ties keep the candidate
+    order), keeps the first `len(weights)` of them and draws one with the given weights
+    (truncated and renormalised when there are fewer candidates), using `u[i]`.
+
+    Args:
+        valid (numpy.ndarray): (M, K) bool, candidates that can be picked.
+        score (numpy.ndarray): (M, K) ranking score (lower is better).
+        weights (numpy.ndarray): (L,) or (M, L) weights of the ranks.
+        u (numpy.ndarray): (M,) uniform draws.
+
+    Returns:
+        tuple: ((M,) index of the picked candidate, (M,) bool rows with a valid candidate).
+    """
+    n_rows, n_cand = valid.shape
+    if n_cand == 0:
+        return np_zeros(n_rows, dtype=np_int64), np_zeros(n_rows, dtype=bool)
+    order = np_argsort(np_where(valid, score, np_inf), axis=1, kind="stable")
+    n_valid = valid.sum(axis=1)
+    if weights.ndim == 1:
+        weights = weights[None, :].repeat(n_rows, axis=0)
+    n_ranks = min(weights.shape[1], n_cand)
+    weights = weights[:, :n_ranks] * (np_arange(n_ranks)[None, :] < np_minimum(n_valid, n_ranks)[:, None])
+    cum = np_cumsum(weights, axis=1)
+    rank = (cum <= (u * cum[:, -1])[:, None]).sum(axis=1)
+    rank = np_minimum(rank, np_maximum(np_minimum(n_valid, n_ranks) - 1, 0))
+    return order[np_arange(n_rows), rank], n_valid > 0
+
+
+class EnsembleModel:
+    """R independent realisations of `SealPenguinFishModel` stepped together.
+
+    Agent and terrain state are arrays with a leading replicate axis (e.g. fish x is
+    (R, N_fish), the land mask is (R, width, height)), and each phase of a step (melt,
+    fish, penguins, seals) is one vectorized pass over all the agents of all the
+    replicates. The rules are those of the agent classes (vision, speeds, energy, hunt
+    success, sticky penguin targets, ...), with these differences:
+
+    - within a step the types move in turn (fish, then penguins, then seals), and all the
+      agents of a type move at once from the state at the start of their phase (Mesa's
+      random activation interleaves the agents one by one),
+    - prey and candidate cells are ranked by index rather than grid order when tied,
+    - a seal keeps its target while it is in sight (instead of re-weighting it).
+
+    Runs are therefore statistically (not exactly) equivalent to `SealPenguinFishModel`.
+
+    Each replicate has its own random generator (spawned from `seed`) and draws the
+    same number of values in the same order whatever the other replicates do, so
+    replicate r gives the same run whether it is stepped alone or in an ensemble.
+
+    Args:
+        n_replicates (int): Number of realisations R.
+        N_penguins (int): Penguins per replicate.
+        N_seals (int): Seals per replicate.
+        N_fish (int): Fish per replicate.
+        width (int): Grid width.
+        height (int): Grid height.
+        init_loc (dict): Initial locations by type (default: `INITIAL_LOCATIONS`).
+        seed (int, optional): Seed of the replicates' generators.
+        melt_timeline (MeltTimeline, optional): Melt shared by all the replicates
+            (see `process/melt.py`), instead of a melt drawn per replicate.
+    """
+
+    def __init__(
+            self,
+            n_replicates: int,
+            N_penguins: int = POPULATION["penguin"],
+            N_seals: int = POPULATION["seal"],
+            N_fish: int = POPULATION["fish"],
+            width: int = MAP_SIZE,
+            height: int = MAP_SIZE,
+            init_loc: dict = INITIAL_LOCATIONS,
+            seed: int or None = None,
+            melt_timeline=None):
+        self.n_replicates = n_replicates
+        self.width = width
+        self.height = height
+        self.init_loc = init_loc
+        self.melt_timeline = melt_timeline
+        self.current_step = 0
+        self.rngs = [default_rng(child) for child in SeedSequence(seed).spawn(n_replicates)]
+
+        terrain, _ = get_terrain_type(width, height)
+        self.land = (terrain == "land")[None, :, :].repeat(n_replicates, axis=0)
+        if melt_timeline is not None:
+            melt_timeline.check(self.land[0], stability_index=CLIMATE_VARS["ice_stability_index"])
+
+        self.agents = {}
+        self.agents[FISH] = self._create(FISH, N_fish, "water")
+        self.agents[PENGUIN] = self._create(PENGUIN, N_penguins, "land")
+        self.agents[SEAL] = self._create(SEAL, N_seals, "water")
+
+        self.history = []
+
+    # -----------------------------------------------------------------------
+    # set up
+    # -----------------------------------------------------------------------
+    def _uniform(self, *shape):
+        """(R, *shape) uniform draws, one block from each replicate's generator."""
+        return np_stack([rng.random(shape) for rng in self.rngs])
+
+    def _normal(self, *shape):
+        return np_stack([rng.standard_normal(shape) for rng in self.rngs])
+
+    def _place(self, mu: tuple, sigma: float, n: int, terrain_type: str, checks: int):
+        """Rejection placement around `mu`, like the agent constructors (first valid draw wins)."""
+        x = np_clip(np_trunc(mu[0] + sigma * self._normal(n, checks)), 0, self.width - 1).astype(np_int64)
+        y = np_clip(np_trunc(mu[1] + sigma * self._normal(n, checks)), 0, self.height - 1).astype(np_int64)
+        reps = np_arange(self.n_replicates)[:, None, None]
+        ok = self.land[reps, x, y] == (terrain_type == "land")
+        found = ok.any(axis=2)
+        first = ok.argmax(axis=2)[:, :, None]
+        return (
+            np_take_along_axis(x, first, axis=2)[:, :, 0],
+            np_take_along_axis(y, first, axis=2)[:, :, 0],
+            found)
+
+    def _create(self, agent_type: int, n: int, terrain_type: str) -> dict:
+        sigma = max(3, self.width / 10.0)
+        home_x, home_y, exists = self._place(INITIAL_LOCATIONS[TYPE_NAMES[agent_type]], sigma, n, terrain_type, 51)
+        if agent_type == SEAL:
+            # seals start near init_loc, their home (used when full) is drawn like in `Seal`
+            # (the start position when none is found)
+            x, y, exists = self._place(self.init_loc["seal"], 3, n, terrain_type, 1000)
+            home_x = np_where(exists, home_x, x)
+            home_y = np_where(exists, home_y, y)
+        else:
+            x, y = home_x, home_y
+
+        state = {
+            "x": x,
+            "y": y,
+            "home_x": home_x.copy(),
+            "home_y": home_y.copy(),
+            "exists": exists,
+            "status": np_full((self.n_replicates, n), ALIVE if agent_type == FISH else HUNT, dtype=np_int64),
+        }
+        if agent_type != FISH:
+            max_energy = PARAMS[TYPE_NAMES[agent_type]]["energy"]["max"]
+            state["energy"] = np_trunc(max_energy + max_energy / 4 * self._normal(n)).astype(float)
+            state["speed_mode"] = np_full((self.n_replicates, n), WALK, dtype=np_int64)
+            state["target"] = np_full((self.n_replicates, n), -1, dtype=np_int64)
+            state["steps_since_scan"] = np_zeros((self.n_replicates, n), dtype=np_int64)
+        return state
+
+    # -----------------------------------------------------------------------
+    # helpers on flattened rows (replicate, agent)
+    # -----------------------------------------------------------------------
+    def _candidates(self, reps, x, y, radius: int, include_center: bool, terrain_type: str or None, radii=None):
+        """Candidate cells around each row: (M, K) x, y and validity (in bounds, terrain, radius)."""
+        offsets = get_moore_offsets(radius, include_center)
+        cx = x[:, None] + offsets[None, :, 0]
+        cy = y[:, None] + offsets[None, :, 1]
+        valid = (cx >= 0) & (cx < self.width) & (cy >= 0) & (cy < self.height)
+        cx = np_clip(cx, 0, self.width - 1)
+        cy = np_clip(cy, 0, self.height - 1)
+        if terrain_type is not None:
+            valid &= self.land[reps[:, None], cx, cy] == (terrain_type == "land")
+        if radii is not None:
+            ring = np_maximum(abs(offsets[:, 0]), abs(offsets[:, 1]))
+            valid &= ring[None, :] <= radii[:, None]
+        return cx, cy, valid
+
+    @staticmethod
+    def _take(cx, cy, choice, found, x, y):
+        """Picked candidate cells, or the current cell of the rows without any."""
+        if cx.shape[1] == 0:
+            return x.copy(), y.copy()
+        rows = np_arange(len(x))
+        return np_where(found, cx[rows, choice], x), np_where(found, cy[rows, choice], y)
+
+    def _chase(self, reps, x, y, target_x, target_y, radius, terrain_type, u, radii=None):
+        """`chase_or_home` on rows: weighted pick among the 5 candidates closest to the target."""
+        cx, cy, valid = self._candidates(reps, x, y, radius, False, terrain_type, radii)
+        dist = np_sqrt((target_x[:, None] - cx) ** 2 + (target_y[:, None] - cy) ** 2)
+        choice, found = pick_weighted(valid, dist, NEAREST_WEIGHTS, u)
+        return self._take(cx, cy, choice, found, x, y)
+
+    def _random_move(self, reps, x, y, radius, terrain_type, u):
+        """`get_random_move_position` on rows: uniform pick among the candidates (stay if none)."""
+        cx, cy, valid = self._candidates(reps, x, y, radius, True, terrain_type)
+        choice, found = pick_weighted(valid, np_zeros(valid.shape), np_ones(valid.shape[1]), u)
+        return self._take(cx, cy, choice, found, x, y)
+
+    def _escape(self, reps, x, y, radius, terrain_type, enemies_x, enemies_y, enemies_mask, u):
+        """`escape_strategy` on rows: weighted pick among the cells farthest from the enemies."""
+        cx, cy, valid = self._candidates(reps, x, y, radius, False, terrain_type)
+        # summed enemy by enemy, so the padding of the enemy lists does not change the totals
+        total = np_zeros(cx.shape)
+        for j in range(enemies_x.shape[1]):
+            dist = np_sqrt((enemies_x[:, j, None] - cx) ** 2 + (enemies_y[:, j, None] - cy) ** 2)
+            total += np_where(enemies_mask[:, j, None], dist, 0.0)
+        n_enemies = enemies_mask.sum(axis=1)
+        ranks = np_arange(cx.shape[1])[None, :]
+        weights = 0.3 - 0.2 * ranks / np_maximum(n_enemies - 1, 1)[:, None]
+        weights = np_where(ranks < n_enemies[:, None], weights, 0.0)
+        choice, found = pick_weighted(valid, -total, weights, u)
+        return self._take(cx, cy, choice, found, x, y)
+
+    def _in_sight(self, hunters: dict, rows: tuple, prey: dict, prey_ok, radius: int, k: int or None = None):
+        """Prey within the Chebyshev `radius` of each hunter row (not on its cell).
+
+        The prey are binned in squares of cells, and each row looks at the rings of bins
+        around its own, nearest first. With `k`, a row stops as soon as it has `k` prey
+        closer than any bin it has not looked at, so the work grows with the number of
+        prey near the hunters rather than with hunters x prey.
+
+        Args:
+            k (int, optional): Only keep the `k` nearest prey of each row (ties by index).
+
+        Returns:
+            tuple: ((M, C) prey indices, (M, C) bool valid). Each row holds all its prey
+                in sight in index order, or with `k` its nearest prey by distance, then
+                padding (C is the most prey kept for a row, at least 1).
+        """
+        reps, idx = rows
+        n_rows = len(reps)
+        size = radius + 1 if k is None else min(radius + 1, NEAREST_BIN_SIZE)
+        n_bx = -(-self.width // size)
+        n_by = -(-self.height // size)
+        n_bins = n_bx * n_by
+        n_prey = prey_ok.shape[1]
+
+        prey_reps, prey_idx = np_nonzero(prey_ok)
+        px = prey["x"][prey_reps, prey_idx]
+        py = prey["y"][prey_reps, prey_idx]
+        prey_bin = prey_reps * n_bins + (px // size) * n_by + py // size
+        order = np_argsort(prey_bin, kind="stable")
+        counts = np_bincount(prey_bin, minlength=self.n_replicates * n_bins)
+        starts = np_cumsum(counts) - counts
+
+        hx = hunters["x"][reps, idx]
+        hy = hunters["y"][reps, idx]
+        found_row = np_zeros(0, dtype=np_int64)
+        found_prey = np_zeros(0, dtype=np_int64)
+        found_dist = np_zeros(0, dtype=np_int64)
+        active = np_arange(n_rows)
+        for ring in range(-(-radius // size) + 1):
+            # (row, bin of the ring) pairs, then every prey of those bins
+            offsets = get_ring_offsets(ring)
+            bx = hx[active, None] // size + offsets[None, :, 0]
+            by = hy[active, None] // size + offsets[None, :, 1]
+            inside = (bx >= 0) & (bx < n_bx) & (by >= 0) & (by < n_by)
+            bins = reps[active, None] * n_bins + np_clip(bx, 0, n_bx - 1) * n_by + np_clip(by, 0, n_by - 1)
+            n_pairs = np_where(inside, counts[bins], 0).ravel()
+            pair_row = np_repeat(np_repeat(active, len(offsets)), n_pairs)
+            pair = order[
+                np_repeat(starts[bins].ravel(), n_pairs)
+                + np_arange(n_pairs.sum()) - np_repeat(np_cumsum(n_pairs) - n_pairs, n_pairs)]
+
+            dx = abs(px[pair] - hx[pair_row])
+            dy = abs(py[pair] - hy[pair_row])
+            seen = (dx <= radius) & (dy <= radius) & ((dx > 0) | (dy > 0))
+            found_row = np_concatenate([found_row, pair_row[seen]])
+            found_prey = np_concatenate([found_prey, prey_idx[pair[seen]]])
+            found_dist = np_concatenate([found_dist, (dx * dx + dy * dy)[seen]])
+            if k is None:
+                continue
+
+            # the k nearest of each row so far, and the rows no further bin can improve
+            # (the prey of the next ring are at least ring * size + 1 cells away)
+            nearest = np_lexsort((found_prey, found_dist, found_row))
+            n_found = np_bincount(found_row, minlength=n_rows)
+            rank = np_arange(len(nearest)) - np_repeat(np_cumsum(n_found) - n_found, n_found)
+            nearest = nearest[rank < k]
+            found_row, found_prey, found_dist = found_row[nearest], found_prey[nearest], found_dist[nearest]
+            n_found = np_minimum(n_found, k)
+            kth_dist = np_full(n_rows, np_inf)
+            full = n_found == k
+            kth_dist[full] = found_dist[(np_cumsum(n_found) - 1)[full]]
+            active = active[kth_dist[active] >= (ring * size + 1) ** 2]
+            if not len(active):
+                break
+
+        if k is None:
+            by_row = np_argsort(found_row * n_prey + found_prey, kind="stable")
+            found_row = found_row[by_row]
+            found_prey = found_prey[by_row]
+
+        n_kept = np_bincount(found_row, minlength=n_rows)
+        column = np_arange(len(found_row)) - np_repeat(np_cumsum(n_kept) - n_kept, n_kept)
+        n_columns = max(1, int(n_kept.max()) if n_rows else 0)
+        candidates = np_zeros((n_rows, n_columns), dtype=np_int64)
+        valid = np_zeros((n_rows, n_columns), dtype=bool)
+        candidates[found_row, column] = found_prey
+        valid[found_row, column] = True
+        return candidates, valid
+
+    def _kill(self, hunters: dict, rows: tuple, prey: dict, success_rate: float, u_hit, u_victim):
+        """Each hunter row tries to eat a prey (of any status) sharing its cell.
+
+        Every prey in the cell is tried with `success_rate`, i.e. a hunt succeeds with
+        probability 1 - (1 - success_rate)**n, and the eaten prey is drawn among them.
+
+        Returns:
+            numpy.ndarray: (M,) bool, successful hunts.
+        """
+        reps, idx = rows
+        cells = self.width * self.height
+        prey_reps, prey_idx = np_nonzero(prey["exists"])
+        prey_cell = prey_reps * cells + prey["x"][prey_reps, prey_idx] * self.height + prey["y"][prey_reps, prey_idx]
+        order = np_argsort(prey_cell, kind="stable")
+        prey_cell = prey_cell[order]
+        counts = np_bincount(prey_cell, minlength=self.n_replicates * cells)
+        starts = np_cumsum(counts) - counts
+
+        hunter_cell = reps * cells + hunters["x"][reps, idx] * self.height + hunters["y"][reps, idx]
+        n_prey = counts[hunter_cell]
+        success = (n_prey > 0) & (u_hit < 1.0 - (1.0 - success_rate) ** n_prey)
+        if success.any():
+            pick = starts[hunter_cell[success]] + (u_victim[success] * n_prey[success]).astype(np_int64)
+            victims = order[pick]
+            prey["status"][prey_reps[victims], prey_idx[victims]] = DEAD
+        return success
+
+    def _burn(self, agents: dict, rows: tuple, old_x, old_y, burn_rate: dict):
+        """Energy drain after a move (water by speed mode, land flat) and death by exhaustion."""
+        reps, idx = rows
+        x = agents["x"][reps, idx]
+        y = agents["y"][reps, idx]
+        moved = (x != old_x) | (y != old_y)
+        on_land = self.land[reps, x, y]
+        water_rate = np_where(
+            agents["speed_mode"][reps, idx] == RUN, burn_rate["water"]["run"], burn_rate["water"]["walk"])
+        land_rate = burn_rate.get("land", None)
+        rate = water_rate if land_rate is None else np_where(on_land, land_rate, water_rate)
+        agents["energy"][reps, idx] -= np_where(moved, rate, 0.0)
+        exhausted = moved & (agents["energy"][reps, idx] <= 0)
+        agents["status"][reps[exhausted], idx[exhausted]] = DEAD
+
+    # -----------------------------------------------------------------------
+    # phases
+    # -----------------------------------------------------------------------
+    def update_ice_dynamics(self):
+        """Melts edge land cells, per replicate, or from the shared melt timeline."""
+        if self.melt_timeline is not None:
+            cells = self.melt_timeline.cells_at(self.current_step - 1)
+            if cells:
+                cells = np_array(cells)
+                self.land[:, cells[:, 0], cells[:, 1]] = False
+            return
+
+        land = self.land
+        surrounded = np_ones(land.shape, dtype=bool)
+        surrounded[:, 1:, :] &= land[:, :-1, :]
+        surrounded[:, :-1, :] &= land[:, 1:, :]
+        surrounded[:, :, 1:] &= land[:, :, :-1]
+        surrounded[:, :, :-1] &= land[:, :, 1:]
+        edges = land & ~surrounded
+        melt = edges & (self._uniform(self.width, self.height) < CLIMATE_VARS["ice_stability_index"])
+        land &= ~melt
+
+    def _step_fish(self):
+        fish = self.agents[FISH]
+        penguins = self.agents[PENGUIN]
+        params = PARAMS["fish"]
+        u = self._uniform(fish["x"].shape[1], 3)
+
+        rows = np_nonzero(fish["exists"] & (fish["status"] != DEAD))
+        if len(rows[0]) == 0:
+            return
+        reps, idx = rows
+        x = fish["x"][reps, idx]
+        y = fish["y"][reps, idx]
+        u = u[reps, idx]
+
+        live_penguins = penguins["exists"] & (penguins["status"] != DEAD)
+        threats, threat_ok = self._in_sight(fish, rows, penguins, live_penguins, int(params["vision"]["escape"]))
+        escaping = threat_ok.any(axis=1)
+
+        # escape from the penguins in sight
+        new_x, new_y = x.copy(), y.copy()
+        if escaping.any():
+            esc_reps = reps[escaping][:, None]
+            new_x[escaping], new_y[escaping] = self._escape(
+                reps[escaping], x[escaping], y[escaping], int(params["speed"]["run"]), "water",
+                penguins["x"][esc_reps, threats[escaping]].astype(float),
+                penguins["y"][esc_reps, threats[escaping]].astype(float),
+                threat_ok[escaping], u[escaping, 0])
+
+        # otherwise swim home, then wander
+        calm = ~escaping
+        if calm.any():
+            calm_reps = reps[calm]
+            walk = int(params["speed"]["walk"])
+            home_x, home_y = self._chase(
+                calm_reps, x[calm], y[calm], fish["home_x"][calm_reps, idx[calm]],
+                fish["home_y"][calm_reps, idx[calm]], walk, "water", u[calm, 1])
+            new_x[calm], new_y[calm] = self._random_move(calm_reps, home_x, home_y, walk, "water", u[calm, 2])
+
+        fish["x"][reps, idx] = new_x
+        fish["y"][reps, idx] = new_y
+
+    def _step_penguins(self):
+        penguins = self.agents[PENGUIN]
+        seals = self.agents[SEAL]
+        fish = self.agents[FISH]
+        params = PARAMS["penguin"]
+        u = self._uniform(penguins["x"].shape[1], 5)
+
+        rows = np_nonzero(penguins["exists"] & (penguins["status"] != DEAD))
+        if len(rows[0]) == 0:
+            return
+        reps, idx = rows
+        x = penguins["x"][reps, idx]
+        y = penguins["y"][reps, idx]
+        u = u[reps, idx]
+        penguins["speed_mode"][reps, idx] = WALK
+
+        live_seals = seals["exists"] & (seals["status"] != DEAD)
+        threats, threat_ok = self._in_sight(penguins, rows, seals, live_seals, int(params["vision"]["escape"]))
+        escaping = threat_ok.any(axis=1)
+        new_x, new_y = x.copy(), y.copy()
+
+        # escape: any land cell in reach, otherwise away from the seals
+        if escaping.any():
+            esc = np_nonzero(escaping)[0]
+            run = int(params["speed"]["run"])
+            cx, cy, land_ok = self._candidates(reps[esc], x[esc], y[esc], run, False, "land")
+            choice, to_land = pick_weighted(land_ok, np_zeros(land_ok.shape), np_ones(land_ok.shape[1]), u[esc, 0])
+            new_x[esc[to_land]] = cx[to_land, choice[to_land]]
+            new_y[esc[to_land]] = cy[to_land, choice[to_land]]
+            at_sea = esc[~to_land]
+            if len(at_sea):
+                sea_reps = reps[at_sea][:, None]
+                new_x[at_sea], new_y[at_sea] = self._escape(
+                    reps[at_sea], x[at_sea], y[at_sea], run, None,
+                    seals["x"][sea_reps, threats[at_sea]].astype(float),
+                    seals["y"][sea_reps, threats[at_sea]].astype(float),
+                    threat_ok[at_sea], u[at_sea, 1])
+
+        status = penguins["status"][reps, idx]
+
+        # full: go home, hungry again once back on land with half the energy
+        full = ~escaping & (status == FULL)
+        if full.any():
+            no_land = ~self.land.reshape(self.n_replicates, -1).any(axis=1)
+            starving = full & no_land[reps]
+            penguins["status"][reps[starving], idx[starving]] = DEAD
+            full &= ~starving
+            fr = np_nonzero(full)[0]
+            new_x[fr], new_y[fr] = self._chase(
+                reps[fr], x[fr], y[fr], penguins["home_x"][reps[fr], idx[fr]],
+                penguins["home_y"][reps[fr], idx[fr]], int(params["speed"]["walk"]), None, u[fr, 2])
+
+        # hunting: track the locked fish or scan the hunt vision
+        hunting = np_nonzero(~escaping & (status == HUNT))[0]
+        chasing = np_zeros(len(reps), dtype=bool)
+        if len(hunting):
+            h_reps = reps[hunting]
+            h_idx = idx[hunting]
+            vision = int(params["vision"]["hunt"])
+            alive_fish = fish["exists"] & (fish["status"] == ALIVE)
+
+            target = penguins["target"][h_reps, h_idx]
+            has_target = target >= 0
+            safe_target = np_maximum(target, 0)
+            target_x = fish["x"][h_reps, safe_target]
+            target_y = fish["y"][h_reps, safe_target]
+            interval = params["target_rescan_interval"]
+            keep = (
+                has_target
+                & alive_fish[h_reps, safe_target]
+                & (np_maximum(abs(target_x - x[hunting]), abs(target_y - y[hunting])) <= vision))
+            if interval is None:
+                keep[:] = False
+            else:
+                keep &= penguins["steps_since_scan"][h_reps, h_idx] < interval
+            penguins["steps_since_scan"][h_reps[keep], h_idx[keep]] += 1
+
+            scan = ~keep
+            if scan.any():
+                s_rows = (h_reps[scan], h_idx[scan])
+                seen, in_sight = self._in_sight(
+                    penguins, s_rows, fish, alive_fish, vision, k=len(NEAREST_WEIGHTS))
+                dist = np_sqrt(
+                    (fish["x"][s_rows[0][:, None], seen] - x[hunting][scan][:, None]) ** 2
+                    + (fish["y"][s_rows[0][:, None], seen] - y[hunting][scan][:, None]) ** 2)
+                choice, found = pick_weighted(in_sight, dist, NEAREST_WEIGHTS, u[hunting[scan], 3])
+                new_target = np_where(found, seen[np_arange(len(choice)), choice], -1)
+                penguins["target"][s_rows] = new_target
+                penguins["steps_since_scan"][s_rows] = 0
+                target[scan] = new_target
+                target_x[scan] = fish["x"][s_rows[0], np_maximum(new_target, 0)]
+                target_y[scan] = fish["y"][s_rows[0], np_maximum(new_target, 0)]
+
+            locked = target >= 0
+            c = hunting[locked]
+            if len(c):
+                energetic = penguins["energy"][reps[c], idx[c]] > params["energy"]["max"] * 0.3
+                penguins["speed_mode"][reps[c], idx[c]] = np_where(energetic, RUN, WALK)
+                radii = np_where(energetic, int(params["speed"]["run"]), int(params["speed"]["walk"]))
+                new_x[c], new_y[c] = self._chase(
+                    reps[c], x[c], y[c], target_x[locked], target_y[locked],
+                    int(max(params["speed"]["run"], params["speed"]["walk"])), None, u[c, 2], radii=radii)
+                chasing[c] = True
+
+            wander = hunting[~locked]
+            if len(wander):
+                new_x[wander], new_y[wander] = self._random_move(
+                    reps[wander], x[wander], y[wander], int(params["speed"]["walk"]), None, u[wander, 2])
+
+        penguins["x"][reps, idx] = new_x
+        penguins["y"][reps, idx] = new_y
+
+        # hunts at the end of a chase
+        c = np_nonzero(chasing)[0]
+        if len(c):
+            c_rows = (reps[c], idx[c])
+            success = self._kill(penguins, c_rows, fish, params["hunt_success_rate"], u[c, 4], u[c, 0])
+            fed = (c_rows[0][success], c_rows[1][success])
+            penguins["status"][fed] = FULL
+            penguins["energy"][fed] = params["energy"]["max"]
+            penguins["target"][fed] = -1
+
+        # full penguins back on land with half their energy go hunting again
+        back = full & (penguins["energy"][reps, idx] <= params["energy"]["max"] * 0.5)
+        back &= self.land[reps, new_x, new_y]
+        penguins["status"][reps[back], idx[back]] = HUNT
+
+        self._burn(penguins, rows, x, y, params["energy"]["burn_rate"])
+
+    def _step_seals(self):
+        seals = self.agents[SEAL]
+        penguins = self.agents[PENGUIN]
+        params = PARAMS["seal"]
+        u = self._uniform(seals["x"].shape[1], 4)
+
+        rows = np_nonzero(seals["exists"] & (seals["status"] != DEAD))
+        if len(rows[0]) == 0:
+            return
+        reps, idx = rows
+        x = seals["x"][reps, idx]
+        y = seals["y"][reps, idx]
+        u = u[reps, idx]
+        seals["speed_mode"][reps, idx] = WALK
+        new_x, new_y = x.copy(), y.copy()
+
+        # full: go home, hungry again with half the energy
+        full = seals["status"][reps, idx] == FULL
+        if full.any():
+            fr = np_nonzero(full)[0]
+            new_x[fr], new_y[fr] = self._chase(
+                reps[fr], x[fr], y[fr], seals["home_x"][reps[fr], idx[fr]], seals["home_y"][reps[fr], idx[fr]],
+                int(params["speed"]["walk"]), None, u[fr, 0])
+            hungry = full & (seals["energy"][reps, idx] <= params["energy"]["max"] * 0.5)
+            seals["status"][reps[hungry], idx[hungry]] = HUNT
+
+        # hunting: only penguins in the sea can be hunted
+        chasing = np_zeros(len(reps), dtype=bool)
+        hunting = np_nonzero(~full)[0]
+        if len(hunting):
+            h_rows = (reps[hunting], idx[hunting])
+            water_penguins = (
+                penguins["exists"] & (penguins["status"] != DEAD)
+                & ~self.land[np_arange(self.n_replicates)[:, None], penguins["x"], penguins["y"]])
+            vision = int(params["vision"]["hunt"])
+            prey, in_sight = self._in_sight(seals, h_rows, penguins, water_penguins, vision, k=len(NEAREST_WEIGHTS))
+            seen = in_sight.any(axis=1)
+
+            target = seals["target"][h_rows]
+            safe_target = np_maximum(target, 0)
+            dx = abs(penguins["x"][h_rows[0], safe_target] - x[hunting])
+            dy = abs(penguins["y"][h_rows[0], safe_target] - y[hunting])
+            keep = (
+                (target >= 0) & water_penguins[h_rows[0], safe_target]
+                & (dx <= vision) & (dy <= vision) & ((dx > 0) | (dy > 0)))
+            dist = np_sqrt(
+                (penguins["x"][h_rows[0][:, None], prey] - x[hunting][:, None]) ** 2
+                + (penguins["y"][h_rows[0][:, None], prey] - y[hunting][:, None]) ** 2)
+            choice, _ = pick_weighted(in_sight, dist, NEAREST_WEIGHTS, u[hunting, 1])
+            target = np_where(keep, target, np_where(seen, prey[np_arange(len(hunting)), choice], -1))
+            seals["target"][h_rows] = target
+
+            c = hunting[seen]
+            if len(c):
+                seals["speed_mode"][reps[c], idx[c]] = RUN
+                t = target[seen]
+                new_x[c], new_y[c] = self._chase(
+                    reps[c], x[c], y[c], penguins["x"][reps[c], t], penguins["y"][reps[c], t],
+                    int(params["speed"]["run"]), "water", u[c, 0])
+                chasing[c] = True
+
+            wander = hunting[~seen]
+            if len(wander):
+                new_x[wander], new_y[wander] = self._random_move(
+                    reps[wander], x[wander], y[wander], int(params["speed"]["walk"]), "water", u[wander, 0])
+
+        seals["x"][reps, idx] = new_x
+        seals["y"][reps, idx] = new_y
+
+        c = np_nonzero(chasing)[0]
+        if len(c):
+            c_rows = (reps[c], idx[c])
+            success = self._kill(seals, c_rows, penguins, params["hunt_success_rate"], u[c, 2], u[c, 3])
+            seals["status"][c_rows[0][success], c_rows[1][success]] = FULL
+
+        self._burn(seals, rows, x, y, params["energy"]["burn_rate"])
+
+    def step(self):
+        self.current_step += 1
+        self.update_ice_dynamics()
+        self._step_fish()
+        self._step_penguins()
+        self._step_seals()
+
+    # -----------------------------------------------------------------------
+    # outputs
+    # -----------------------------------------------------------------------
+    def record(self, time: int):
+        """Keeps the positions and statuses of all the agents at `time` (see `to_outputs`)."""
+        frame = {}
+        for agent_type, agents in self.agents.items():
+            reps = np_arange(self.n_replicates)[:, None]
+            frame[agent_type] = (
+                agents["x"].copy(), agents["y"].copy(), agents["status"].copy(),
+                self.land[reps, agents["x"], agents["y"]])
+        self.history.append((time, frame))
+
+    def census(self):
+        """(R, 3, 4) counts of the existing agents by replicate, type and status."""
+        counts = np_zeros((self.n_replicates, len(TYPE_NAMES), len(STATUS_NAMES)), dtype=np_int64)
+        for agent_type, agents in self.agents.items():
+            for status in range(len(STATUS_NAMES)):
+                counts[:, agent_type, status] = (agents["exists"] & (agents["status"] == status)).sum(axis=1)
+        return counts
+
+    def run(self, timesteps: int, verbose: bool = False) -> list:
+        """Steps all the replicates `timesteps` times, recording every step.
+
+        Returns:
+            list: One output per replicate, in the format of `run_model` (without terrain history).
+        """
+        for i in range(timesteps):
+            if verbose:
+                print(f"step {i}")
+            self.step()
+            self.record(i)
+        return self.to_outputs()
+
+    def to_outputs(self) -> list:
+        """Recorded steps as one `run_model`-like DataFrame per replicate."""
+        from pandas import DataFrame
+
+        type_names = np_array(TYPE_NAMES, dtype=object)
+        status_names = np_array(STATUS_NAMES, dtype=object)
+        outputs = []
+        for r in range(self.n_replicates):
+            columns = {"id": [], "time": [], "type": [], "status": [], "x": [], "y": [], "terrain": []}
+            for time, frame in self.history:
+                for agent_type, (x, y, status, on_land) in frame.items():
+                    ids = np_nonzero(self.agents[agent_type]["exists"][r])[0]
+                    columns["id"].append(ids)
+                    columns["time"].append(np_full(len(ids), time))
+                    columns["type"].append(np_repeat(type_names[agent_type], len(ids)))
+                    columns["status"].append(status_names[status[r, ids]])
+                    columns["x"].append(x[r, ids])
+                    columns["y"].append(y[r, ids])
+                    columns["terrain"].append(np_where(on_land[r, ids], "land", "water").astype(object))
+            outputs.append(DataFrame({name: np_concatenate(values) for name, values in columns.items()}))
+        return outputs
@@ -0,0 +1,281 @@
+from gzip import open as gzip_open
+from pickle import dump as pickle_dump
+from pickle import load as pickle_load
+from pandas import DataFrame
+from pandas import concat as pandas_concat
+from process import TOTAL_TIMESTEPS
+from process.animal import TYPE_NAMES, STATUS_NAMES, DEAD
+from process.melt import TerrainHistory
+
+EVENT_COLUMNS = ["time", "event", "type", "id", "status", "x", "y", "other_type", "other_id"]
+
+
+class EventLog:
+    """Event-sourced record of a model run.
+
+    Instead of one row per agent per step (see `run_model`), only the changes are kept:
+    moves, status changes, deaths, kills (with predator and prey ids), agents appearing
+    or leaving the model (recycled, see process/pool.py) and melted land cells. A full
+    snapshot of the agents (keyframe) is stored every `keyframe_interval` steps so any
+    timestep can be rebuilt without replaying the whole run. The land cells are only
+    kept once, at the first keyframe, the melted cells of each step are recorded in a
+    `TerrainHistory`.
+
+    Agents are keyed by (type, id) since ids are only unique within a type. Types and
+    statuses are stored by name (not as the agents' integer codes).
+
+    Args:
+        keyframe_interval (int): Number of steps between two keyframes (default: 50).
+    """
+
+    def __init__(self, keyframe_interval: int = 50):
+        self.keyframe_interval = keyframe_interval
+        self.events = {col: [] for col in EVENT_COLUMNS}
+        self.keyframes = {}
+        self.offsets = {}
+        self.terrain_history = None
+        self.time = -1
+
+        self._last = {}
+        self._step_start = 0
+
+    def _add(self, time, event, agent_type, agent_id, status=None, x=None, y=None, other_type=None, other_id=None):
+        self.events["time"].append(time)
+        self.events["event"].append(event)
+        self.events["type"].append(agent_type)
+        self.events["id"].append(agent_id)
+        self.events["status"].append(status)
+        self.events["x"].append(x)
+        self.events["y"].append(y)
+        self.events["other_type"].append(other_type)
+        self.events["other_id"].append(other_id)
+
+    def record_keyframe(self, model, time: int):
+        """Stores a full snapshot of the agents at `time` (and of the land cells, the first time)."""
+        agents = {}
+        for agent in model.schedule.agents:
+            agents[(TYPE_NAMES[agent.type], agent.id)] = (STATUS_NAMES[agent.status], agent.pos[0], agent.pos[1])
+        self.keyframes[time] = {"agents": agents}
+        if self.terrain_history is None:
+            self.terrain_history = TerrainHistory.from_model(model)
+        self._last = dict(agents)
+
+    def record_kill(self, predator, prey):
+        """Called by a predator when a hunt succeeds (during the current step)."""
+        self._add(
+            self.time, "kill", TYPE_NAMES[predator.type], predator.id,
+            x=prey.pos[0], y=prey.pos[1], other_type=TYPE_NAMES[prey.type], other_id=prey.id)
+
+    def record_step(self, model, time: int):
+        """Compares the model against the last known state and stores what changed in `time`.
+
+        Kill events raised by the agents during the step are already in the log, the rest
+        (melts, moves, status changes, deaths, new and retired agents) is added here.
+        """
+        for mx, my in model.melted_cells:
+            self._add(time, "melt", None, None, x=mx, y=my)
+        self.terrain_history.record(time, model.melted_cells)
+
+        n_agents = 0
+        for agent in model.schedule.agents:
+            n_agents += 1
+            agent_type = TYPE_NAMES[agent.type]
+            status = STATUS_NAMES[agent.status]
+            key = (agent_type, agent.id)
+            x, y = agent.pos
+            last = self._last.get(key)
+
+            if last is None:
+                self._add(time, "spawn", agent_type, agent.id, status=status, x=x, y=y)
+            else:
+                if (x, y) != (last[1], last[2]):
+                    self._add(time, "move", agent_type, agent.id, x=x, y=y)
+                if status != last[0]:
+                    event = "death" if agent.status == DEAD else "status"
+                    self._add(time, event, agent_type, agent.id, status=status)
+
+            self._last[key] = (status, x, y)
+
+        if len(self._last) > n_agents:
+            current = {(TYPE_NAMES[agent.type], agent.id) for agent in model.schedule.agents}
+            for key in [key for key in self._last if key not in current]:
+                self._add(time, "retire", key[0], key[1])
+                del self._last[key]
+
+        self.offsets[time] = (self._step_start, len(self.events["time"]))
+        self._step_start = len(self.events["time"])
+
+        if time % self.keyframe_interval == 0:
+            self.record_keyframe(model, time)
+
+    def _apply(self, agents: dict, time: int):
+        start, end = self.offsets.get(time, (0, 0))
+        events = self.events
+        for i in range(start, end):
+            event = events["event"][i]
+            if event == "move":
+                key = (events["type"][i], events["id"][i])
+                status, _, _ = agents[key]
+                agents[key] = (status, events["x"][i], events["y"][i])
+            elif event in ("status", "death"):
+                key = (events["type"][i], events["id"][i])
+                _, x, y = agents[key]
+                agents[key] = (events["status"][i], x, y)
+            elif event == "spawn":
+                agents[(events["type"][i], events["id"][i])] = (
+                    events["status"][i], events["x"][i], events["y"][i])
+            elif event == "retire":
+                agents.pop((events["type"][i], events["id"][i]), None)
+
+    def _agents_at(self, time: int) -> dict:
+        start_times = [t for t in self.keyframes if t <= time]
+        if not start_times or time > self.last_time:
+            raise ValueError(f"timestep {time} is not covered by this event log")
+
+        keyframe_time = max(start_times)
+        agents = dict(self.keyframes[keyframe_time]["agents"])
+        for t in range(keyframe_time + 1, time + 1):
+            self._apply(agents, t)
+        return agents
+
+    def state_at(self, time: int) -> tuple:
+        """Rebuilds the population and the land cells at the end of step `time`.
+
+        Args:
+            time (int): Timestep to rebuild (-1 is the state before the first step).
+
+        Returns:
+            tuple: (agents, land_cells), where agents maps (type, id) to (status, x, y)
+                and land_cells is a set of (x, y).
+
+        Raises:
+            ValueError: If `time` is before the first keyframe or after the last step.
+        """
+        agents = self._agents_at(time)
+        return agents, set(self.terrain_history.land_cells_at(time))
+
+    @property
+    def last_time(self) -> int:
+        return max(self.offsets) if self.offsets else -1
+
+    def frame_at(self, time: int) -> DataFrame:
+        """Returns the population at `time` in the same layout as one timestep of `run_model`."""
+        agents = self._agents_at(time)
+        return _to_frame(agents, self.terrain_history.land_cells_at(time), time)
+
+    def iter_frames(self, start: int = 0, stop: int or None = None):
+        """Streams the population forward from `start` to `stop` (exclusive).
+
+        Only the first frame is rebuilt from a keyframe, the following ones apply the
+        events of each step on top of the previous one.
+
+        Yields:
+            tuple: (time, frame, land_cells), with `frame` as returned by `frame_at` and
+                `land_cells` set-like (see `TerrainHistory.land_cells_at`, only valid
+                until the next frame).
+        """
+        if stop is None:
+            stop = self.last_time + 1
+        agents = self._agents_at(start)
+        for time in range(start, stop):
+            if time > start:
+                self._apply(agents, time)
+            land_cells = self.terrain_history.land_cells_at(time)
+            yield time, _to_frame(agents, land_cells, time), land_cells
+
+    def to_trajectory(self) -> tuple:
+        """Expands the log back to the `(output, terrain_history)` pair returned by `run_model`."""
+        frames = [frame for _, frame, _ in self.iter_frames()]
+        return pandas_concat(frames, ignore_index=True), self.terrain_history
+
+    def to_dataframe(self) -> DataFrame:
+        """Returns all the recorded events as a DataFrame (one row per event)."""
+        return DataFrame.from_dict(self.events)
+
+    def save(self, path: str):
+        """Writes the log to a gzip compressed pickle."""
+        with gzip_open(path, "wb") as fid:
+            pickle_dump({
+                "keyframe_interval": self.keyframe_interval,
+                "events": self.events,
+                "keyframes": self.keyframes,
+                "offsets": self.offsets,
+                "terrain_history": self.terrain_history}, fid)
+
+    @classmethod
+    def load(cls, path: str):
+        """Reads a log written by `save`."""
+        with gzip_open(path, "rb") as fid:
+            data = pickle_load(fid)
+        log = cls(keyframe_interval=data["keyframe_interval"])
+        log.events = data["events"]
+        log.keyframes = data["keyframes"]
+        log.offsets = data["offsets"]
+        log.time = log.last_time
+        log.terrain_history = data.get("terrain_history")
+        if log.terrain_history is None:
+            # logs saved with the land cells in every keyframe
+            log.terrain_history = TerrainHistory(set(log.keyframes[min(log.keyframes)]["land_cells"]))
+            for time in sorted(log.offsets):
+                start, end = log.offsets[time]
+                log.terrain_history.record(time, [
+                    (log.events["x"][i], log.events["y"][i])
+                    for i in range(start, end) if log.events["event"][i] == "melt"])
+        return log
+
+
+def _to_frame(agents: dict, land_cells: set, time: int) -> DataFrame:
+    output = {"id": [], "time": [], "type": [], "status": [], "x": [], "y": [], "terrain": []}
+    for (agent_type, agent_id), (status, x, y) in agents.items():
+        output["id"].append(agent_id)
+        output["time"].append(time)
+        output["type"].append(agent_type)
+        output["status"].append(status)
+        output["x"].append(x)
+        output["y"].append(y)
+        output["terrain"].append("land" if (x, y) in land_cells else "water")
+    return DataFrame.from_dict(output)
+
+
+def run_model_events(
+        model,
+        keyframe_interval: int = 50,
+        monitor=None,
+        timesteps: int or None = None,
+        verbose: bool = True) -> EventLog:
+    """Runs the model like `run_model` but only records events.
+
+    The output grows with the activity in the run (moves, status changes, kills and
+    melts) rather than with agents x steps.
+
+    Args:
+        model: A `SealPenguinFishModel` (or any model with `schedule`, `land_cells`,
+            `melted_cells` and an `event_log` attribute fed by `model.record_kill`).
+        keyframe_interval (int): Number of steps between two full snapshots.
+        monitor (LiveMonitor, optional): Started live monitor, see `run_model`.
+        timesteps (int, optional): Number of steps (default: `TOTAL_TIMESTEPS`).
+        verbose (bool): Print the step number at every step (default: True).
+
+    Returns:
+        EventLog: The event log of the run, use `state_at`/`iter_frames` to rebuild the
+            population at any timestep.
+    """
+    event_log = EventLog(keyframe_interval=keyframe_interval)
+    event_log.record_keyframe(model, -1)
+    model.event_log = event_log
+    if monitor is not None:
+        monitor.publish(model, -1)
+
+    if timesteps is None:
+        timesteps = TOTAL_TIMESTEPS
+
+    for i in range(timesteps):
+        if verbose:
+            print(f"step {i}")
+        event_log.time = i
+        model.step()
+        event_log.record_step(model, i)
+        if monitor is not None:
+            monitor.publish(model, i)
+
+    return event_log
@@ -1,14 +1,20 @@
-from mesa import Agent
+from process.animal import Animal, FISH, ALIVE, DEAD
 from process import MAP_SIZE, INITIAL_LOCATIONS, PARAMS
 from random import gauss
-from process.utils import escape_strategy, get_random_move_position, chase_or_home
+from process.utils import escape_strategy, get_random_move_position, go_home, get_terrain_neighborhood
 
-class Fish(Agent):
-    def __init__(self, unique_id, model, checks: int = 50):
+class Fish(Animal):
+    type = FISH
+
+    def __init__(self, unique_id, model, checks: int = 50, home: tuple or None = None):
         super().__init__(unique_id, model)
-        self.type = "fish"
         self.id = unique_id
-        self.status = "alive"
+        self.status = ALIVE
+
+        # homes drawn in batch by the model (see process/placement.py) skip the rejection loop
+        if home is not None:
+            self.home = home
+            return
 
         proc_check = 0
         while True:
@@ -16,30 +22,36 @@ class Fish(Agent):
             sigma = max(3, MAP_SIZE / 10.0)
             x = max(0, min(MAP_SIZE - 1, int(gauss(mu=INITIAL_LOCATIONS["fish"][0], sigma=sigma))))
             y = max(0, min(MAP_SIZE - 1, int(gauss(mu=INITIAL_LOCATIONS["fish"][1], sigma=sigma))))
-            if model.terrain[x][y] == "water":
-                self.home = {"x": x, "y": y}
+            if model.terrain[x, y] == "water":
+                self.home = (x, y)
                 break
 
             if proc_check > checks:
                 self.home = None
                 break
 
+    def reset(self, unique_id, home: tuple):
+        """Makes a retired (off the grid) agent a newborn, see process/pool.py."""
+        self.unique_id = unique_id
+        self.id = unique_id
+        self.home = home
+        self.status = ALIVE
+
     def step(self):
-        if self.status == "dead":
+        if self.status == DEAD:
             return
-        neighbors = self.model.grid.get_neighbors(
+        penguin_nearby = self.model.registry.query(
+            "live_penguins", 
             self.pos, 
-            moore=True, 
-            radius=int(PARAMS["fish"]["vision"]["escape"]))
-        penguin_nearby = [agent for agent in neighbors if (agent.type == "penguin" and agent.status != "dead")]
+            int(PARAMS["fish"]["vision"]["escape"]))
 
         if penguin_nearby:
             self.escape(penguin_nearby)
         else:
-            new_position = chase_or_home(
+            new_position = go_home(
                 self.model, 
                 self.pos, 
-                (self.home["x"], self.home["y"]), 
+                self.home, 
                 PARAMS["fish"]["speed"]["walk"], 
                 terrain_type="water") 
             self.random_move(new_position=new_position)
@@ -50,17 +62,15 @@ class Fish(Agent):
             proc_pos = new_position
         new_position = get_random_move_position(
             self.model, proc_pos, PARAMS["fish"]["speed"]["walk"], terrain_type = "water")
-        self.model.grid.move_agent(self, new_position)
+        self.move(new_position)
 
     def escape(self, enemies):
-        possible_positions = self.model.grid.get_neighborhood(
+        water_positions = get_terrain_neighborhood(
+            self.model, 
             self.pos, 
-            moore=True, 
-            include_center=False, 
-            radius=int(PARAMS["fish"]["speed"]["run"]))
-        water_positions = [
-            pos for pos in possible_positions if self.model.terrain[pos[0]][pos[1]] == "water"]
+            PARAMS["fish"]["speed"]["run"], 
+            terrain_type="water")
 
         if water_positions:
             new_position = escape_strategy(enemies, water_positions)
-            self.model.grid.move_agent(self, new_position)
\ No newline at end of file
+            self.move(new_position)
\ No newline at end of file
@@ -0,0 +1,472 @@
+"""Golden trajectories: reference runs to check optimized engines against.
+
+Record reference runs once (fixed seeds, `run_model` on the dense backend), then check
+another engine on the same seeds, e.g.:
+
+    python -m process.golden record golden.pkl.gz --seeds $(seq 0 15) --timesteps 100
+    python -m process.golden check golden.pkl.gz --engine events
+    python -m process.golden check golden.pkl.gz --engine ensemble --mode statistical
+
+Engines that replay the reference random draws ("reference", "events") must give the
+same trajectories. The others ("sparse", which melts the ice tile by tile, "partitioned",
+"ensemble") should only give the same population dynamics: a few aggregate statistics of
+every run (`AGGREGATES`, e.g. the fish alive at the end) are compared to the golden ones
+across seeds with permutation tests on their means. Checks with too few seeds to ever
+fail are refused.
+
+The record keeps the behaviour config of its runs (`BEHAVIOUR_CONFIG`: agent parameters,
+placement, homing, prey search and climate) and a check refuses to run under another
+one, unless asked to use the recorded config.
+
+The model modules are imported lazily, so the config dicts in `process` (e.g.
+`KERNEL_VARS`) can be set before a check.
+"""
+from argparse import ArgumentParser
+from copy import deepcopy
+from gzip import open as gzip_open
+from math import comb
+from pickle import dump as pickle_dump
+from pickle import load as pickle_load
+from itertools import combinations
+from numpy import abs as np_abs
+from numpy import asarray as np_asarray
+from numpy import concatenate as np_concatenate
+from numpy import zeros as np_zeros
+from numpy.random import default_rng
+from pandas import DataFrame
+import process
+from process import POPULATION
+
+# config dicts of `process` that change the trajectories (not e.g. the kernel backend)
+BEHAVIOUR_CONFIG = ("PARAMS", "PLACEMENT_VARS", "HOMING_VARS", "PREY_SEARCH_VARS", "CLIMATE_VARS")
+
+CENSUS_SERIES = [
+    ("fish", "alive"), ("fish", "dead"),
+    ("penguin", "hunt"), ("penguin", "full"), ("penguin", "dead"),
+    ("seal", "hunt"), ("seal", "dead")]
+
+OUTPUT_COLUMNS = ["time", "type", "id", "status", "x", "y", "terrain"]
+
+
+def get_census(output: DataFrame, land_counts: list or None = None) -> DataFrame:
+    """Population curves of a run: agents by time (rows) and "type/status" (columns).
+
+    Args:
+        output (DataFrame): Output of `run_model` (or any engine in the same format).
+        land_counts (list, optional): Number of land cells at every step, added as "land".
+
+    Returns:
+        DataFrame: One column per `CENSUS_SERIES` (0 when absent), indexed by time.
+    """
+    counts = output.groupby(["time", "type", "status"]).size()
+    census = DataFrame(index=sorted(output["time"].unique()))
+    for agent_type, status in CENSUS_SERIES:
+        key = f"{agent_type}/{status}"
+        try:
+            census[key] = counts.xs((agent_type, status), level=("type", "status"))
+        except KeyError:
+            census[key] = 0
+    census = census.fillna(0).astype(int)
+    if land_counts is not None:
+        census["land"] = list(land_counts)
+    return census
+
+
+# statistics of a run compared across seeds by the statistical check, from its census
+AGGREGATES = {
+    "fish alive at the end": lambda census: census["fish/alive"].iloc[-1],
+    "penguins dead at the end": lambda census: census["penguin/dead"].iloc[-1],
+    "mean penguins full": lambda census: census["penguin/full"].mean(),
+    "mean penguins hunting": lambda census: census["penguin/hunt"].mean(),
+    "land at the end": lambda census: census["land"].iloc[-1],
+}
+
+
+def get_min_pvalue(n_a: int, n_b: int, n_permutations: int = 20000) -> float:
+    """Lowest p-value `permutation_test` can return for samples of `n_a` and `n_b` values."""
+    n_splits = comb(n_a + n_b, n_a)
+    if n_splits > n_permutations:
+        return max(1.0 / (n_permutations + 1), (2.0 if n_a == n_b else 1.0) / n_splits)
+    return (2.0 if n_a == n_b else 1.0) / n_splits
+
+
+def permutation_test(a, b, n_permutations: int = 20000, seed: int = 0) -> float:
+    """Two-sided permutation test of the difference of the means of two samples.
+
+    Every split of the pooled values is enumerated when there are at most
+    `n_permutations` of them, otherwise `n_permutations` random splits are drawn (from
+    `seed`, so a check is reproducible).
+
+    Returns:
+        float: p-value, the share of splits with a mean difference at least as large as
+            the observed one. Identical constant samples give 1.0.
+    """
+    a = np_asarray(a, dtype=float)
+    b = np_asarray(b, dtype=float)
+    pooled = np_concatenate([a, b])
+    observed = abs(a.mean() - b.mean())
+    # differences within float rounding of the observed one count as equal
+    tolerance = 1e-9 * max(1.0, float(np_abs(pooled).max()))
+    total = pooled.sum()
+    n_a = len(a)
+    n_b = len(b)
+
+    if comb(n_a + n_b, n_a) <= n_permutations:
+        in_a = np_zeros((comb(n_a + n_b, n_a), n_a + n_b), dtype=bool)
+        for row, split in enumerate(combinations(range(n_a + n_b), n_a)):
+            in_a[row, list(split)] = True
+        sums_a = in_a.astype(float) @ pooled
+        differences = np_abs(sums_a / n_a - (total - sums_a) / n_b)
+        return float((differences >= observed - tolerance).mean())
+
+    rng = default_rng(seed)
+    sums_a = [pooled[rng.permutation(n_a + n_b)[:n_a]].sum() for _ in range(n_permutations)]
+    differences = np_abs(np_asarray(sums_a) / n_a - (total - np_asarray(sums_a)) / n_b)
+    return float((1 + (differences >= observed - tolerance).sum()) / (n_permutations + 1))
+
+
+def get_aggregates(census: DataFrame) -> dict:
+    """`AGGREGATES` of one run."""
+    return {name: float(statistic(census)) for name, statistic in AGGREGATES.items()}
+
+
+def get_behaviour_config() -> dict:
+    """A copy of the current `BEHAVIOUR_CONFIG` dicts, by name."""
+    return {name: deepcopy(getattr(process, name)) for name in BEHAVIOUR_CONFIG}
+
+
+def _config_differences(recorded, current, prefix: str) -> list:
+    if isinstance(recorded, dict) and isinstance(current, dict):
+        differences = []
+        for key in sorted(set(recorded) | set(current), key=str):
+            differences.extend(_config_differences(
+                recorded.get(key, "<missing>"), current.get(key, "<missing>"), f"{prefix}[{key!r}]"))
+        return differences
+    if recorded != current:
+        return [f"{prefix}: {recorded!r} recorded, {current!r} now"]
+    return []
+
+
+# ---------------------------------------------------------------------------
+# engines: run every seed and return one (output, land_counts) per seed
+# ---------------------------------------------------------------------------
+def _new_model(seed: int, population: dict, **kwargs):
+    from random import seed as random_seed
+    from run import SealPenguinFishModel
+
+    random_seed(seed)
+    model = SealPenguinFishModel(
+        N_penguins=population["penguin"], N_seals=population["seal"], N_fish=population["fish"], **kwargs)
+    model.random.seed(seed)
+    return model
+
+
+def _land_counts(terrain_history) -> list:
+    return [terrain_history.count_at(time) for time in sorted(terrain_history) if time >= 0]
+
+
+def run_reference(seeds: list, timesteps: int, population: dict, space_backend: str = "dense") -> list:
+    """`run_model` on a new `SealPenguinFishModel` per seed."""
+    from process.utils import run_model
+
+    runs = []
+    for seed in seeds:
+        model = _new_model(seed, population, space_backend=space_backend)
+        output, terrain_history = run_model(model, timesteps=timesteps, verbose=False)
+        runs.append((output, _land_counts(terrain_history)))
+    return runs
+
+
+def run_sparse(seeds: list, timesteps: int, population: dict) -> list:
+    """The reference runs on the sparse space backend."""
+    return run_reference(seeds, timesteps, population, space_backend="sparse")
+
+
+def run_events(seeds: list, timesteps: int, population: dict) -> list:
+    """`run_model_events`, expanded back to trajectories."""
+    from process.events import run_model_events
+
+    runs = []
+    for seed in seeds:
+        model = _new_model(seed, population)
+        output, terrain_history = run_model_events(model, timesteps=timesteps, verbose=False).to_trajectory()
+        output = output[output["time"] >= 0].reset_index(drop=True)
+        runs.append((output, _land_counts(terrain_history)))
+    return runs
+
+
+def run_partitioned_engine(seeds: list, timesteps: int, population: dict, n_workers: int = 2) -> list:
+    """`run_partitioned` with `n_workers` tiles."""
+    from process.partition import run_partitioned
+
+    runs = []
+    for seed in seeds:
+        model = _new_model(seed, population)
+        output, terrain_history = run_partitioned(
+            model, n_workers=n_workers, seed=seed, timesteps=timesteps, verbose=False)
+        runs.append((output, _land_counts(terrain_history)))
+    return runs
+
+
+def run_ensemble(seeds: list, timesteps: int, population: dict) -> list:
+    """One `EnsembleModel` with a replicate per seed (seeded by the first seed)."""
+    from process.ensemble import EnsembleModel
+
+    ensemble = EnsembleModel(
+        len(seeds), N_penguins=population["penguin"], N_seals=population["seal"], N_fish=population["fish"],
+        seed=seeds[0])
+    land_counts = [[] for _ in seeds]
+    for i in range(timesteps):
+        ensemble.step()
+        ensemble.record(i)
+        for r, count in enumerate(ensemble.land.reshape(len(seeds), -1).sum(axis=1).tolist()):
+            land_counts[r].append(count)
+    return list(zip(ensemble.to_outputs(), land_counts))
+
+
+ENGINES = {
+    "reference": run_reference,
+    "sparse": run_sparse,
+    "events": run_events,
+    "partitioned": run_partitioned_engine,
+    "ensemble": run_ensemble,
+}
+
+# engines expected to reproduce the reference trajectories exactly
+EXACT_ENGINES = ("reference", "events")
+
+
+# ---------------------------------------------------------------------------
+# golden record
+# ---------------------------------------------------------------------------
+class GoldenRecord:
+    """Reference trajectories and census curves of a set of seeded runs.
+
+    Args:
+        seeds (list): Seed of every run (`random.seed` and `model.random.seed`).
+        timesteps (int): Steps per run.
+        population (dict): Initial population, as `POPULATION`.
+        outputs (list): `run_model` output of every run.
+        censuses (list): `get_census` of every run (with the land counts).
+        config (dict): `get_behaviour_config()` of the runs.
+    """
+
+    def __init__(
+            self,
+            seeds: list,
+            timesteps: int,
+            population: dict,
+            outputs: list,
+            censuses: list,
+            config: dict):
+        self.seeds = seeds
+        self.timesteps = timesteps
+        self.population = population
+        self.outputs = outputs
+        self.censuses = censuses
+        self.config = config
+
+    @classmethod
+    def record(cls, seeds: list, timesteps: int, population: dict or None = None):
+        """Runs the reference engine on every seed, under the current config."""
+        if population is None:
+            population = dict(POPULATION)
+        runs = run_reference(seeds, timesteps, population)
+        return cls(
+            list(seeds),
+            timesteps,
+            dict(population),
+            [output for output, _ in runs],
+            [get_census(output, land_counts) for output, land_counts in runs],
+            get_behaviour_config())
+
+    def save(self, path: str):
+        """Writes the record to a gzip compressed pickle."""
+        with gzip_open(path, "wb") as fid:
+            pickle_dump(vars(self), fid)
+
+    @classmethod
+    def load(cls, path: str):
+        """Reads a record written by `save`.
+
+        Raises:
+            ValueError: If the record was made before the behaviour config was kept.
+        """
+        with gzip_open(path, "rb") as fid:
+            data = pickle_load(fid)
+        if "config" not in data:
+            raise ValueError(f"{path} does not keep the config of its runs, record it again")
+        return cls(**data)
+
+    def config_differences(self) -> list:
+        """Differences between the recorded and the current behaviour config, one line each."""
+        return _config_differences(self.config, get_behaviour_config(), "")
+
+    def run(self, engine: str, use_recorded_config: bool = False, **kwargs) -> list:
+        """Runs `engine` (a name in `ENGINES`) on the record's seeds and population.
+
+        Args:
+            engine (str): Engine name.
+            use_recorded_config (bool): Run under the recorded behaviour config (restored
+                afterwards) instead of checking the current one is the same.
+
+        Raises:
+            ValueError: If the current behaviour config differs from the recorded one.
+        """
+        if not use_recorded_config:
+            differences = self.config_differences()
+            if differences:
+                raise ValueError(
+                    "the behaviour config differs from the golden runs':\n" + "\n".join(differences))
+            return ENGINES[engine](self.seeds, self.timesteps, self.population, **kwargs)
+
+        # the original entries (not copies) are put back, for the code holding nested dicts
+        current = {name: dict(getattr(process, name)) for name in self.config}
+        try:
+            for name, value in self.config.items():
+                getattr(process, name).clear()
+                getattr(process, name).update(deepcopy(value))
+            return ENGINES[engine](self.seeds, self.timesteps, self.population, **kwargs)
+        finally:
+            for name, value in current.items():
+                getattr(process, name).clear()
+                getattr(process, name).update(value)
+
+    def check_exact(self, runs: list) -> list:
+        """Compares trajectories row by row.
+
+        Returns:
+            list: One message per differing run (empty if all runs are identical).
+        """
+        failures = []
+        for seed, golden, (output, land_counts) in zip(self.seeds, self.outputs, runs):
+            message = compare_outputs(golden, output)
+            if message is None and get_census(golden).shape[0] != len(land_counts):
+                message = "different number of steps"
+            if message is None:
+                golden_land = self.censuses[self.seeds.index(seed)]["land"].tolist()
+                if golden_land != list(land_counts):
+                    message = "different ice melt"
+            if message is not None:
+                failures.append(f"seed {seed}: {message}")
+        return failures
+
+    def check_statistical(self, runs: list, alpha: float = 0.05, n_permutations: int = 20000) -> DataFrame:
+        """Compares aggregate statistics of the runs to the golden ones across seeds.
+
+        Each of the `AGGREGATES` is tested with a `permutation_test` of the golden values
+        against the runs' values. A test fails below `alpha` divided by the number of
+        tests (Bonferroni correction).
+
+        Returns:
+            DataFrame: statistic, golden_mean, mean, pvalue, failed (one row per test).
+
+        Raises:
+            ValueError: If there are too few seeds for any test to ever fail.
+        """
+        threshold = alpha / len(AGGREGATES)
+        min_pvalue = get_min_pvalue(len(self.censuses), len(runs), n_permutations)
+        if min_pvalue >= threshold:
+            n_seeds = 1
+            while get_min_pvalue(n_seeds, n_seeds, n_permutations) >= threshold:
+                n_seeds += 1
+            raise ValueError(
+                f"with {len(self.censuses)} golden and {len(runs)} checked runs no test can fail "
+                f"(lowest p-value {min_pvalue:.3g}, threshold {threshold:.3g}), "
+                f"use at least {n_seeds} seeds")
+
+        golden = [get_aggregates(census) for census in self.censuses]
+        values = [get_aggregates(get_census(output, land_counts)) for output, land_counts in runs]
+        rows = []
+        for name in AGGREGATES:
+            golden_values = [aggregates[name] for aggregates in golden]
+            run_values = [aggregates[name] for aggregates in values]
+            rows.append({
+                "statistic": name,
+                "golden_mean": sum(golden_values) / len(golden_values),
+                "mean": sum(run_values) / len(run_values),
+                "pvalue": permutation_test(golden_values, run_values, n_permutations=n_permutations)})
+        results = DataFrame(rows)
+        results["failed"] = results["pvalue"] < threshold
+        return results
+
+
+def compare_outputs(golden: DataFrame, output: DataFrame) -> str or None:
+    """Returns a description of the first difference between two run outputs, or None."""
+    golden = golden[OUTPUT_COLUMNS].sort_values(["time", "type", "id"], kind="stable").reset_index(drop=True)
+    output = output[OUTPUT_COLUMNS].sort_values(["time", "type", "id"], kind="stable").reset_index(drop=True)
+    if len(golden) != len(output):
+        return f"{len(output)} rows instead of {len(golden)}"
+
+    for column in OUTPUT_COLUMNS:
+        different = (golden[column].to_numpy() != output[column].to_numpy()).nonzero()[0]
+        if len(different):
+            row = golden.iloc[different[0]]
+            return (
+                f"{column} differs first at time {row['time']} for {row['type']} {row['id']} "
+                f"({golden[column].iloc[different[0]]!r} != {output[column].iloc[different[0]]!r})")
+    return None
+
+
+def get_parser() -> ArgumentParser:
+    parser = ArgumentParser(description="Record golden runs or check an engine against them.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record = commands.add_parser("record", help="run the reference engine and save the golden runs")
+    record.add_argument("path", help="golden record (.pkl.gz)")
+    record.add_argument("--seeds", type=int, nargs="+", default=list(range(16)))
+    record.add_argument("--timesteps", type=int, default=100)
+    record.add_argument("--penguins", type=int, default=POPULATION["penguin"])
+    record.add_argument("--seals", type=int, default=POPULATION["seal"])
+    record.add_argument("--fish", type=int, default=POPULATION["fish"])
+
+    check = commands.add_parser("check", help="run an engine on the golden seeds and compare")
+    check.add_argument("path", help="golden record (.pkl.gz)")
+    check.add_argument("--engine", choices=list(ENGINES), default="reference")
+    check.add_argument(
+        "--mode", choices=["auto", "exact", "statistical"], default="auto",
+        help="auto: exact for the engines replaying the reference draws, statistical otherwise")
+    check.add_argument("--alpha", type=float, default=0.05)
+    check.add_argument(
+        "--use-recorded-config", action="store_true",
+        help="run under the recorded behaviour config instead of requiring the current one to match")
+    check.add_argument("--kernels", choices=["auto", "numba", "numpy"], default=None)
+    return parser
+
+
+def main(argv: list or None = None) -> bool:
+    args = get_parser().parse_args(argv)
+
+    if args.command == "record":
+        population = {"penguin": args.penguins, "seal": args.seals, "fish": args.fish}
+        GoldenRecord.record(args.seeds, args.timesteps, population).save(args.path)
+        print(f"recorded {len(args.seeds)} runs of {args.timesteps} steps to {args.path}")
+        return True
+
+    if args.kernels is not None:
+        process.KERNEL_VARS["backend"] = args.kernels
+
+    golden = GoldenRecord.load(args.path)
+    runs = golden.run(args.engine, use_recorded_config=args.use_recorded_config)
+    mode = args.mode
+    if mode == "auto":
+        mode = "exact" if args.engine in EXACT_ENGINES else "statistical"
+
+    if mode == "exact":
+        failures = golden.check_exact(runs)
+        for failure in failures:
+            print(failure)
+        passed = not failures
+    else:
+        results = golden.check_statistical(runs, alpha=args.alpha)
+        print(results.to_string(index=False))
+        failed = results[results["failed"]]
+        passed = failed.empty
+        print(f"{len(results)} permutation tests, {len(failed)} failed (min p-value {results['pvalue'].min():.3g})")
+
+    print(f"{args.engine}: {'PASSED' if passed else 'FAILED'} ({mode})")
+    return passed
+
+
+if __name__ == "__main__":
+    raise SystemExit(0 if main() else 1)
@@ -0,0 +1,200 @@
+from numpy import add as np_add
+from numpy import array as np_array
+from numpy import bincount as np_bincount
+from numpy import flipud as np_flipud
+from numpy import int32 as np_int32
+from numpy import int64 as np_int64
+from numpy import load as np_load
+from numpy import savez_compressed as np_savez_compressed
+from numpy import zeros as np_zeros
+from process import SPACE_VARS, TOTAL_TIMESTEPS
+from process.animal import TYPE_NAMES, DEAD, PENGUIN
+
+# live agents per cell and step, by type, penguins in the water (foraging) and kills
+# by predator type (at the prey's position)
+LAYERS = [*TYPE_NAMES, "penguin_water", *(f"{name}_kills" for name in TYPE_NAMES[1:])]
+_PENGUIN_WATER = len(TYPE_NAMES)
+_KILLS = len(TYPE_NAMES) + 1
+
+
+class SpatialHeatmaps:
+    """Occupancy and kill-density rasters on the model grid, accumulated while stepping.
+
+    Attach it to a model (`model.heatmaps = ...`, or use `run_model_heatmaps`): after
+    every step the live agents are counted per cell with `np.bincount`, and the kills
+    reported during the step (`model.record_kill`) are added with `np.add.at`. Nothing
+    else is kept, so no trajectory has to be stored.
+
+    Rasters are (width, height) arrays indexed [x, y] like the grid, one per layer in
+    `LAYERS` (values are agent-steps, or kills). Besides the whole run ("all"), they can
+    be accumulated over time windows, e.g. `windows=[(0, 100), (100, 300)]` (steps
+    `start` to `stop - 1`), named "0_100" etc.
+
+    Args:
+        width (int): Grid width.
+        height (int): Grid height.
+        windows (list, optional): (start, stop) step ranges.
+        region (tuple, optional): (col_off, row_off, n_cols, n_rows) basemap window the
+            grid was resampled from (None for the whole basemap), for `to_geotiff`.
+    """
+
+    def __init__(self, width: int, height: int, windows: list or None = None, region: tuple or None = None):
+        self.width = width
+        self.height = height
+        self.region = region
+        self.windows = {"all": (0, None)}
+        for start, stop in windows or []:
+            self.windows[f"{start}_{stop}"] = (start, stop)
+        self.rasters = {name: np_zeros((len(LAYERS), width, height), dtype=np_int32) for name in self.windows}
+        self.steps = {name: 0 for name in self.windows}
+        self._kills = []
+
+    @classmethod
+    def from_model(cls, model, windows: list or None = None):
+        """Heatmaps for the grid (and basemap region) of `model`."""
+        return cls(
+            model.grid.width,
+            model.grid.height,
+            windows=windows,
+            region=SPACE_VARS["terrain_region"] if model.sparse else None)
+
+    def record_kill(self, predator, prey):
+        """Called through `model.record_kill` when a hunt succeeds."""
+        self._kills.append((_KILLS + predator.type - 1, prey.pos[0], prey.pos[1]))
+
+    def update(self, model, time: int):
+        """Adds the live agents at the end of step `time`, and the kills made during it."""
+        types = []
+        xs = []
+        ys = []
+        water_xs = []
+        water_ys = []
+        terrain = model.terrain
+        for agent in model.schedule.agents:
+            if agent.status == DEAD:
+                continue
+            x, y = agent.pos
+            types.append(agent.type)
+            xs.append(x)
+            ys.append(y)
+            if agent.type == PENGUIN and terrain[x, y] != "land":
+                water_xs.append(x)
+                water_ys.append(y)
+
+        n_cells = self.width * self.height
+        cells = np_array(xs, dtype=np_int64) * self.height + np_array(ys, dtype=np_int64)
+        occupancy = np_bincount(
+            np_array(types, dtype=np_int64) * n_cells + cells,
+            minlength=len(TYPE_NAMES) * n_cells).reshape(len(TYPE_NAMES), self.width, self.height)
+        water = np_bincount(
+            np_array(water_xs, dtype=np_int64) * self.height + np_array(water_ys, dtype=np_int64),
+            minlength=n_cells).reshape(self.width, self.height)
+        kills = np_array(self._kills, dtype=np_int64).reshape(-1, 3)
+        self._kills = []
+
+        for name, (start, stop) in self.windows.items():
+            if time < start or (stop is not None and time >= stop):
+                continue
+            raster = self.rasters[name]
+            raster[:_PENGUIN_WATER] += occupancy
+            raster[_PENGUIN_WATER] += water
+            np_add.at(raster, (kills[:, 0], kills[:, 1], kills[:, 2]), 1)
+            self.steps[name] += 1
+
+    def get(self, layer: str, window: str = "all"):
+        """Returns one raster, indexed [x, y]."""
+        return self.rasters[window][LAYERS.index(layer)]
+
+    def to_arrays(self, window: str = "all") -> dict:
+        """Returns all the rasters of a window by layer name."""
+        return {layer: self.rasters[window][i] for i, layer in enumerate(LAYERS)}
+
+    def save(self, path: str):
+        """Writes all the windows to a compressed .npz file."""
+        arrays = {
+            f"{name}/{layer}": raster[i] for name, raster in self.rasters.items() for i, layer in enumerate(LAYERS)}
+        arrays.update({f"{name}/steps": steps for name, steps in self.steps.items()})
+        np_savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str):
+        """Reads heatmaps written by `save` (without their basemap region)."""
+        data = np_load(path)
+        names = [key[:-len("/steps")] for key in data.files if key.endswith("/steps")]
+        width, height = data[f"all/{LAYERS[0]}"].shape
+        heatmaps = cls(width, height)
+        heatmaps.windows = {}
+        for name in names:
+            heatmaps.windows[name] = (0, None) if name == "all" else tuple(int(step) for step in name.split("_"))
+            heatmaps.rasters[name] = np_array([data[f"{name}/{layer}"] for layer in LAYERS])
+            heatmaps.steps[name] = int(data[f"{name}/steps"])
+        return heatmaps
+
+    def to_geotiff(self, path: str, window: str = "all", basemap: str or None = None):
+        """Writes the rasters of a window as a multi-band GeoTIFF aligned to the basemap.
+
+        The grid is a resampling of the basemap (or of its `region`), so each cell covers
+        the same ground as in the terrain. Bands follow `LAYERS` and carry their names.
+
+        Args:
+            path (str): Output .tif file.
+            window (str): Window name (default: "all").
+            basemap (str, optional): Basemap the terrain was read from (default:
+                `SPACE_VARS["basemap"]`).
+        """
+        from rasterio import open as rasterio_open
+        from rasterio.windows import Window
+        from rasterio.transform import Affine
+
+        if basemap is None:
+            basemap = SPACE_VARS["basemap"]
+        with rasterio_open(basemap) as src:
+            region = Window(*self.region) if self.region is not None else Window(0, 0, src.width, src.height)
+            transform = src.window_transform(region) * Affine.scale(
+                region.width / self.width, region.height / self.height)
+            crs = src.crs
+
+        raster = self.rasters[window]
+        with rasterio_open(
+                path, "w", driver="GTiff", width=self.width, height=self.height, count=len(LAYERS),
+                dtype=raster.dtype.name, crs=crs, transform=transform, compress="deflate") as dst:
+            for i, layer in enumerate(LAYERS):
+                # grid y = 0 is the bottom row of the image
+                dst.write(np_flipud(raster[i].T), i + 1)
+                dst.set_band_description(i + 1, layer)
+
+
+def run_model_heatmaps(
+        model,
+        windows: list or None = None,
+        monitor=None,
+        timesteps: int or None = None,
+        verbose: bool = True) -> SpatialHeatmaps:
+    """Runs the model like `run_model` but only accumulates the heatmaps.
+
+    Args:
+        model: A `SealPenguinFishModel`.
+        windows (list, optional): (start, stop) step ranges, see `SpatialHeatmaps`.
+        monitor (LiveMonitor, optional): Started live monitor, see `run_model`.
+        timesteps (int, optional): Number of steps (default: `TOTAL_TIMESTEPS`).
+        verbose (bool): Print the step number at every step (default: True).
+
+    Returns:
+        SpatialHeatmaps: The heatmaps of the run.
+    """
+    heatmaps = SpatialHeatmaps.from_model(model, windows=windows)
+    model.heatmaps = heatmaps
+    if monitor is not None:
+        monitor.publish(model, -1)
+
+    if timesteps is None:
+        timesteps = TOTAL_TIMESTEPS
+
+    for i in range(timesteps):
+        if verbose:
+            print(f"step {i}")
+        model.step()
+        if monitor is not None:
+            monitor.publish(model, i)
+
+    return heatmaps
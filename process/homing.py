@@ -0,0 +1,169 @@
+from numpy import array as np_array
+from numpy import concatenate as np_concatenate
+from numpy import full as np_full
+from numpy import int64 as np_int64
+from numpy import ones as np_ones
+from numpy import where as np_where
+from numpy import zeros as np_zeros
+from process import HOMING_VARS
+from process.kernels import distance_field, relax_field, descend_cell, UNREACHABLE
+
+
+def _dilate(mask, radius: int):
+    """Cells within `radius` (Chebyshev) of a True cell of `mask`."""
+    near = mask.copy()
+    for d in range(1, radius + 1):
+        near[d:] |= mask[:-d]
+        near[:-d] |= mask[d:]
+    rows = near.copy()
+    for d in range(1, radius + 1):
+        near[:, d:] |= rows[:, :-d]
+        near[:, :-d] |= rows[:, d:]
+    return near
+
+
+class FlowField:
+    """Distances to one home cluster over one terrain, and the best step from the cells asked.
+
+    Args:
+        passable (numpy.ndarray): Bool mask of the cells the agents can stand on (owned
+            by the field, updated by `open_cells` / `close_cells`).
+        sources (numpy.ndarray): Bool mask of the cluster cells (distance 0).
+    """
+
+    def __init__(self, passable, sources):
+        self.passable = passable
+        self.sources = sources
+        self.distances = distance_field(passable, sources)
+        # radius -> flat index (x * height + y) of the best cell within reach of each
+        # cell, -1 until that cell is asked
+        self.next_cells = {}
+
+    def next_cell(self, pos: tuple, radius: int) -> int:
+        next_cells = self.next_cells.get(radius)
+        if next_cells is None:
+            next_cells = self.next_cells[radius] = np_full(self.distances.shape, -1, dtype=np_int64)
+        cell = next_cells[pos[0], pos[1]]
+        if cell < 0:
+            cell = next_cells[pos[0], pos[1]] = descend_cell(
+                self.distances, self.passable, pos[0], pos[1], radius)
+        return cell
+
+    def open_cells(self, cells: list):
+        """Makes the given cells passable, e.g. land melted into water.
+
+        New cells can only shorten the routes, so the distances are lowered from the new
+        cells and their neighbors outwards (see `relax_field`) instead of being rebuilt,
+        and only the steps cached near a lowered cell are forgotten.
+        """
+        xs, ys = np_array(cells, dtype=np_int64).T
+        width, height = self.passable.shape
+        self.passable[xs, ys] = True
+        self.distances[xs, ys] = np_where(self.sources[xs, ys], 0, UNREACHABLE)
+        seeds = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                inside = (xs + dx >= 0) & (xs + dx < width) & (ys + dy >= 0) & (ys + dy < height)
+                seeds.append((xs[inside] + dx) * height + ys[inside] + dy)
+        changed = relax_field(self.distances, self.passable, np_concatenate(seeds))
+        if self.next_cells:
+            lowered = np_zeros(width * height, dtype=bool)
+            lowered[changed] = True
+            lowered[xs * height + ys] = True
+            lowered = lowered.reshape(width, height)
+            for radius, next_cells in self.next_cells.items():
+                next_cells[_dilate(lowered, radius)] = -1
+
+    def close_cells(self, cells: list) -> bool:
+        """Makes the given cells impassable, e.g. melted cells for a field over land.
+
+        Returns:
+            bool: False when the field is no longer valid (one of the cells was on a
+                route, the routes through it would get longer), True when none was
+                reachable and the field is unchanged.
+        """
+        xs, ys = np_array(cells, dtype=np_int64).T
+        if (self.distances[xs, ys] < UNREACHABLE).any():
+            return False
+        self.passable[xs, ys] = False
+        return True
+
+
+class HomingFields:
+    """Shared flow fields leading the agents home, instead of a greedy step per agent.
+
+    Homes are grouped in clusters of `HOMING_VARS["cluster_size"]` cells square. For each
+    cluster and terrain an agent walks on, the distance of every cell to the cluster is
+    computed once (chamfer distance through the passable cells, see `distance_field`), so
+    it routes around land or water. The best cell within `radius` of a cell is worked out
+    the first time an agent steps from there, after which a step home is an array
+    lookup. Inside its home cluster, or where the cluster cannot be reached, an
+    agent falls back to `chase_or_home` towards its exact home.
+
+    When the ice melts, fields over water are updated in place (melted cells open new
+    routes, distances only go down), fields over land are dropped if a melted cell was
+    reachable (and rebuilt when next used), fields over any terrain never change.
+
+    Args:
+        model: The model (dense backend, for its `land_mask`).
+        cluster_size (int): Side of a home cluster in cells (default:
+            `HOMING_VARS["cluster_size"]`).
+    """
+
+    def __init__(self, model, cluster_size: int or None = None):
+        self.model = model
+        self.cluster_size = HOMING_VARS["cluster_size"] if cluster_size is None else cluster_size
+        # (terrain type, cluster) -> FlowField
+        self.fields = {}
+
+    def _passable(self, terrain_type: str or None):
+        land_mask = self.model.land_mask
+        if terrain_type is None:
+            return np_ones(land_mask.shape, dtype=bool)
+        if terrain_type == "land":
+            return land_mask.copy()
+        return ~land_mask
+
+    def get_field(self, home: tuple, terrain_type: str or None = None) -> FlowField or None:
+        """The field leading to the cluster of `home` (None if it has no passable cell)."""
+        size = self.cluster_size
+        cluster = (home[0] // size, home[1] // size)
+        key = (terrain_type, cluster)
+        field = self.fields.get(key)
+        if field is None:
+            passable = self._passable(terrain_type)
+            sources = np_zeros(passable.shape, dtype=bool)
+            sources[cluster[0] * size:(cluster[0] + 1) * size, cluster[1] * size:(cluster[1] + 1) * size] = True
+            if not (sources & passable).any():
+                return None
+            field = self.fields[key] = FlowField(passable, sources)
+        return field
+
+    def step(self, pos: tuple, home: tuple, radius: int, terrain_type: str or None = None) -> tuple or None:
+        """Best cell within `radius` of `pos` on the way to `home`.
+
+        Returns:
+            tuple: (x, y), or None when the agent is already in its home cluster or cannot
+                reach it (use `chase_or_home` then).
+        """
+        if radius < 1:
+            return None
+        field = self.get_field(home, terrain_type)
+        if field is None or field.distances[pos[0], pos[1]] == 0:
+            return None
+        cell = field.next_cell(pos, radius)
+        height = self.model.grid.height
+        x, y = cell // height, cell % height
+        if field.distances[x, y] >= UNREACHABLE:
+            return None
+        return (int(x), int(y))
+
+    def on_melt(self, cells: list):
+        """Updates the fields to the melted land cells (called by the model)."""
+        if not cells:
+            return
+        for key, field in list(self.fields.items()):
+            if key[0] == "water":
+                field.open_cells(cells)
+            elif key[0] == "land" and not field.close_cells(cells):
+                del self.fields[key]
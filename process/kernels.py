@@ -0,0 +1,338 @@
+"""Numeric kernels for the hot loops of the model.
+
+Each kernel has a NumPy implementation and a loop implementation compiled with Numba.
+The Numba versions are used when Numba is installed (and `KERNEL_VARS["backend"]` is
+"auto" or "numba"), otherwise the NumPy versions are used. Both give the same results as
+the original Python loops (same ordering, same tie-breaking), so a run is identical
+under a fixed seed whichever backend is active.
+
+Numba is only imported, and a kernel only compiled, on the first call of that kernel, so
+importing the model (e.g. in short batch jobs that never reach a kernel) stays cheap.
+The backend is read from `KERNEL_VARS` at every call, it can be changed after import.
+"""
+from heapq import heapify, heappop, heappush
+from math import sqrt as math_sqrt
+from numpy import arange as np_arange
+from numpy import argsort as np_argsort
+from numpy import bool_ as np_bool
+from numpy import int64 as np_int64
+from numpy import concatenate as np_concatenate
+from numpy import empty as np_empty
+from numpy import flatnonzero as np_flatnonzero
+from numpy import full as np_full
+from numpy import lexsort as np_lexsort
+from numpy import ones as np_ones
+from numpy import repeat as np_repeat
+from numpy import sqrt as np_sqrt
+from numpy import stack as np_stack
+from numpy import tile as np_tile
+from numpy import unique as np_unique
+from numpy import where as np_where
+from numpy import zeros as np_zeros
+from process import KERNEL_VARS
+
+_NUMBA = {}
+
+
+def get_njit():
+    """Returns `numba.njit`, or None when numba is not installed (imported once)."""
+    if "njit" not in _NUMBA:
+        # numba is slow to import, only done when a kernel first needs it
+        try:
+            from numba import njit
+        except ImportError:
+            njit = None
+        _NUMBA["njit"] = njit
+    return _NUMBA["njit"]
+
+
+def use_numba() -> bool:
+    """Whether the kernels run their Numba versions under the current `KERNEL_VARS`."""
+    backend = KERNEL_VARS["backend"]
+    if backend == "numpy":
+        return False
+    if get_njit() is None:
+        if backend == "numba":
+            raise ImportError("KERNEL_VARS['backend'] is 'numba' but numba is not installed")
+        return False
+    return True
+
+
+class Kernel:
+    """A kernel calling its NumPy or its Numba version, the latter compiled on first use.
+
+    Args:
+        numpy_impl (callable): NumPy implementation.
+        loop_impl (callable): Loop implementation, compiled with `numba.njit`.
+    """
+
+    def __init__(self, numpy_impl, loop_impl):
+        self.numpy_impl = numpy_impl
+        self.loop_impl = loop_impl
+        self.numba_impl = None
+        self._backend = None
+        self._impl = None
+
+    def __call__(self, *args):
+        if KERNEL_VARS["backend"] != self._backend:
+            self._select()
+        return self._impl(*args)
+
+    def _select(self):
+        if use_numba():
+            if self.numba_impl is None:
+                self.numba_impl = get_njit()(cache=True)(self.loop_impl)
+            self._impl = self.numba_impl
+        else:
+            self._impl = self.numpy_impl
+        self._backend = KERNEL_VARS["backend"]
+
+
+# flow fields (see process/homing.py): integer chamfer costs of a step, so both backends
+# give the same distances, and the distance of the cells that cannot reach the sources
+STEP_COST = 5
+DIAGONAL_STEP_COST = 7
+UNREACHABLE = 1 << 40
+_STEPS = [
+    (dx, dy, DIAGONAL_STEP_COST if dx and dy else STEP_COST)
+    for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+
+
+# ---------------------------------------------------------------------------
+# NumPy implementations
+# ---------------------------------------------------------------------------
+def _nearest_indices_numpy(xs, ys, target_x, target_y, k):
+    dist = np_sqrt((target_x - xs) ** 2 + (target_y - ys) ** 2)
+    return np_argsort(dist, kind="stable")[:k]
+
+
+def _farthest_indices_numpy(xs, ys, enemy_xs, enemy_ys, k):
+    # sum enemy by enemy, in order, like the original loop (same float rounding)
+    total_dis = np_zeros(len(xs))
+    for i in range(len(enemy_xs)):
+        total_dis += np_sqrt((enemy_xs[i] - xs) ** 2 + (enemy_ys[i] - ys) ** 2)
+    return np_argsort(-total_dis, kind="stable")[:k]
+
+
+def _neighborhood_numpy(x, y, radius, land_mask, include_center, want_land):
+    width, height = land_mask.shape
+    xs = np_arange(max(0, x - radius), min(width, x + radius + 1))
+    ys = np_arange(max(0, y - radius), min(height, y + radius + 1))
+    all_xs = np_repeat(xs, len(ys))
+    all_ys = np_tile(ys, len(xs))
+    keep = np_ones(len(all_xs), dtype=bool)
+    if not include_center:
+        keep &= (all_xs != x) | (all_ys != y)
+    if want_land >= 0:
+        keep &= land_mask[all_xs, all_ys] == bool(want_land)
+    return np_stack((all_xs[keep], all_ys[keep]), axis=1)
+
+
+def _edge_mask_numpy(land_mask):
+    # cells outside the map are not water
+    width, height = land_mask.shape
+    padded = np_ones((width + 2, height + 2), dtype=bool)
+    padded[1:-1, 1:-1] = land_mask
+    surrounded = padded[2:, 1:-1] & padded[:-2, 1:-1] & padded[1:-1, 2:] & padded[1:-1, :-2]
+    return land_mask & ~surrounded
+
+
+def _threshold_mask_numpy(img_data, threshold):
+    return (img_data > threshold).T.copy()
+
+
+def _relax_field_numpy(dist, passable, cells):
+    # label-correcting frontier: only the cells lowered by the last pass are expanded
+    width, height = dist.shape
+    flat_dist = dist.reshape(-1)
+    changed = np_zeros(width * height, dtype=bool)
+    frontier = np_unique(cells)
+    while len(frontier):
+        frontier_dist = flat_dist[frontier]
+        reached = frontier_dist < UNREACHABLE
+        frontier_x = frontier[reached] // height
+        frontier_y = frontier[reached] % height
+        frontier_dist = frontier_dist[reached]
+        targets = []
+        target_dist = []
+        for dx, dy, cost in _STEPS:
+            new_x = frontier_x + dx
+            new_y = frontier_y + dy
+            inside = (new_x >= 0) & (new_x < width) & (new_y >= 0) & (new_y < height)
+            new_x = new_x[inside]
+            new_y = new_y[inside]
+            new_dist = frontier_dist[inside] + cost
+            better = passable[new_x, new_y] & (new_dist < dist[new_x, new_y])
+            targets.append(new_x[better] * height + new_y[better])
+            target_dist.append(new_dist[better])
+        targets = np_concatenate(targets)
+        target_dist = np_concatenate(target_dist)
+        # lowest distance reaching each cell
+        order = np_lexsort((target_dist, targets))
+        targets = targets[order]
+        target_dist = target_dist[order]
+        first = np_ones(len(targets), dtype=bool)
+        first[1:] = targets[1:] != targets[:-1]
+        frontier = targets[first]
+        flat_dist[frontier] = target_dist[first]
+        changed[frontier] = True
+    return np_flatnonzero(changed)
+
+
+def _descend_cell_numpy(field, passable, x, y, radius):
+    # first cell (in neighborhood order) of lowest distance in the window
+    width, height = field.shape
+    x0 = max(0, x - radius)
+    x1 = min(width, x + radius + 1)
+    y0 = max(0, y - radius)
+    y1 = min(height, y + radius + 1)
+    window = np_where(passable[x0:x1, y0:y1], field[x0:x1, y0:y1], UNREACHABLE)
+    best = int(window.argmin())
+    if window.flat[best] >= UNREACHABLE:
+        return x * height + y
+    return (x0 + best // (y1 - y0)) * height + y0 + best % (y1 - y0)
+
+
+# ---------------------------------------------------------------------------
+# Numba implementations
+# ---------------------------------------------------------------------------
+def _nearest_indices_loop(xs, ys, target_x, target_y, k):
+    dist = np_empty(len(xs))
+    for i in range(len(xs)):
+        dist[i] = math_sqrt((target_x - xs[i]) ** 2 + (target_y - ys[i]) ** 2)
+    return np_argsort(dist, kind="mergesort")[:k]
+
+
+def _farthest_indices_loop(xs, ys, enemy_xs, enemy_ys, k):
+    total_dis = np_zeros(len(xs))
+    for j in range(len(xs)):
+        for i in range(len(enemy_xs)):
+            total_dis[j] += math_sqrt((enemy_xs[i] - xs[j]) ** 2 + (enemy_ys[i] - ys[j]) ** 2)
+    return np_argsort(-total_dis, kind="mergesort")[:k]
+
+
+def _neighborhood_loop(x, y, radius, land_mask, include_center, want_land):
+    width, height = land_mask.shape
+    x0 = max(0, x - radius)
+    x1 = min(width, x + radius + 1)
+    y0 = max(0, y - radius)
+    y1 = min(height, y + radius + 1)
+    cells = np_empty(((x1 - x0) * (y1 - y0), 2), dtype=np_int64)
+    n = 0
+    for new_x in range(x0, x1):
+        for new_y in range(y0, y1):
+            if not include_center and new_x == x and new_y == y:
+                continue
+            if want_land >= 0 and land_mask[new_x, new_y] != (want_land == 1):
+                continue
+            cells[n, 0] = new_x
+            cells[n, 1] = new_y
+            n += 1
+    return cells[:n]
+
+
+def _edge_mask_loop(land_mask):
+    width, height = land_mask.shape
+    edges = np_zeros((width, height), dtype=np_bool)
+    for x in range(width):
+        for y in range(height):
+            if not land_mask[x, y]:
+                continue
+            if ((y + 1 < height and not land_mask[x, y + 1]) or
+                    (x + 1 < width and not land_mask[x + 1, y]) or
+                    (y > 0 and not land_mask[x, y - 1]) or
+                    (x > 0 and not land_mask[x - 1, y])):
+                edges[x, y] = True
+    return edges
+
+
+def _threshold_mask_loop(img_data, threshold):
+    height, width = img_data.shape
+    mask = np_zeros((width, height), dtype=np_bool)
+    for x in range(width):
+        for y in range(height):
+            # numpy arrays are indexed [row, col], i.e. [y, x]
+            mask[x, y] = img_data[y, x] > threshold
+    return mask
+
+
+def _relax_field_loop(dist, passable, cells):
+    # Dijkstra from the given cells, at their current distances
+    width, height = dist.shape
+    changed = np_zeros(width * height, dtype=np_bool)
+    heap = [(np_int64(0), np_int64(0))]
+    heap.pop()
+    for i in range(len(cells)):
+        x = cells[i] // height
+        y = cells[i] % height
+        if dist[x, y] < UNREACHABLE:
+            heap.append((dist[x, y], np_int64(cells[i])))
+    heapify(heap)
+    while heap:
+        d, cell = heappop(heap)
+        x = cell // height
+        y = cell % height
+        if d > dist[x, y]:
+            continue
+        for dx in range(-1, 2):
+            for dy in range(-1, 2):
+                if dx == 0 and dy == 0:
+                    continue
+                new_x = x + dx
+                new_y = y + dy
+                if new_x < 0 or new_x >= width or new_y < 0 or new_y >= height or not passable[new_x, new_y]:
+                    continue
+                new_d = d + (DIAGONAL_STEP_COST if dx != 0 and dy != 0 else STEP_COST)
+                if new_d < dist[new_x, new_y]:
+                    dist[new_x, new_y] = new_d
+                    changed[new_x * height + new_y] = True
+                    heappush(heap, (new_d, np_int64(new_x * height + new_y)))
+    n = 0
+    for cell in range(width * height):
+        if changed[cell]:
+            n += 1
+    changed_cells = np_empty(n, dtype=np_int64)
+    n = 0
+    for cell in range(width * height):
+        if changed[cell]:
+            changed_cells[n] = cell
+            n += 1
+    return changed_cells
+
+
+def _descend_cell_loop(field, passable, x, y, radius):
+    width, height = field.shape
+    best = UNREACHABLE
+    next_cell = x * height + y
+    for new_x in range(max(0, x - radius), min(width, x + radius + 1)):
+        for new_y in range(max(0, y - radius), min(height, y + radius + 1)):
+            if passable[new_x, new_y] and field[new_x, new_y] < best:
+                best = field[new_x, new_y]
+                next_cell = new_x * height + new_y
+    return next_cell
+
+
+nearest_indices = Kernel(_nearest_indices_numpy, _nearest_indices_loop)
+farthest_indices = Kernel(_farthest_indices_numpy, _farthest_indices_loop)
+neighborhood = Kernel(_neighborhood_numpy, _neighborhood_loop)
+edge_mask = Kernel(_edge_mask_numpy, _edge_mask_loop)
+threshold_mask = Kernel(_threshold_mask_numpy, _threshold_mask_loop)
+relax_field = Kernel(_relax_field_numpy, _relax_field_loop)
+descend_cell = Kernel(_descend_cell_numpy, _descend_cell_loop)
+
+
+def distance_field(passable, sources):
+    """Chamfer distance (`STEP_COST` / `DIAGONAL_STEP_COST` a step) of every cell to the sources.
+
+    Args:
+        passable (numpy.ndarray): Bool mask of the cells that can be crossed.
+        sources (numpy.ndarray): Bool mask of the cells at distance 0.
+
+    Returns:
+        numpy.ndarray: int64 distances, `UNREACHABLE` for the cells that cannot reach a
+            passable source.
+    """
+    dist = np_full(passable.shape, UNREACHABLE, dtype=np_int64)
+    dist[sources & passable] = 0
+    relax_field(dist, passable, np_flatnonzero(sources & passable))
+    return dist
@@ -0,0 +1,277 @@
+from collections.abc import Mapping
+from hashlib import sha1
+from numpy import asarray as np_asarray
+from numpy import concatenate as np_concatenate
+from numpy import cumsum as np_cumsum
+from numpy import empty as np_empty
+from numpy import int32 as np_int32
+from numpy import load as np_load
+from numpy import nonzero as np_nonzero
+from numpy import packbits as np_packbits
+from numpy import savez_compressed as np_savez_compressed
+from numpy import stack as np_stack
+from numpy import zeros as np_zeros
+from numpy.random import default_rng
+from process import CLIMATE_VARS
+from process.kernels import edge_mask
+
+
+def get_terrain_digest(land_mask) -> str:
+    """Short fingerprint of a land mask, to check a timeline is replayed on its own terrain."""
+    land_mask = np_asarray(land_mask, dtype=bool)
+    return sha1(str(land_mask.shape).encode() + np_packbits(land_mask).tobytes()).hexdigest()[:16]
+
+
+class MeltTimeline:
+    """Pre-generated ice melt: the land cells turning to water at every step.
+
+    Melting only depends on the terrain and on random draws, never on the agents, so it
+    can be generated once (see `generate`) and replayed by any number of runs
+    (`SealPenguinFishModel(melt_timeline=...)`), e.g. to compare agent parameter sets
+    under the exact same climate trajectory.
+
+    The process is the same as `SealPenguinFishModel.update_ice_dynamics`: every step,
+    each land cell with a water cell among its 4 neighbors melts with probability
+    `stability_index`. The draws come from the timeline's own generator (`seed`) rather
+    than the global `random` module, so a replayed run is statistically (not exactly)
+    equivalent to a live one.
+
+    Cells are stored as one (n, 2) array with per-step offsets.
+
+    Args:
+        cells (numpy.ndarray): (n, 2) array of melted (x, y), ordered by step.
+        offsets (numpy.ndarray): Step i melted `cells[offsets[i]:offsets[i + 1]]`.
+        width (int): Grid width.
+        height (int): Grid height.
+        stability_index (float): Melt probability of an edge cell per step.
+        seed (int, optional): Seed used to generate the timeline.
+        terrain_digest (str, optional): `get_terrain_digest` of the initial land mask.
+    """
+
+    def __init__(
+            self,
+            cells,
+            offsets,
+            width: int,
+            height: int,
+            stability_index: float,
+            seed: int or None = None,
+            terrain_digest: str or None = None):
+        self.cells = cells
+        self.offsets = offsets
+        self.width = width
+        self.height = height
+        self.stability_index = stability_index
+        self.seed = seed
+        self.terrain_digest = terrain_digest
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def cells_at(self, step: int) -> list:
+        """Returns the cells melting at step `step` (0 based) as a list of (x, y)."""
+        if not 0 <= step < len(self):
+            raise IndexError(f"the melt timeline covers steps 0 to {len(self) - 1}, not {step}")
+        return [(x, y) for x, y in self.cells[self.offsets[step]:self.offsets[step + 1]].tolist()]
+
+    def check(self, land_mask=None, stability_index: float or None = None, timesteps: int or None = None):
+        """Makes sure the timeline can be replayed, before a run rather than partway through it.
+
+        Args:
+            land_mask (numpy.ndarray, optional): Initial terrain of the run (True for land):
+                same grid size and, if the timeline has one, same `terrain_digest`.
+            stability_index (float, optional): Ice stability index of the run.
+            timesteps (int, optional): Number of steps of the run.
+
+        Raises:
+            ValueError: If the timeline was made for another terrain, another stability
+                index or fewer steps.
+        """
+        if land_mask is not None:
+            land_mask = np_asarray(land_mask, dtype=bool)
+            if land_mask.shape != (self.width, self.height):
+                raise ValueError(
+                    f"the melt timeline is for a {self.width} x {self.height} grid, "
+                    f"not {land_mask.shape[0]} x {land_mask.shape[1]}")
+            if self.terrain_digest is not None and get_terrain_digest(land_mask) != self.terrain_digest:
+                raise ValueError("the melt timeline was generated on another terrain")
+        if stability_index is not None and stability_index != self.stability_index:
+            raise ValueError(
+                f"the melt timeline uses ice_stability_index={self.stability_index}, not {stability_index}")
+        if timesteps is not None and len(self) < timesteps:
+            raise ValueError(f"the melt timeline covers {len(self)} steps, not {timesteps}")
+
+    def land_mask_at(self, land_mask, step: int):
+        """Returns the land mask after step `step`, from the initial mask the timeline was made for."""
+        land_mask = np_asarray(land_mask, dtype=bool).copy()
+        melted = self.cells[:self.offsets[step + 1]]
+        land_mask[melted[:, 0], melted[:, 1]] = False
+        return land_mask
+
+    @classmethod
+    def generate(
+            cls,
+            land_mask,
+            timesteps: int,
+            stability_index: float or None = None,
+            seed: int or None = None):
+        """Runs the ice dynamics alone on a land mask.
+
+        Args:
+            land_mask (numpy.ndarray): Initial terrain, bool array indexed [x, y] (True for land).
+            timesteps (int): Number of steps to generate.
+            stability_index (float, optional): Melt probability per step of an edge cell
+                (default: `CLIMATE_VARS["ice_stability_index"]`).
+            seed (int, optional): Seed of the generator.
+
+        Returns:
+            MeltTimeline: The melt of every step.
+        """
+        if stability_index is None:
+            stability_index = CLIMATE_VARS["ice_stability_index"]
+        land_mask = np_asarray(land_mask, dtype=bool)
+        terrain_digest = get_terrain_digest(land_mask)
+        land_mask = land_mask.copy()
+        rng = default_rng(seed)
+
+        steps = []
+        for _ in range(timesteps):
+            edge_xs, edge_ys = np_nonzero(edge_mask(land_mask))
+            melt = rng.random(len(edge_xs)) < stability_index
+            melted_xs = edge_xs[melt]
+            melted_ys = edge_ys[melt]
+            land_mask[melted_xs, melted_ys] = False
+            steps.append(np_stack((melted_xs, melted_ys), axis=1).astype(np_int32))
+
+        offsets = np_zeros(timesteps + 1, dtype=int)
+        offsets[1:] = np_cumsum([len(step) for step in steps])
+        cells = np_concatenate(steps) if steps else np_empty((0, 2), dtype=np_int32)
+        width, height = land_mask.shape
+        return cls(cells, offsets, width, height, stability_index, seed, terrain_digest)
+
+    @classmethod
+    def from_model(
+            cls,
+            model,
+            timesteps: int,
+            stability_index: float or None = None,
+            seed: int or None = None):
+        """Same as `generate`, on the current terrain of a model (dense or sparse)."""
+        land_mask = model.land_mask if model.land_mask is not None else model.terrain.to_mask()
+        return cls.generate(land_mask, timesteps, stability_index=stability_index, seed=seed)
+
+    def save(self, path: str):
+        """Saves the timeline to a compressed .npz file."""
+        np_savez_compressed(
+            path,
+            cells=self.cells,
+            offsets=self.offsets,
+            shape=(self.width, self.height),
+            stability_index=self.stability_index,
+            seed=-1 if self.seed is None else self.seed,
+            terrain_digest="" if self.terrain_digest is None else self.terrain_digest)
+
+    @classmethod
+    def load(cls, path: str):
+        """Loads a timeline written by `save`."""
+        data = np_load(path)
+        width, height = data["shape"].tolist()
+        seed = int(data["seed"])
+        terrain_digest = str(data["terrain_digest"])
+        return cls(
+            data["cells"],
+            data["offsets"],
+            width,
+            height,
+            float(data["stability_index"]),
+            None if seed == -1 else seed,
+            terrain_digest or None)
+
+
+class TerrainHistory(Mapping):
+    """Land cells at the end of every step, rebuilt from the melted cells when asked.
+
+    Only the initial land (a copy of the land cell set, or for the sparse backend a
+    `TiledTerrain.snapshot` sharing the tile loader) and the cells melted at each step
+    are kept, instead of a copy of every land cell per step, which on the sparse backend
+    also read every coastal tile of the map. A step is rebuilt when it is looked up, from
+    the last one looked up if it is not later, so reading the steps in order only
+    applies the melts in between.
+
+    It reads like the `{time: [(x, y), ...]}` dict `run_model` used to return.
+
+    Args:
+        initial: Land cells before the first recorded step, a set of (x, y) or a
+            `TiledTerrain` (owned by the history).
+    """
+
+    def __init__(self, initial):
+        self._initial = initial
+        self._melted = {}
+        # (time, land cells) of the last step looked up
+        self._cursor = None
+
+    @classmethod
+    def from_model(cls, model):
+        """Starts the history at the current terrain of `model` (dense or sparse)."""
+        from process.space import TiledTerrain
+
+        if isinstance(model.terrain, TiledTerrain):
+            return cls(model.terrain.snapshot())
+        return cls(set(model.land_cells))
+
+    def record(self, time: int, melted_cells: list):
+        """Stores the cells melted in step `time` (steps are recorded in order)."""
+        self._melted[time] = list(melted_cells)
+
+    def __getitem__(self, time: int) -> list:
+        return list(self.land_cells_at(time))
+
+    def __contains__(self, time) -> bool:
+        return time in self._melted
+
+    def __iter__(self):
+        return iter(self._melted)
+
+    def __len__(self) -> int:
+        return len(self._melted)
+
+    def land_cells_at(self, time: int):
+        """Set-like land cells at the end of step `time` (-1 for the initial ones).
+
+        The result is the history's own working copy: it must not be modified and is
+        only valid until the next lookup.
+        """
+        from process.space import LandCells, TiledTerrain
+
+        if time != -1 and time not in self._melted:
+            raise KeyError(time)
+        if self._cursor is None or self._cursor[0] > time:
+            if isinstance(self._initial, TiledTerrain):
+                land_cells = LandCells(self._initial.snapshot())
+            else:
+                land_cells = set(self._initial)
+            self._cursor = (-1, land_cells)
+        start, land_cells = self._cursor
+        for step in range(start + 1, time + 1):
+            for cell in self._melted.get(step, ()):
+                land_cells.discard(cell)
+        self._cursor = (time, land_cells)
+        return land_cells
+
+    def count_at(self, time: int) -> int:
+        """Number of land cells at the end of step `time`, without listing them."""
+        if time != -1 and time not in self._melted:
+            raise KeyError(time)
+        count = len(self._initial) if isinstance(self._initial, set) else self._initial.count_land()
+        return count - sum(len(cells) for step, cells in self._melted.items() if step <= time)
+
+    def __getstate__(self):
+        from process.space import TiledTerrain
+
+        # the tile loader reads the basemap, the copy holds every tile instead
+        state = dict(self.__dict__)
+        if isinstance(self._initial, TiledTerrain):
+            state["_initial"] = self._initial.snapshot(read_all=True)
+        state["_cursor"] = None
+        return state
@@ -0,0 +1,327 @@
+from asyncio import Queue, QueueEmpty, IncompleteReadError, TimeoutError
+from asyncio import current_task, gather, new_event_loop, run_coroutine_threadsafe, shield, start_server, wait_for
+from base64 import b64encode
+from hashlib import sha1
+from json import dumps as json_dumps
+from struct import pack as struct_pack
+from struct import unpack as struct_unpack
+from threading import Thread
+from process.animal import TYPE_NAMES, STATUS_NAMES
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+MONITOR_PAGE = """<!DOCTYPE html>
+<html><head><title>Live monitor</title></head>
+<body style="font-family: monospace">
+<div id="info">connecting...</div>
+<canvas id="map" style="border: 1px solid #888; image-rendering: pixelated"></canvas>
+<script>
+const colors = {fish: "green", penguin: "blue", seal: "red"};
+const canvas = document.getElementById("map"), ctx = canvas.getContext("2d");
+let agents = new Map(), melted = [], scale = 3, height = 0;
+function draw(msg) {
+  ctx.fillStyle = "#dde"; ctx.fillRect(0, 0, canvas.width, canvas.height);
+  ctx.fillStyle = "#88a";
+  for (const [x, y] of melted) ctx.fillRect(x * scale, (height - 1 - y) * scale, scale, scale);
+  for (const [type, id, x, y, status] of agents.values()) {
+    ctx.fillStyle = status === "dead" ? "black" : colors[type];
+    ctx.fillRect(x * scale, (height - 1 - y) * scale, scale, scale);
+  }
+  document.getElementById("info").textContent = "time " + msg.time + "  " + JSON.stringify(msg.census);
+}
+const ws = new WebSocket("ws://" + location.host + "/ws");
+ws.onmessage = (event) => {
+  const msg = JSON.parse(event.data);
+  if (msg.event === "snapshot") {
+    height = msg.height; canvas.width = msg.width * scale; canvas.height = msg.height * scale;
+    agents = new Map(); melted = msg.melted;
+  } else if (msg.event === "step") {
+    melted.push(...msg.melted);
+    for (const key of msg.removed) agents.delete(key.join(":"));
+  } else if (msg.event === "done") {
+    document.getElementById("info").textContent += "  (done)"; return;
+  }
+  for (const agent of msg.agents) agents.set(agent[0] + ":" + agent[1], agent);
+  draw(msg);
+};
+</script>
+</body></html>
+"""
+
+
+def get_census(model) -> dict:
+    """Number of agents by type and status, e.g. {"fish": {"alive": 480, "dead": 20}, ...}."""
+    census = {}
+    for agent in model.schedule.agents:
+        counts = census.setdefault(TYPE_NAMES[agent.type], {})
+        status = STATUS_NAMES[agent.status]
+        counts[status] = counts.get(status, 0) + 1
+    return census
+
+
+class _Client:
+    def __init__(self, writer, websocket: bool):
+        self.writer = writer
+        self.websocket = websocket
+        self.queue = Queue()
+        self.resync = False
+        self.send_task = None
+
+    async def send(self, message: str):
+        data = message.encode()
+        if self.websocket:
+            # server -> client text frame (unmasked, single fragment)
+            if len(data) < 126:
+                header = struct_pack("!BB", 0x81, len(data))
+            elif len(data) < 2 ** 16:
+                header = struct_pack("!BBH", 0x81, 126, len(data))
+            else:
+                header = struct_pack("!BBQ", 0x81, 127, len(data))
+            self.writer.write(header + data)
+        else:
+            self.writer.write(data + b"\n")
+        await self.writer.drain()
+
+
+class LiveMonitor:
+    """Local HTTP/WebSocket server streaming per-step deltas of a running model.
+
+    The server runs an asyncio loop in a background thread. After each step the model
+    thread calls `publish`, which computes a compact delta and hands it to the loop
+    without waiting for the clients:
+
+    - `http://host:port/` is a small browser view (map + census),
+    - `ws://host:port/ws` streams JSON messages over a WebSocket,
+    - `http://host:port/stream` streams the same messages as JSON lines (e.g. `curl -N`).
+
+    Every client first gets a "snapshot" message (all agents, all melted cells so far),
+    then one "step" message per step:
+
+        {"event": "step", "time": 12, "census": {"fish": {"alive": 480, "dead": 20}, ...},
+         "agents": [[type, id, x, y, status], ...],   # agents that moved or changed status
+         "removed": [[type, id], ...],
+         "melted": [[x, y], ...]}
+
+    and a "done" message when the run ends.
+
+    Backpressure: each client has a bounded queue. When a slow client lets its queue fill
+    up, its pending deltas are dropped and it gets a fresh snapshot instead, so the model
+    never waits for a client and a slow client never grows memory.
+
+    Args:
+        host (str): Interface to listen on (default: "127.0.0.1", local only).
+        port (int): Port to listen on, 0 picks a free one (see `port` after `start`).
+        queue_size (int): Messages buffered per client before it is resynced (default: 64).
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765, queue_size: int = 64):
+        self.host = host
+        self.port = port
+        self.queue_size = queue_size
+        self.clients = set()
+
+        self._loop = None
+        self._thread = None
+        self._server = None
+        self._handlers = set()
+
+        # model thread: last published (status, x, y) of each agent
+        self._last = {}
+        # loop thread: current view of the run, used for the snapshots
+        self._agents = {}
+        self._melted = []
+        self._census = {}
+        self._time = -1
+        self._size = (0, 0)
+
+    def start(self):
+        """Starts the server in a background thread (returns once it is listening)."""
+        self._loop = new_event_loop()
+        self._thread = Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self._server = run_coroutine_threadsafe(
+            start_server(self._handle, self.host, self.port), self._loop).result()
+        self.port = self._server.sockets[0].getsockname()[1]
+        print(f"live monitor on http://{self.host}:{self.port}/")
+        return self
+
+    def publish(self, model, time: int):
+        """Sends the changes since the last call to the clients (called from the model thread)."""
+        agents = []
+        current = {}
+        for agent in model.schedule.agents:
+            key = (agent.type, agent.id)
+            state = (agent.status, agent.pos[0], agent.pos[1])
+            current[key] = state
+            if self._last.get(key) != state:
+                agents.append([TYPE_NAMES[agent.type], agent.id, state[1], state[2], STATUS_NAMES[state[0]]])
+        removed = [[TYPE_NAMES[key[0]], key[1]] for key in self._last if key not in current]
+        self._last = current
+
+        message = {
+            "event": "step",
+            "time": time,
+            "census": get_census(model),
+            "agents": agents,
+            "removed": removed,
+            "melted": [[x, y] for x, y in model.melted_cells],
+        }
+        self._loop.call_soon_threadsafe(self._broadcast, message, (model.grid.width, model.grid.height))
+
+    def close(self):
+        """Sends "done" to the clients and stops the server."""
+        if self._loop is None:
+            return
+        run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+    # -----------------------------------------------------------------------
+    # loop thread
+    # -----------------------------------------------------------------------
+    def _apply(self, message: dict, size: tuple):
+        self._size = size
+        self._time = message["time"]
+        self._census = message["census"]
+        for agent in message["agents"]:
+            self._agents[(agent[0], agent[1])] = agent
+        for key in message["removed"]:
+            self._agents.pop(tuple(key), None)
+        self._melted.extend(message["melted"])
+
+    def _snapshot(self) -> str:
+        return json_dumps({
+            "event": "snapshot",
+            "time": self._time,
+            "width": self._size[0],
+            "height": self._size[1],
+            "census": self._census,
+            "agents": list(self._agents.values()),
+            "melted": self._melted,
+        })
+
+    def _enqueue(self, client: _Client, message: str):
+        if client.resync:
+            return
+        if client.queue.qsize() >= self.queue_size:
+            # the client is too slow: forget its backlog, it gets a snapshot instead
+            while True:
+                try:
+                    client.queue.get_nowait()
+                except QueueEmpty:
+                    break
+            client.resync = True
+            message = None
+        client.queue.put_nowait(message)
+
+    def _broadcast(self, message: dict, size: tuple):
+        self._apply(message, size)
+        if not self.clients:
+            return
+        message = json_dumps(message)
+        for client in self.clients:
+            self._enqueue(client, message)
+
+    async def _shutdown(self, timeout: float = 5.0):
+        message = json_dumps({"event": "done", "time": self._time, "census": self._census})
+        for client in list(self.clients):
+            client.queue.put_nowait(message)
+            client.queue.put_nowait("")
+        for client in list(self.clients):
+            # let the clients flush, without waiting forever for a stuck one
+            try:
+                await wait_for(shield(client.send_task), timeout)
+                client.writer.close()
+            except (TimeoutError, ConnectionError):
+                client.writer.transport.abort()
+        await gather(*self._handlers, return_exceptions=True)
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        handler = current_task()
+        self._handlers.add(handler)
+        try:
+            await self._respond(reader, writer)
+        finally:
+            self._handlers.discard(handler)
+
+    async def _respond(self, reader, writer):
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+        except (IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        lines = request.decode(errors="replace").split("\r\n")
+        parts = lines[0].split(" ")
+        path = parts[1] if len(parts) > 1 else "/"
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        if path == "/ws" and "sec-websocket-key" in headers:
+            accept = b64encode(sha1((headers["sec-websocket-key"] + WEBSOCKET_GUID).encode()).digest()).decode()
+            writer.write((
+                "HTTP/1.1 101 Switching Protocols\r\n"
+                "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+            await self._serve(_Client(writer, True), reader)
+        elif path == "/stream":
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n")
+            await self._serve(_Client(writer, False), reader)
+        elif path == "/":
+            body = MONITOR_PAGE.encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: text/html; charset=utf-8\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body)
+            await writer.drain()
+            writer.close()
+        else:
+            writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+            writer.close()
+
+    async def _sender(self, client: _Client):
+        while True:
+            message = await client.queue.get()
+            if message is None:
+                client.resync = False
+                message = self._snapshot()
+            elif message == "":
+                if client.websocket:
+                    client.writer.write(b"\x88\x00")
+                    await client.writer.drain()
+                break
+            await client.send(message)
+
+    async def _serve(self, client: _Client, reader):
+        # the snapshot and the deltas after it are queued in the same loop iteration
+        client.queue.put_nowait(self._snapshot())
+        self.clients.add(client)
+        client.send_task = self._loop.create_task(self._sender(client))
+        try:
+            # the clients are not expected to send anything, this only detects disconnects
+            # (and WebSocket close frames)
+            while not client.send_task.done():
+                header = await reader.read(2)
+                if not header or (client.websocket and header[0] & 0x0F == 0x8):
+                    break
+                if client.websocket:
+                    length = header[1] & 0x7F
+                    if length == 126:
+                        length = struct_unpack("!H", await reader.readexactly(2))[0]
+                    elif length == 127:
+                        length = struct_unpack("!Q", await reader.readexactly(8))[0]
+                    await reader.readexactly(length + (4 if header[1] & 0x80 else 0))
+        except (IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.clients.discard(client)
+            client.send_task.cancel()
+            client.writer.close()
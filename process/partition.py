@@ -0,0 +1,575 @@
+from bisect import bisect_right
+from multiprocessing import Pipe, Process
+from random import seed as random_seed
+from time import perf_counter
+from traceback import format_exc
+from mesa import Agent
+from pandas import DataFrame
+from pandas import concat as pandas_concat
+import process
+from process import PARAMS, TOTAL_TIMESTEPS
+from process.animal import decode_output, FISH, PENGUIN, SEAL, HUNT, DEAD
+from process.fish import Fish
+from process.melt import TerrainHistory
+from process.penguin import Penguin
+from process.seal import Seal
+
+AGENT_CLASSES = {cls.type: cls for cls in (Fish, Penguin, Seal)}
+
+# config dicts of `process` copied to the workers (spawned workers import the defaults)
+CONFIG_NAMES = (
+    "SPACE_VARS", "PLACEMENT_VARS", "HOMING_VARS", "PREY_SEARCH_VARS", "KERNEL_VARS", "CLIMATE_VARS", "PARAMS")
+
+
+# who can see an agent of each type from another tile: (type name, vision) of the observers
+OBSERVERS = {
+    FISH: [("penguin", "hunt")],
+    PENGUIN: [("seal", "hunt"), ("fish", "escape")],
+    SEAL: [("penguin", "escape")],
+}
+
+# attributes a ghost needs to be seen, chased and eaten
+GHOST_KEYS = ("id", "unique_id", "_status", "type")
+
+
+def get_halo_widths() -> dict:
+    """How far from a tile agents must be kept as ghosts, by type code.
+
+    An agent is only needed in a neighbor tile as far as the agents that look for it can
+    see (e.g. fish within the penguins' hunt vision), not as far as the widest vision.
+    """
+    return {
+        agent_type: max(int(PARAMS[name]["vision"][vision]) for name, vision in observers)
+        for agent_type, observers in OBSERVERS.items()}
+
+
+def get_edges(length: int, n_parts: int) -> list:
+    """Splits [0, length) into `n_parts` nearly equal parts, returns their n_parts + 1 edges."""
+    return [round(i * length / n_parts) for i in range(n_parts + 1)]
+
+
+class Tiling:
+    """The grid split into `n_x` x `n_y` tiles, one per worker (rank = column * n_y + row).
+
+    The split of `n_tiles` closest to square tiles is used, e.g. 2 x 2 for 4 tiles on a
+    square map (a prime number of tiles gives strips along x).
+
+    Args:
+        width (int): Grid width.
+        height (int): Grid height.
+        n_tiles (int): Number of tiles.
+        min_size (int): Tiles must be wider and taller than this where the grid is split
+            (the widest halo), so an agent is a ghost in its neighbor tiles only.
+
+    Raises:
+        ValueError: If the tiles would not be larger than `min_size`.
+    """
+
+    def __init__(self, width: int, height: int, n_tiles: int, min_size: int = 0):
+        # ties go to the split with more columns
+        splits = [(n_x, n_tiles // n_x) for n_x in range(n_tiles, 0, -1) if n_tiles % n_x == 0]
+        self.n_x, self.n_y = min(
+            splits, key=lambda split: max(width / split[0], height / split[1]) / min(
+                width / split[0], height / split[1]))
+        self.x_edges = get_edges(width, self.n_x)
+        self.y_edges = get_edges(height, self.n_y)
+        for n_parts, edges in ((self.n_x, self.x_edges), (self.n_y, self.y_edges)):
+            size = min(edges[i + 1] - edges[i] for i in range(n_parts))
+            if n_parts > 1 and size <= min_size:
+                raise ValueError(
+                    f"{self.n_x} x {self.n_y} tiles of {size} cells are not larger than the "
+                    f"{min_size}-cell halo, use fewer workers")
+
+    def __len__(self) -> int:
+        return self.n_x * self.n_y
+
+    def _column(self, x: int) -> int:
+        return min(max(bisect_right(self.x_edges, x) - 1, 0), self.n_x - 1)
+
+    def _row(self, y: int) -> int:
+        return min(max(bisect_right(self.y_edges, y) - 1, 0), self.n_y - 1)
+
+    def owner(self, pos: tuple) -> int:
+        return self._column(pos[0]) * self.n_y + self._row(pos[1])
+
+    def ghost_ranks(self, pos: tuple, halo: int) -> list:
+        """Ranks of the other tiles within `halo` cells (Chebyshev) of `pos`."""
+        x, y = pos
+        owner = self.owner(pos)
+        return [
+            column * self.n_y + row
+            for column in range(self._column(x - halo), self._column(x + halo) + 1)
+            for row in range(self._row(y - halo), self._row(y + halo) + 1)
+            if column * self.n_y + row != owner]
+
+
+def _ghost_state(state: dict) -> dict:
+    ghost = {key: state[key] for key in GHOST_KEYS}
+    ghost["pos"] = state["pos"]
+    return ghost
+
+
+def route_agent(tiling: Tiling, halos: dict, agent_type: int, pos: tuple, status: int, sent: dict) -> tuple:
+    """Works out the ghost messages of one agent after it moved, against what was sent before.
+
+    Args:
+        tiling (Tiling): The tiles of the run.
+        halos (dict): `get_halo_widths()`.
+        agent_type (int): Type code of the agent.
+        pos (tuple): Its position.
+        status (int): Its status.
+        sent (dict): rank -> (x, y, status) of the ghosts of the agent in other tiles.
+
+    Returns:
+        tuple: (owner, new_sent, messages), with messages as (rank, kind) pairs: "new" for
+            a tile that does not have the ghost yet, "update" for a ghost whose position or
+            status changed, "drop" for a tile the agent is no longer near.
+    """
+    owner = tiling.owner(pos)
+    public = (pos[0], pos[1], status)
+    new_sent = {}
+    messages = []
+    for rank in tiling.ghost_ranks(pos, halos[agent_type]):
+        new_sent[rank] = public
+        previous = sent.get(rank)
+        if previous is None:
+            messages.append((rank, "new"))
+        elif previous != public:
+            messages.append((rank, "update"))
+    for rank in sent:
+        if rank not in new_sent and rank != owner:
+            messages.append((rank, "drop"))
+    return owner, new_sent, messages
+
+
+class Domain:
+    """The part of the model owned by one worker.
+
+    Owned agents (in the tile `rank`) are in the schedule and are stepped here. Agents
+    owned by other workers but within their halo of the tile are kept as ghosts: they are
+    on the grid and in the prey registry (so they can be seen, chased and eaten) but they
+    are not stepped, and only their position and status are kept up to date. A kill on a
+    ghost is reported back to its owner, which accepts one kill per prey: the predators
+    of the rejected ones are rolled back (`rollback`).
+
+    The owner remembers which tiles have a ghost of each of its agents and what they
+    were sent, so only the ghosts that moved or changed status are sent every step.
+
+    Args:
+        model: A model without agents (terrain, grid, schedule and registry only).
+        tiling (Tiling): The tiles of the run.
+        rank (int): The tile owned by this domain.
+        halos (dict): `get_halo_widths()`.
+    """
+
+    def __init__(self, model, tiling: Tiling, rank: int, halos: dict):
+        self.model = model
+        self.tiling = tiling
+        self.rank = rank
+        self.halos = halos
+        self.agents = {}
+        self.owned = set()
+        # owned agent key -> {rank: (x, y, status)} of its ghosts in other tiles
+        self.sent = {}
+        self.output = {"id": [], "time": [], "type": [], "status": [], "x": [], "y": [], "terrain": []}
+
+    def _upsert(self, state: dict):
+        key = (state["type"], state["id"])
+        pos = state["pos"]
+        agent = self.agents.get(key)
+        if agent is None:
+            agent = AGENT_CLASSES[state["type"]].__new__(AGENT_CLASSES[state["type"]])
+            Agent.__init__(agent, state["unique_id"], self.model)
+            agent.set_state(state)
+            self.model.grid.place_agent(agent, pos)
+            self.model.registry.add(agent)
+            self.agents[key] = agent
+        else:
+            agent.set_state(state)
+            if agent.pos != pos:
+                agent.move(pos)
+        return key, agent
+
+    def _drop(self, key: tuple):
+        agent = self.agents.pop(key)
+        self.model.registry.remove(agent)
+        self.model.grid.remove_agent(agent)
+        agent.remove()
+
+    def load(self, messages: list, rollbacks: list = ()):
+        """Applies the messages of the other domains and undoes rejected kills.
+
+        Messages are ("own", (state, sent)) for an agent migrating to this tile,
+        ("new", ghost state), ("update", (key, x, y, status)) and ("drop", key) for ghosts.
+        """
+        for kind, payload in messages:
+            if kind == "own":
+                state, sent = payload
+                key, agent = self._upsert(state)
+                self.owned.add(key)
+                self.sent[key] = sent
+                self.model.schedule.add(agent)
+            elif kind == "new":
+                self._upsert(payload)
+            elif kind == "update":
+                key, x, y, status = payload
+                agent = self.agents[key]
+                agent.status = status
+                if agent.pos != (x, y):
+                    agent.move((x, y))
+            elif kind == "drop":
+                self._drop(payload)
+
+        for key, energy_change in rollbacks:
+            self.rollback(key, energy_change)
+
+    def rollback(self, key: tuple, energy_change: float):
+        """Undoes a kill made on a ghost that another predator got first.
+
+        The predator is hungry again and gets back the energy the kill gave it.
+        """
+        agent = self.agents[key]
+        agent.energy += energy_change
+        agent.status = HUNT if agent.energy > 0 else DEAD
+
+    def step(self, melted_cells: list) -> list:
+        """Applies the melt of this step and steps the owned agents.
+
+        Returns:
+            list: (prey key, predator key, energy change) of the kills made on ghosts, the
+                energy change undoing the kill for the predator if it is rejected.
+        """
+        self.model.current_step += 1
+        self.model.apply_melt(melted_cells)
+
+        self.model.kill_log = []
+        self.model.schedule.step()
+        kills = []
+        for predator, prey, energy in self.model.kill_log:
+            prey_key = (prey.type, prey.id)
+            if prey_key not in self.owned:
+                # penguins are fed up to their max energy, seals keep theirs
+                fed = PARAMS["penguin"]["energy"]["max"] if predator.type == PENGUIN else energy
+                kills.append((prey_key, (predator.type, predator.id), energy - fed))
+        self.model.kill_log = None
+        return kills
+
+    def sync(self, time: int, kills: list) -> tuple:
+        """Settles the kills made by other domains, records the step and exports the changes.
+
+        Only the first kill of a prey still alive here is accepted: prey eaten in this
+        domain or by another domain first reject the later kills.
+
+        Returns:
+            tuple: (rejected, messages), the (predator key, energy change) of the rejected
+                kills and the (rank, kind, payload) messages for the other domains (see
+                `load`). Agents that left the tile migrate to their new owner, and stay
+                here as ghosts if they are still within their halo.
+        """
+        rejected = []
+        for prey_key, predator_key, energy_change in kills:
+            prey = self.agents[prey_key]
+            if prey.status == DEAD:
+                rejected.append((predator_key, energy_change))
+            else:
+                prey.status = DEAD
+
+        messages = []
+        for key in list(self.owned):
+            agent = self.agents[key]
+            x, y = agent.pos
+            self.output["id"].append(agent.id)
+            self.output["time"].append(time)
+            self.output["type"].append(agent.type)
+            self.output["status"].append(agent.status)
+            self.output["x"].append(x)
+            self.output["y"].append(y)
+            self.output["terrain"].append(self.model.terrain[x, y])
+
+            owner, sent, routes = route_agent(self.tiling, self.halos, agent.type, (x, y), agent.status, self.sent[key])
+            state = None
+            for rank, kind in routes:
+                if rank == self.rank:
+                    # migrated, but still seen from here: the ghost is up to date already
+                    continue
+                if kind == "new":
+                    state = agent.get_state() if state is None else state
+                    messages.append((rank, "new", _ghost_state(state)))
+                elif kind == "update":
+                    messages.append((rank, "update", (key, x, y, agent.status)))
+                else:
+                    messages.append((rank, "drop", key))
+
+            if owner == self.rank:
+                self.sent[key] = sent
+                continue
+            messages.append((owner, "own", (agent.get_state(), sent)))
+            self.owned.discard(key)
+            del self.sent[key]
+            self.model.schedule.remove(agent)
+            if self.rank not in sent:
+                self._drop(key)
+
+        return rejected, messages
+
+
+def _worker(conn, model_cls, model_kwargs: dict, config: dict, tiling: Tiling, rank: int, halos: dict, seed):
+    try:
+        for name, value in config.items():
+            getattr(process, name).update(value)
+        random_seed(seed)
+        model = model_cls(N_penguins=0, N_seals=0, N_fish=0, **model_kwargs)
+        model.random.seed(seed)
+        domain = Domain(model, tiling, rank, halos)
+
+        while True:
+            cmd, payload = conn.recv()
+            if cmd == "load":
+                domain.load(*payload)
+                conn.send(None)
+            elif cmd == "step":
+                conn.send(domain.step(payload))
+            elif cmd == "sync":
+                conn.send(domain.sync(*payload))
+            elif cmd == "close":
+                conn.send(domain.output)
+                break
+    except Exception:
+        # let the main process fail instead of waiting for this worker forever
+        conn.send(RuntimeError(f"worker {rank} failed: {format_exc()}"))
+    conn.close()
+
+
+def _recv(conn):
+    result = conn.recv()
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def check_partitionable(model):
+    """Raises if `model` uses a feature the partitioned runner does not support.
+
+    Raises:
+        NotImplementedError: With reproduction (births are not routed between the
+            workers), heatmaps or an event log (both are only fed in the workers' models).
+    """
+    if model.pools:
+        raise NotImplementedError("run_partitioned does not support reproduction, set its rates to 0")
+    if model.heatmaps is not None:
+        raise NotImplementedError("run_partitioned does not support heatmaps, use run_model_heatmaps")
+    if model.event_log is not None:
+        raise NotImplementedError("run_partitioned does not support event logs, use run_model_events")
+
+
+def run_partitioned(
+        model,
+        n_workers: int = 2,
+        seed: int or None = None,
+        timesteps: int or None = None,
+        verbose: bool = True) -> tuple:
+    """Runs one model split into tiles, each stepped by its own worker process.
+
+    The map is split into `n_workers` tiles (2D, see `Tiling`). Every step:
+
+    1. the ice melt is computed once (here, on `model`) and sent to all workers,
+    2. each worker steps the agents it owns, seeing the agents of the neighbor tiles
+       within their halo (how far the agents looking for them see, `get_halo_widths`)
+       as ghosts,
+    3. kills made on ghosts are sent to the owners of the prey, which accept the first
+       one (if the prey is still alive) and reject the others, whose predators are then
+       rolled back by their owners,
+    4. each worker sends the position and status of its agents whose ghosts moved or
+       changed status, and the full state of the agents that moved to another tile only.
+
+    Ghosts are one step behind their owner, so runs are statistically (not exactly)
+    equivalent to `run_model`. The `process` config dicts are copied to the workers.
+
+    The tiles must be larger than the widest halo (60 cells with the default penguin
+    hunt vision) where the map is split. Whether it is faster than `run_model` depends on
+    the number of free cores and on the population, measure it with
+    `python -m process.partition` (see `benchmark`) before relying on it for speed: with
+    a single core it is slower, every worker also steps its share of the messages.
+
+    Args:
+        model: A `SealPenguinFishModel` with its initial agents. Its agents are handed to the
+            workers, the model itself is only used to compute the ice melt.
+        n_workers (int): Number of tiles / worker processes (default: 2).
+        seed (int, optional): Seed of the workers' random generators (worker i uses seed + i).
+        timesteps (int, optional): Number of steps (default: `TOTAL_TIMESTEPS`).
+        verbose (bool): Print the step number at every step (default: True).
+
+    Returns:
+        tuple: (output, terrain_history), in the same format as `run_model`.
+
+    Raises:
+        ValueError: If the tiles are not larger than the widest halo.
+        NotImplementedError: If the model uses reproduction, heatmaps or an event log
+            (see `check_partitionable`).
+    """
+    check_partitionable(model)
+    halos = get_halo_widths()
+    tiling = Tiling(model.grid.width, model.grid.height, n_workers, min_size=max(halos.values()))
+    model_kwargs = {
+        "width": model.grid.width,
+        "height": model.grid.height,
+        "space_backend": "sparse" if model.sparse else "dense"}
+    config = {name: getattr(process, name) for name in CONFIG_NAMES}
+
+    # the model keeps the terrain (for the melt), the agents go to the workers
+    owners = {}
+    messages = [[] for _ in range(n_workers)]
+    for agent in list(model.schedule.agents):
+        state = agent.get_state()
+        key = (agent.type, agent.id)
+        owner, sent, routes = route_agent(tiling, halos, agent.type, agent.pos, agent.status, {})
+        owners[key] = owner
+        messages[owner].append(("own", (state, sent)))
+        for rank, _ in routes:
+            messages[rank].append(("new", _ghost_state(state)))
+        model.registry.remove(agent)
+        model.grid.remove_agent(agent)
+        model.schedule.remove(agent)
+
+    conns = []
+    workers = []
+    for rank in range(n_workers):
+        parent_conn, child_conn = Pipe()
+        worker = Process(
+            target=_worker,
+            args=(
+                child_conn, type(model), model_kwargs, config, tiling, rank, halos,
+                None if seed is None else seed + rank),
+            daemon=True)
+        worker.start()
+        conns.append(parent_conn)
+        workers.append(worker)
+
+    for rank, conn in enumerate(conns):
+        conn.send(("load", (messages[rank],)))
+    for conn in conns:
+        _recv(conn)
+
+    terrain_history = TerrainHistory.from_model(model)
+    if timesteps is None:
+        timesteps = TOTAL_TIMESTEPS
+
+    for i in range(timesteps):
+        if verbose:
+            print(f"step {i}")
+        model.update_ice_dynamics()
+        terrain_history.record(i, model.melted_cells)
+
+        for conn in conns:
+            conn.send(("step", model.melted_cells))
+        # in rank order, so the same kill wins whatever the timing of the workers
+        kills = [[] for _ in conns]
+        for conn in conns:
+            for prey_key, predator_key, energy_change in _recv(conn):
+                kills[owners[prey_key]].append((prey_key, predator_key, energy_change))
+
+        for rank, conn in enumerate(conns):
+            conn.send(("sync", (i, kills[rank])))
+        messages = [[] for _ in conns]
+        rejected = []
+        for conn in conns:
+            rank_rejected, rank_messages = _recv(conn)
+            rejected.extend(rank_rejected)
+            for rank, kind, payload in rank_messages:
+                if kind == "own":
+                    owners[(payload[0]["type"], payload[0]["id"])] = rank
+                messages[rank].append((kind, payload))
+
+        rollbacks = [[] for _ in conns]
+        for predator_key, energy_change in rejected:
+            rollbacks[owners[predator_key]].append((predator_key, energy_change))
+        for rank, conn in enumerate(conns):
+            conn.send(("load", (messages[rank], rollbacks[rank])))
+        for conn in conns:
+            _recv(conn)
+
+    output = []
+    for conn in conns:
+        conn.send(("close", None))
+        output.append(DataFrame.from_dict(decode_output(_recv(conn))))
+    for worker in workers:
+        worker.join()
+
+    output = pandas_concat(output, ignore_index=True).sort_values("time", kind="stable", ignore_index=True)
+
+    return output, terrain_history
+
+
+def benchmark(
+        n_workers: list,
+        size: int,
+        population: dict,
+        timesteps: int,
+        seed: int = 1,
+        space_backend: str = "dense") -> dict:
+    """Times `run_model` against `run_partitioned` on the same scenario.
+
+    Args:
+        n_workers (list): Worker counts to time.
+        size (int): Grid width and height.
+        population (dict): Number of agents by type name.
+        timesteps (int): Number of steps.
+        seed (int): Seed of the models (default: 1).
+        space_backend (str): "dense" or "sparse" (default: "dense").
+
+    Returns:
+        dict: Wall time in seconds of "run_model" and of each worker count.
+    """
+    from process.utils import run_model
+    from run import SealPenguinFishModel
+
+    def new_model():
+        random_seed(seed)
+        model = SealPenguinFishModel(
+            N_penguins=population["penguin"], N_seals=population["seal"], N_fish=population["fish"],
+            width=size, height=size, space_backend=space_backend)
+        model.random.seed(seed)
+        return model
+
+    timings = {}
+    model = new_model()
+    start = perf_counter()
+    run_model(model, timesteps=timesteps, verbose=False)
+    timings["run_model"] = perf_counter() - start
+    for n in n_workers:
+        model = new_model()
+        start = perf_counter()
+        run_partitioned(model, n_workers=n, seed=seed, timesteps=timesteps, verbose=False)
+        timings[n] = perf_counter() - start
+    return timings
+
+
+def main(argv: list or None = None) -> dict:
+    from argparse import ArgumentParser
+    from os import cpu_count
+
+    parser = ArgumentParser(description="Time run_partitioned against run_model.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--size", type=int, default=400, help="grid width and height")
+    parser.add_argument("--penguins", type=int, default=500)
+    parser.add_argument("--seals", type=int, default=20)
+    parser.add_argument("--fish", type=int, default=20000)
+    parser.add_argument("--timesteps", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--space-backend", choices=["dense", "sparse"], default="dense")
+    args = parser.parse_args(argv)
+
+    timings = benchmark(
+        args.workers, args.size, {"penguin": args.penguins, "seal": args.seals, "fish": args.fish},
+        args.timesteps, seed=args.seed, space_backend=args.space_backend)
+    print(f"{cpu_count()} CPUs, {args.size} x {args.size}, {args.fish} fish, {args.penguins} penguins, "
+          f"{args.seals} seals, {args.timesteps} steps")
+    reference = timings["run_model"]
+    for name, seconds in timings.items():
+        label = name if name == "run_model" else f"{name} workers"
+        print(f"{label:>12}: {seconds:8.2f} s  (x{reference / seconds:.2f})")
+    return timings
+
+
+if __name__ == "__main__":
+    main()
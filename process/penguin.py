@@ -1,56 +1,81 @@
-from mesa import Agent
+from process.animal import Animal, PENGUIN, FISH, ALIVE, DEAD, HUNT, FULL, WALK, RUN, SPEED_MODE_NAMES
 from math import sqrt
-from process.utils import get_nearest_position, get_random_move_position, chase_or_home, escape_strategy, success_rate
+from process.utils import get_nearest_position, get_random_move_position, chase_or_home, go_home, escape_strategy, success_rate, get_terrain_neighborhood
 from process import INITIAL_LOCATIONS, MAP_SIZE, PARAMS
 from random import gauss
 
-class Penguin(Agent):
-    def __init__(self, unique_id, model, checks: int = 50):
+class Penguin(Animal):
+    type = PENGUIN
+
+    def __init__(self, unique_id, model, checks: int = 50, home: tuple or None = None):
         super().__init__(unique_id, model)
-        self.type = "penguin"
         self.id = unique_id
-        self.status = "hunt"
+        self.status = HUNT
         max_energy = PARAMS["penguin"]["energy"]["max"]
         self.energy = int(gauss(mu=max_energy, sigma=max_energy/4))
         # self.full_speed = True
         # self.water_travel_distance = 0.0
-        self.speed_mode = "walk" # Tracker for differential burn rates
+        self.speed_mode = WALK # Tracker for differential burn rates
+
+        # Sticky target tracking: the fish being chased and the steps since the last full scan
+        self.target = None
+        self.target_id = None
+        self.target_pos = None
+        self.steps_since_scan = 0
 
 
+        # homes drawn in batch by the model (see process/placement.py) skip the rejection loop
+        if home is not None:
+            self.home = home
+            return
+
         proc_check = 0
         while True:
             proc_check += 1
             sigma = max(3, MAP_SIZE / 10.0)
             x = max(0, min(MAP_SIZE - 1, int(gauss(mu=INITIAL_LOCATIONS["penguin"][0], sigma=sigma))))
             y = max(0, min(MAP_SIZE - 1, int(gauss(mu=INITIAL_LOCATIONS["penguin"][1], sigma=sigma))))
-            if model.terrain[x][y] == "land":
-                self.home = {"x": x, "y": y}
+            if model.terrain[x, y] == "land":
+                self.home = (x, y)
                 break
 
             if proc_check > checks:
                 self.home = None
                 break
 
+    def reset(self, unique_id, home: tuple):
+        """Makes a retired (off the grid) agent a newly fledged chick, see process/pool.py."""
+        self.unique_id = unique_id
+        self.id = unique_id
+        self.home = home
+        self.status = HUNT
+        max_energy = PARAMS["penguin"]["energy"]["max"]
+        self.energy = int(gauss(mu=max_energy, sigma=max_energy/4))
+        self.speed_mode = WALK
+        self.target = None
+        self.target_id = None
+        self.target_pos = None
+        self.steps_since_scan = 0
+
     def step(self, return_nearest_land = False):
-        if self.status == "dead":
+        if self.status == DEAD:
             return
         
         old_pos = self.pos
-        self.speed_mode = "walk" # Reset to baseline at the start of each step
+        self.speed_mode = WALK # Reset to baseline at the start of each step
 
-        neighbors = self.model.grid.get_neighbors(
+        seals_nearby = self.model.registry.query(
+            "live_seals", 
             self.pos, 
-            moore=True, 
-            radius=int(PARAMS["penguin"]["vision"]["escape"]))
-        seals_nearby = [agent for agent in neighbors if agent.type == "seal"]
+            int(PARAMS["penguin"]["vision"]["escape"]))
         
         if seals_nearby:
             self.escape(seals_nearby)
         else:
-            if self.status == "full":
+            if self.status == FULL:
 
                 if not self.model.land_cells:
-                    self.status = "dead" # No ice left in the entire simulation
+                    self.status = DEAD # No ice left in the entire simulation
                     return
 
                 if return_nearest_land:
@@ -63,34 +88,40 @@ class Penguin(Agent):
                             min_dist = dist
                             land_target = (lx, ly)
                 else:
-                    land_target = (self.home["x"], self.home["y"])
+                    land_target = self.home
 
                 #if self.model.terrain[self.pos[0]][self.pos[1]] == "water":
                 #    if land_target:
-                #        self.model.grid.move_agent(self, land_target)
+                #        self.move(land_target)
                 # else:
                 if land_target:
-                    new_position = chase_or_home(
+                    new_position = go_home(
                         self.model, 
                         self.pos, 
                         land_target, 
                         PARAMS["penguin"]["speed"]["walk"]) 
-                    self.model.grid.move_agent(self, new_position)
+                    self.move(new_position)
                 
                 # 2. UPDATED HUNT RETURN: Use nested "max" key
-                if self.energy <= (PARAMS["penguin"]["energy"]["max"] * 0.5) and self.model.terrain[self.pos[0]][self.pos[1]] == "land":
-                    self.status = "hunt"
+                if self.energy <= (PARAMS["penguin"]["energy"]["max"] * 0.5) and self.model.terrain[self.pos[0], self.pos[1]] == "land":
+                    self.status = HUNT
             else:
-                neighbors = self.model.grid.get_neighbors(
-                    self.pos, moore=True, radius=int(PARAMS["penguin"]["vision"]["hunt"]))
-                fish_nearby_pos = [agent.pos for agent in neighbors if (agent.type == "fish" and agent.status == "alive")]
-                
-                if len(fish_nearby_pos) > 0:
-                    closest_fish_pos = get_nearest_position(
-                        fish_nearby_pos, 
-                        self.pos
-                    )
-                    
+                closest_fish_pos = self.track_target()
+
+                if closest_fish_pos is None:
+                    # only the 5 nearest can be picked by get_nearest_position
+                    fish_nearby = self.model.registry.nearest(
+                        "alive_fish", self.pos, int(PARAMS["penguin"]["vision"]["hunt"]), 5)
+
+                    if len(fish_nearby) > 0:
+                        closest_fish_pos, closest_fish = get_nearest_position(
+                            [agent.pos for agent in fish_nearby], 
+                            self.pos,
+                            possible_ids = fish_nearby
+                        )
+                        self.lock_target(closest_fish)
+
+                if closest_fish_pos is not None:
                     speed = self.energy_level()
 
                     new_position = chase_or_home(
@@ -111,11 +142,11 @@ class Penguin(Agent):
             # Calculate physical distance moved this step
             # dist_moved = ((self.pos[0] - old_pos[0])**2 + (self.pos[1] - old_pos[1])**2)**0.5
             
-            current_terrain = self.model.terrain[self.pos[0]][self.pos[1]]
+            current_terrain = self.model.terrain[self.pos[0], self.pos[1]]
             
             if current_terrain == "water":
                 # self.water_travel_distance += dist_moved # Tick up the odometer
-                self.energy -= PARAMS["penguin"]["energy"]["burn_rate"]["water"][self.speed_mode]  # Penguins get more exhausted in water
+                self.energy -= PARAMS["penguin"]["energy"]["burn_rate"]["water"][SPEED_MODE_NAMES[self.speed_mode]]  # Penguins get more exhausted in water
             elif current_terrain == "land":
                 # self.water_travel_distance = 0.0  # Reset odometer upon reaching safety
                 # self.energy = min(PARAMS["penguin"]["energy"], self.energy + 1)
@@ -125,7 +156,39 @@ class Penguin(Agent):
             # if self.water_travel_distance > PARAMS["penguin"]["max_travel_distance"]:
             #    self.status = "dead"
             if self.energy <= 0:
-                self.status = "dead" # Died of starvation/hypothermia
+                self.status = DEAD # Died of starvation/hypothermia
+
+    def lock_target(self, fish):
+        self.target = fish
+        self.target_id = fish.id if fish is not None else None
+        self.target_pos = fish.pos if fish is not None else None
+        self.steps_since_scan = 0
+
+    def track_target(self):
+        """Returns the position of the locked fish, or None if a full vision scan is needed.
+
+        The target is dropped when it is no longer alive (e.g. eaten by another penguin),
+        when its object was reused for a newborn under another id (see `AgentPool`), when
+        it has left the hunt vision, or every `target_rescan_interval` steps so a closer
+        fish can be picked up.
+        """
+        rescan_interval = PARAMS["penguin"]["target_rescan_interval"]
+        if rescan_interval is None or self.target is None:
+            return None
+
+        vision = int(PARAMS["penguin"]["vision"]["hunt"])
+        target_pos = self.target.pos
+        if (target_pos is None or 
+                self.target.status != ALIVE or 
+                self.target.id != self.target_id or
+                self.steps_since_scan >= rescan_interval or 
+                max(abs(target_pos[0] - self.pos[0]), abs(target_pos[1] - self.pos[1])) > vision):
+            self.lock_target(None)
+            return None
+
+        self.steps_since_scan += 1
+        self.target_pos = target_pos
+        return target_pos
 
     def random_move(self, new_position = None):
         proc_pos = self.pos
@@ -133,39 +196,37 @@ class Penguin(Agent):
             proc_pos = new_position
         new_position = get_random_move_position(
             self.model, proc_pos, PARAMS["penguin"]["speed"]["walk"])
-        self.model.grid.move_agent(self, new_position)
+        self.move(new_position)
 
     def escape(self, enemies):
-        possible_steps = self.model.grid.get_neighborhood(
-            self.pos, 
-            moore=True, 
-            include_center=False,
-            radius=int(PARAMS["penguin"]["speed"]["run"]))
-
-        land_steps = [pos for pos in possible_steps if self.model.terrain[pos[0]][pos[1]] == "land"]
+        land_steps = get_terrain_neighborhood(
+            self.model, self.pos, PARAMS["penguin"]["speed"]["run"], terrain_type="land")
         if land_steps:
             new_position = self.random.choice(land_steps)
-            self.model.grid.move_agent(self, new_position)
+            self.move(new_position)
         else:
+            possible_steps = get_terrain_neighborhood(self.model, self.pos, PARAMS["penguin"]["speed"]["run"])
             new_position = escape_strategy(enemies, possible_steps)
-            self.model.grid.move_agent(self, new_position)
+            self.move(new_position)
 
     def hunt(self, new_position):
-        self.model.grid.move_agent(self, new_position)
+        self.move(new_position)
         cellmates = self.model.grid.get_cell_list_contents([new_position])
         for agent in cellmates:
-            if agent.type == "fish" and success_rate(PARAMS["penguin"]["hunt_success_rate"]):
-                agent.status = "dead"
-                self.status = "full"
+            if agent.type == FISH and success_rate(PARAMS["penguin"]["hunt_success_rate"]):
+                agent.status = DEAD
+                self.status = FULL
+                self.model.record_kill(self, agent)
                 self.energy = PARAMS["penguin"]["energy"]["max"]
+                self.lock_target(None)
                 break
 
     def energy_level(self):
         # 5. UPDATED SPEED TOGGLE: Use nested "max" key and flag the speed mode
         if self.energy > (PARAMS["penguin"]["energy"]["max"] * 0.3):
-            self.speed_mode = "run"
+            self.speed_mode = RUN
             return PARAMS["penguin"]["speed"]["run"]
         else:
-            self.speed_mode = "walk"
+            self.speed_mode = WALK
             return PARAMS["penguin"]["speed"]["walk"]
 
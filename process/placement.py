@@ -0,0 +1,61 @@
+from numpy import asarray as np_asarray
+from numpy import exp as np_exp
+from numpy import nonzero as np_nonzero
+from process.space import TiledTerrain
+
+
+def get_valid_cells(land_mask, terrain_type: str, mu: tuple, sigma: float, extent: float = 4.0) -> tuple:
+    """Cells of the given terrain near `mu`, as (xs, ys) arrays.
+
+    Only the window within `extent` sigmas of `mu` is scanned; if it holds no valid cell
+    (e.g. `mu` deep inside the wrong terrain), the whole grid is. `land_mask` can also be
+    a `TiledTerrain`, of which only the tiles under the window are read.
+
+    Raises:
+        ValueError: If the grid has no cell of this terrain.
+    """
+    if not isinstance(land_mask, TiledTerrain):
+        land_mask = np_asarray(land_mask, dtype=bool)
+    width, height = land_mask.shape
+    x0 = min(max(0, int(mu[0] - extent * sigma)), width)
+    x1 = min(max(0, int(mu[0] + extent * sigma) + 1), width)
+    y0 = min(max(0, int(mu[1] - extent * sigma)), height)
+    y1 = min(max(0, int(mu[1] + extent * sigma) + 1), height)
+
+    for bounds in ((x0, x1, y0, y1), (0, width, 0, height)):
+        if isinstance(land_mask, TiledTerrain):
+            window = land_mask.window_mask(*bounds)
+        else:
+            window = land_mask[bounds[0]:bounds[1], bounds[2]:bounds[3]]
+        valid = window if terrain_type == "land" else ~window
+        xs, ys = np_nonzero(valid)
+        if len(xs):
+            return xs + bounds[0], ys + bounds[2]
+    raise ValueError(f"there is no {terrain_type} cell to place the agents on")
+
+
+def sample_cells(land_mask, terrain_type: str, mu: tuple, sigma: float, n: int, rng) -> tuple:
+    """Draws `n` cells of the given terrain, weighted by a Gaussian around `mu`.
+
+    Replaces the per-agent rejection loops (gauss draws until the terrain matches): the
+    valid cells are listed once and all the cells are drawn at once (with replacement,
+    several agents can share a cell), so exactly `n` cells are returned.
+
+    Args:
+        land_mask (numpy.ndarray or TiledTerrain): Bool terrain indexed [x, y] (True for land).
+        terrain_type (str): "land" or "water".
+        mu (tuple): Center (x, y) of the Gaussian.
+        sigma (float): Standard deviation of the Gaussian, in cells.
+        n (int): Number of cells to draw.
+        rng (numpy.random.Generator): Random generator.
+
+    Returns:
+        tuple: (xs, ys) int arrays of length `n`.
+    """
+    xs, ys = get_valid_cells(land_mask, terrain_type, mu, sigma)
+    dist2 = (xs - mu[0]) ** 2 + (ys - mu[1]) ** 2
+    # relative to the nearest valid cell, so far away cells don't all underflow to 0
+    weights = np_exp(-(dist2 - dist2.min()) / (2.0 * sigma ** 2))
+    picked = rng.choice(len(xs), size=n, p=weights / weights.sum())
+    return xs[picked], ys[picked]
+
@@ -0,0 +1,69 @@
+from collections import deque
+from process.animal import DEAD
+
+
+class AgentPool:
+    """Newborns of one type, made from the objects of retired dead agents.
+
+    Dead agents are kept on the grid (and in the outputs) for `retire_after` steps after
+    their death, then the next birth retires the oldest of them: it is taken off the
+    registry, the grid and the schedule, reset (`agent.reset`) and put back as a new agent
+    with a fresh id. A new object is only created when no dead agent is old enough, so
+    with a steady turnover the schedule, the grid cells and the registry hold at most the
+    live population plus the recently dead, instead of every agent ever born.
+
+    Ids are never reused (the outputs and event logs key agents by (type, id)), only the
+    objects are.
+
+    Args:
+        model: The model the agents live in.
+        agent_cls (type): `Fish` or `Penguin`.
+        retire_after (int): Steps a dead agent stays on the grid before it can be reused
+            (default: 1).
+    """
+
+    def __init__(self, model, agent_cls, retire_after: int = 1):
+        self.model = model
+        self.agent_cls = agent_cls
+        self.retire_after = retire_after
+        self.next_id = 1 + max(
+            (agent.id for agent in model.schedule.agents if agent.type == agent_cls.type), default=-1)
+        # (step of death, agent), oldest first
+        self._dead = deque()
+        self.created = 0
+        self.reused = 0
+
+    def on_death(self, agent):
+        """Called through `model.on_death` when an agent of this type dies."""
+        self._dead.append((self.model.current_step, agent))
+
+    def _retire(self):
+        """Takes the oldest dead agent off the model, or returns None if none is old enough."""
+        dead = self._dead
+        while dead and self.model.current_step - dead[0][0] >= self.retire_after:
+            _, agent = dead.popleft()
+            if agent.status != DEAD:
+                continue
+            self.model.registry.remove(agent)
+            self.model.grid.remove_agent(agent)
+            self.model.schedule.remove(agent)
+            return agent
+        return None
+
+    def spawn(self, pos: tuple, home: tuple):
+        """Adds a newborn at `pos` with the given home, and returns it."""
+        agent_id = self.next_id
+        self.next_id += 1
+
+        agent = self._retire()
+        if agent is None:
+            agent = self.agent_cls(agent_id, self.model, home=home)
+            self.created += 1
+        else:
+            agent.reset(agent_id, home)
+            self.reused += 1
+
+        self.model.grid.place_agent(agent, pos)
+        self.model.schedule.add(agent)
+        self.model.registry.add(agent)
+        return agent
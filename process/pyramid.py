@@ -0,0 +1,120 @@
+from heapq import heappop, heappush
+from numpy import int32 as np_int32
+from numpy import zeros as np_zeros
+
+
+class CountPyramid:
+    """Agent counts per block of 2**level x 2**level cells, for levels 1 up to one block.
+
+    Kept up to date by the prey registry (`add` / `remove` on every insertion and deletion
+    of a set member), so a search can skip the empty parts of the grid a whole block at a
+    time instead of looking at every cell of a vision window.
+
+    Args:
+        width (int): Grid width.
+        height (int): Grid height.
+    """
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.levels = [None]
+        size = 1
+        while size < max(width, height):
+            size *= 2
+            self.levels.append(np_zeros((-(-width // size), -(-height // size)), dtype=np_int32))
+
+    def add(self, pos: tuple, n: int = 1):
+        x, y = pos
+        for level in range(1, len(self.levels)):
+            self.levels[level][x >> level, y >> level] += n
+
+    def remove(self, pos: tuple):
+        self.add(pos, -1)
+
+    def search(self, cells: dict, pos: tuple, radius: int, k: int, include_center: bool = False,
+               stop_level: int = 0) -> list:
+        """Cells holding the `k` agents nearest to `pos` in its Moore window of `radius`.
+
+        Blocks are visited best first (by their distance to `pos`, from the level the
+        window spans a few blocks at, down to `stop_level`), so only the blocks closer
+        than the k-th nearest agent are opened.
+
+        With `stop_level` 0 (exact), every cell at least as close as the k-th nearest
+        agent is returned, ties included, so the k nearest agents are the same as among
+        all the agents of the window. With a higher `stop_level` (approximate), blocks of
+        2**stop_level cells are taken whole, nearest block first, until they hold `k`
+        agents: agents of a further block can be closer than some of the returned ones.
+
+        Args:
+            cells (dict): (x, y) -> list of agents (the registry set).
+            pos (tuple): Center of the search.
+            radius (int): Moore window radius.
+            k (int): Number of agents wanted.
+            include_center (bool): Whether agents on `pos` count (default: False).
+            stop_level (int): Level the search stops descending at (default: 0, exact).
+
+        Returns:
+            list: (x, y) of the cells found, in no particular order.
+        """
+        x, y = pos
+        wx0 = max(0, x - radius)
+        wx1 = min(self.width - 1, x + radius)
+        wy0 = max(0, y - radius)
+        wy1 = min(self.height - 1, y + radius)
+        levels = self.levels
+        stop_level = min(stop_level, len(levels) - 1)
+
+        def push(heap, level, bx, by):
+            # block clipped to the window, and its squared distance to pos
+            x0 = max(wx0, bx << level)
+            x1 = min(wx1, ((bx + 1) << level) - 1)
+            y0 = max(wy0, by << level)
+            y1 = min(wy1, ((by + 1) << level) - 1)
+            if x0 > x1 or y0 > y1:
+                return
+            if level == 0:
+                if (bx, by) not in cells or (not include_center and bx == x and by == y):
+                    return
+            elif not levels[level][bx, by]:
+                return
+            dx = x0 - x if x < x0 else (x - x1 if x > x1 else 0)
+            dy = y0 - y if y < y0 else (y - y1 if y > y1 else 0)
+            heappush(heap, (dx * dx + dy * dy, level, bx, by))
+
+        # start at the blocks of at least `radius` cells: the window spans at most 3 x 3
+        level = max(stop_level, min(len(levels) - 1, max(0, radius - 1).bit_length()))
+        heap = []
+        for bx in range(wx0 >> level, (wx1 >> level) + 1):
+            for by in range(wy0 >> level, (wy1 >> level) + 1):
+                push(heap, level, bx, by)
+
+        found = []
+        n_found = 0
+        kth_dist = None
+        while heap:
+            dist, level, bx, by = heappop(heap)
+            if kth_dist is not None and dist > kth_dist:
+                break
+            if level > stop_level:
+                for cx in (2 * bx, 2 * bx + 1):
+                    for cy in (2 * by, 2 * by + 1):
+                        push(heap, level - 1, cx, cy)
+                continue
+
+            if level == 0:
+                found.append((bx, by))
+                n_found += len(cells[bx, by])
+            else:
+                for cx in range(max(wx0, bx << level), min(wx1, ((bx + 1) << level) - 1) + 1):
+                    for cy in range(max(wy0, by << level), min(wy1, ((by + 1) << level) - 1) + 1):
+                        cell = cells.get((cx, cy))
+                        if cell is not None and (include_center or cx != x or cy != y):
+                            found.append((cx, cy))
+                            n_found += len(cell)
+            if n_found >= k and kth_dist is None:
+                if level > 0:
+                    break
+                # carry on with the cells at the same distance (ties)
+                kth_dist = dist
+        return found
@@ -0,0 +1,267 @@
+from process import PREY_SEARCH_VARS
+from process.animal import FISH, PENGUIN, SEAL, ALIVE, DEAD
+from process.pyramid import CountPyramid
+
+
+def _is_alive_fish(model, agent) -> bool:
+    return agent.type == FISH and agent.status == ALIVE
+
+
+def _is_live_penguin(model, agent) -> bool:
+    return agent.type == PENGUIN and agent.status != DEAD
+
+
+def _is_water_penguin(model, agent) -> bool:
+    return _is_live_penguin(model, agent) and model.terrain[agent.pos[0], agent.pos[1]] == "water"
+
+
+def _is_live_seal(model, agent) -> bool:
+    return agent.type == SEAL and agent.status != DEAD
+
+
+REGISTRY_CATEGORIES = {
+    "alive_fish": _is_alive_fish,
+    "live_penguins": _is_live_penguin,
+    "water_penguins": _is_water_penguin,
+    "live_seals": _is_live_seal,
+}
+
+# sets searched for the nearest prey (see `PreyRegistry.nearest`), by search mode: the
+# seals look at all the penguins in their vision unless the search is approximate
+PYRAMID_CATEGORIES = {
+    "exact": ("alive_fish",),
+    "approximate": ("alive_fish", "water_penguins"),
+    "scan": (),
+}
+
+
+class PreyRegistry:
+    """Sets of agents by type, status and terrain, maintained incrementally.
+
+    Instead of collecting every neighbor in the vision radius and filtering on type,
+    status and terrain, the predators query the set of their eligible prey only
+    (e.g. "water_penguins" for seals). The sets are updated by the agents when they move
+    or change status (see `Animal`) and by the model when the ice melts.
+
+    Each set is stored by cell, so a query either scans the members of the set or the
+    cells of the vision window, whichever is smaller. Results are ordered like
+    `MultiGrid.get_neighbors` (by x, then y, then by arrival in the cell).
+
+    Once they occupy `PREY_SEARCH_VARS["min_cells"]` cells, the sets in
+    `PYRAMID_CATEGORIES` (for the search mode) also keep a `CountPyramid` of their
+    members, so the predators can look for their nearest prey (`nearest`) without listing
+    every prey in their (wide) hunt vision. Smaller sets are scanned, and keep no pyramid
+    up to date.
+
+    Args:
+        model: The model, used to look up the terrain under the agents.
+        categories (dict): Name -> `func(model, agent)` telling if an agent belongs to
+            the set (default: `REGISTRY_CATEGORIES`).
+        search_mode (str): "exact", "approximate" or "scan" (default:
+            `PREY_SEARCH_VARS["mode"]`).
+    """
+
+    def __init__(self, model, categories: dict = REGISTRY_CATEGORIES, search_mode: str or None = None):
+        self.model = model
+        self.categories = categories
+        self._cells = {name: {} for name in categories}
+        self._sizes = {name: 0 for name in categories}
+        self._membership = {}
+
+        self.search_mode = PREY_SEARCH_VARS["mode"] if search_mode is None else search_mode
+        self._pyramid_names = tuple(name for name in PYRAMID_CATEGORIES[self.search_mode] if name in categories)
+        # name -> CountPyramid, built by `_get_pyramid` when the set gets large enough
+        self._pyramids = {}
+
+    def _get_categories(self, agent) -> tuple:
+        return tuple(name for name, func in self.categories.items() if func(self.model, agent))
+
+    def _insert(self, name: str, pos: tuple, agent, in_grid_order: bool = False):
+        """Adds the agent to a set, last in its cell unless `in_grid_order`.
+
+        An agent that just arrived in the cell is also last in the grid cell. One that
+        joins the set without moving (status or terrain change) is put back among the
+        others in the order of the grid cell instead.
+        """
+        cells = self._cells[name]
+        cell = cells.get(pos)
+        if cell is None:
+            cells[pos] = [agent]
+        elif in_grid_order:
+            rank = {other: i for i, other in enumerate(self.model.grid.get_cell_list_contents([pos]))}
+            i = len(cell)
+            while i and rank[cell[i - 1]] > rank[agent]:
+                i -= 1
+            cell.insert(i, agent)
+        else:
+            cell.append(agent)
+        self._sizes[name] += 1
+        pyramid = self._pyramids.get(name)
+        if pyramid is not None:
+            pyramid.add(pos)
+
+    def _delete(self, name: str, pos: tuple, agent):
+        cells = self._cells[name]
+        cell = cells[pos]
+        cell.remove(agent)
+        if not cell:
+            del cells[pos]
+        self._sizes[name] -= 1
+        pyramid = self._pyramids.get(name)
+        if pyramid is not None:
+            pyramid.remove(pos)
+
+    def add(self, agent):
+        """Registers an agent already placed on the grid."""
+        names = self._get_categories(agent)
+        self._membership[agent] = (names, agent.pos)
+        for name in names:
+            self._insert(name, agent.pos, agent)
+
+    def add_many(self, agents: list):
+        """Registers agents already placed on the grid, in bulk.
+
+        The sets an agent belongs to only depend on its type, status and terrain, so they
+        are worked out once per combination rather than once per agent.
+        """
+        terrain = self.model.terrain
+        membership = self._membership
+        known = {}
+        for agent in agents:
+            pos = agent.pos
+            key = (agent.type, agent.status, terrain[pos[0], pos[1]])
+            names = known.get(key)
+            if names is None:
+                names = known[key] = self._get_categories(agent)
+            membership[agent] = (names, pos)
+            for name in names:
+                self._insert(name, pos, agent)
+
+    def remove(self, agent):
+        """Unregisters an agent (before it is taken off the grid)."""
+        names, pos = self._membership.pop(agent)
+        for name in names:
+            self._delete(name, pos, agent)
+
+    def refresh(self, agent, moved: bool = False):
+        """Moves the agent to the sets matching its current position, status and terrain.
+
+        Args:
+            agent: The agent.
+            moved (bool): Whether the agent was just moved on the grid, which puts it last
+                in its grid cell even when it stays on the same cell (default: False).
+        """
+        membership = self._membership.get(agent)
+        if membership is None:
+            return
+        old_names, old_pos = membership
+        new_names = self._get_categories(agent)
+        new_pos = agent.pos
+        if old_names == new_names and old_pos == new_pos and not moved:
+            return
+        if old_pos == new_pos and not moved:
+            # the agent keeps its place in the sets it stays in
+            for name in old_names:
+                if name not in new_names:
+                    self._delete(name, old_pos, agent)
+            for name in new_names:
+                if name not in old_names:
+                    self._insert(name, new_pos, agent, in_grid_order=True)
+        else:
+            for name in old_names:
+                self._delete(name, old_pos, agent)
+            for name in new_names:
+                self._insert(name, new_pos, agent)
+        self._membership[agent] = (new_names, new_pos)
+
+    def on_melt(self, cells: list):
+        """Updates the agents standing on cells that just turned to water."""
+        if not cells:
+            return
+        for agent in self.model.grid.get_cell_list_contents(cells):
+            self.refresh(agent)
+
+    def count(self, name: str) -> int:
+        return self._sizes[name]
+
+    def members(self, name: str) -> list:
+        """Returns all the members of set `name` (grouped by cell)."""
+        return [agent for cell in self._cells[name].values() for agent in cell]
+
+    def query(self, name: str, pos: tuple, radius: int, include_center: bool = False) -> list:
+        """Returns the members of set `name` in the Moore neighborhood of `pos`.
+
+        Args:
+            name (str): Registry set, e.g. "alive_fish" or "water_penguins".
+            pos (tuple): Center of the neighborhood.
+            radius (int): Neighborhood radius in cells.
+            include_center (bool): Whether agents on `pos` itself are returned (default:
+                False, like `MultiGrid.get_neighbors`).
+
+        Returns:
+            list: Agents of the set within `radius` of `pos`.
+        """
+        x, y = pos
+        cells = self._cells[name]
+
+        if len(cells) < (2 * radius + 1) ** 2:
+            found = []
+            for (cx, cy), cell in cells.items():
+                if abs(cx - x) > radius or abs(cy - y) > radius:
+                    continue
+                if not include_center and cx == x and cy == y:
+                    continue
+                found.append(((cx, cy), cell))
+            found.sort(key=lambda item: item[0])
+            return [agent for _, cell in found for agent in cell]
+
+        grid = self.model.grid
+        found = []
+        for cx in range(max(0, x - radius), min(grid.width, x + radius + 1)):
+            for cy in range(max(0, y - radius), min(grid.height, y + radius + 1)):
+                cell = cells.get((cx, cy))
+                if cell is not None and (include_center or cx != x or cy != y):
+                    found.extend(cell)
+        return found
+
+    def _get_pyramid(self, name: str) -> CountPyramid or None:
+        """The pyramid of set `name` if it occupies at least `min_cells` cells, else None.
+
+        The pyramid is built from the cells of the set the first time it is large enough,
+        then kept up to date by `_insert` and `_delete`. It is dropped again if the set
+        shrinks below half the threshold.
+        """
+        n_cells = len(self._cells[name])
+        min_cells = PREY_SEARCH_VARS["min_cells"]
+        pyramid = self._pyramids.get(name)
+        if pyramid is None:
+            if name not in self._pyramid_names or n_cells < min_cells:
+                return None
+            pyramid = self._pyramids[name] = CountPyramid(self.model.grid.width, self.model.grid.height)
+            for cell_pos, cell in self._cells[name].items():
+                pyramid.add(cell_pos, len(cell))
+        elif n_cells < min_cells // 2:
+            del self._pyramids[name]
+            return None
+        return pyramid if n_cells >= min_cells else None
+
+    def nearest(self, name: str, pos: tuple, radius: int, k: int, include_center: bool = False) -> list:
+        """Members of set `name` among which the `k` nearest to `pos` are, like `query` otherwise.
+
+        In "exact" mode, the members at least as close as the k-th nearest are returned
+        (in `query` order), so the k nearest, and `get_nearest_position` picks, are the
+        same as with `query`. In "approximate" mode, whole blocks of
+        `2 ** PREY_SEARCH_VARS["approximate_level"]` cells are returned, nearest first,
+        until they hold `k` members. In "scan" mode (or for a set without a pyramid),
+        this is `query`, as it is while the set occupies fewer than
+        `PREY_SEARCH_VARS["min_cells"]` cells.
+        """
+        pyramid = self._get_pyramid(name)
+        if pyramid is None:
+            return self.query(name, pos, radius, include_center)
+        cells = self._cells[name]
+
+        stop_level = PREY_SEARCH_VARS["approximate_level"] if self.search_mode == "approximate" else 0
+        found = pyramid.search(cells, pos, radius, k, include_center, stop_level)
+        found.sort()
+        return [agent for cell_pos in found for agent in cells[cell_pos]]
@@ -1,23 +1,29 @@
-from mesa import Agent
+from process.animal import Animal, SEAL, PENGUIN, DEAD, HUNT, FULL, WALK, RUN, SPEED_MODE_NAMES
 from math import sqrt
-from process.utils import get_nearest_position, get_random_move_position, chase_or_home, success_rate
+from process.utils import get_nearest_position, get_random_move_position, chase_or_home, go_home, success_rate
 from process import INITIAL_LOCATIONS, MAP_SIZE, PARAMS
 from random import gauss
 from random import choices as random_choices
 
-class Seal(Agent):
-    def __init__(self, unique_id, model, checks: int = 50):
+class Seal(Animal):
+    type = SEAL
+
+    def __init__(self, unique_id, model, checks: int = 50, home: tuple or None = None):
         super().__init__(unique_id, model)
-        self.type = "seal"
         self.id = unique_id
-        self.status = "hunt"
+        self.status = HUNT
         self.target_id = None
         self.target_pos = None
 
         # FIX: Added energy tracking for seals
         max_energy = PARAMS["seal"]["energy"]["max"]
         self.energy = int(gauss(mu=max_energy, sigma=max_energy/4))
-        self.speed_mode = "walk"
+        self.speed_mode = WALK
+
+        # homes drawn in batch by the model (see process/placement.py) skip the rejection loop
+        if home is not None:
+            self.home = home
+            return
 
         proc_check = 0
         while True:
@@ -25,8 +31,8 @@ class Seal(Agent):
             sigma = max(3, MAP_SIZE / 10.0)
             x = max(0, min(MAP_SIZE - 1, int(gauss(mu=INITIAL_LOCATIONS["seal"][0], sigma=sigma))))
             y = max(0, min(MAP_SIZE - 1, int(gauss(mu=INITIAL_LOCATIONS["seal"][1], sigma=sigma))))
-            if model.terrain[x][y] == "water":
-                self.home = {"x": x, "y": y}
+            if model.terrain[x, y] == "water":
+                self.home = (x, y)
                 break
 
             if proc_check > checks:
@@ -35,41 +41,40 @@ class Seal(Agent):
 
     def step(self):
 
-        if self.status == "dead":
+        if self.status == DEAD:
             return
         
         old_pos = self.pos
-        self.speed_mode = "walk" # Reset to baseline at the start of each step
+        self.speed_mode = WALK # Reset to baseline at the start of each step
 
-        if self.status == "full":
-            new_position = chase_or_home(
+        if self.status == FULL:
+            new_position = go_home(
                 self.model, 
                 self.pos, 
-                (self.home["x"], self.home["y"]), 
-                PARAMS["seal"]["speed"]["walk"]) 
-            self.model.grid.move_agent(self, new_position)
+                self.home, 
+                PARAMS["seal"]["speed"]["walk"],
+                route_terrain="water") 
+            self.move(new_position)
 
             # FIX: Seal gets hungry again
             if self.energy <= (PARAMS["seal"]["energy"]["max"] * 0.5):
-                self.status = "hunt"
+                self.status = HUNT
         else:
-            neighbors = self.model.grid.get_neighbors(self.pos, moore=True, radius=int(PARAMS["seal"]["vision"]["hunt"]))
-            penguin_nearby = [(agent.id, agent.pos) for agent in neighbors if (agent.type == "penguin" and agent.status != "dead")]
-            # only keep penguin nearby in the sea
-            penguin_nearby = [
-                proc_penguin_nearby for proc_penguin_nearby in 
-                penguin_nearby if self.model.terrain[
-                    proc_penguin_nearby[1][0]][proc_penguin_nearby[1][1]] == "water"]
-
-            penguin_nearby_id = []
-            penguin_nearby_pos = []
-            for proc_penguin_nearby in penguin_nearby:
-                penguin_nearby_id.append(proc_penguin_nearby[0])
-                penguin_nearby_pos.append(proc_penguin_nearby[1])
+            # only penguins in the sea can be hunted
+            if self.model.registry.search_mode == "approximate":
+                penguin_nearby = self.model.registry.nearest(
+                    "water_penguins", self.pos, int(PARAMS["seal"]["vision"]["hunt"]), 5)
+            else:
+                # the target and the 3 random picks below are among all the penguins in vision
+                penguin_nearby = self.model.registry.query(
+                    "water_penguins", self.pos, int(PARAMS["seal"]["vision"]["hunt"]))
+
+            penguin_nearby_id = [agent.id for agent in penguin_nearby]
+            penguin_nearby_pos = [agent.pos for agent in penguin_nearby]
 
             if len(penguin_nearby) > 0:
                 
-                self.speed_mode = "run"
+                self.speed_mode = RUN
 
                 if self.target_id in penguin_nearby_id:
                     # observe other 3 penguins while hunting the target penguin (note this selection may include target penguin itself)
@@ -105,9 +110,9 @@ class Seal(Agent):
         # Odometer / energy drain logic
         if self.pos != old_pos:
             self.energy -= PARAMS[
-                "seal"]["energy"]["burn_rate"]["water"][self.speed_mode]
+                "seal"]["energy"]["burn_rate"]["water"][SPEED_MODE_NAMES[self.speed_mode]]
             if self.energy <= 0:
-                self.status = "dead"
+                self.status = DEAD
     
     def random_move(self, new_position = None):
         proc_pos = self.pos
@@ -115,14 +120,15 @@ class Seal(Agent):
             proc_pos = new_position
         new_position = get_random_move_position(
             self.model, proc_pos, PARAMS["seal"]["speed"]["walk"], terrain_type = "water")
-        self.model.grid.move_agent(self, new_position)
+        self.move(new_position)
 
     def hunt(self, new_position):
-        self.model.grid.move_agent(self, new_position)
+        self.move(new_position)
         cellmates = self.model.grid.get_cell_list_contents([new_position])
         for agent in cellmates:
-            if agent.type == "penguin" and success_rate(PARAMS["seal"]["hunt_success_rate"]):
-                agent.status = "dead"
-                self.status = "full"
+            if agent.type == PENGUIN and success_rate(PARAMS["seal"]["hunt_success_rate"]):
+                agent.status = DEAD
+                self.status = FULL
+                self.model.record_kill(self, agent)
                 break
 
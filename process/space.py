@@ -0,0 +1,519 @@
+from numpy import packbits as np_packbits
+from numpy import unpackbits as np_unpackbits
+from numpy import zeros as np_zeros
+from numpy import ones as np_ones
+from numpy import nonzero as np_nonzero
+from numpy import asarray as np_asarray
+from random import random
+
+
+class SparseMultiGrid:
+    """A (non torus) Mesa `MultiGrid` replacement that only stores occupied cells.
+
+    Mesa's `MultiGrid` allocates a list for every cell of the map and caches every
+    neighborhood it has been asked for, so memory grows with width x height. Here the
+    cells are kept in a dict that only holds cells with at least one agent, and the
+    neighborhood offsets are cached per radius (not per position).
+
+    The methods used by the agents (`place_agent`, `move_agent`, `remove_agent`,
+    `get_neighborhood`, `get_neighbors`, `get_cell_list_contents`) return the same
+    results, in the same order, as `MultiGrid`.
+
+    Args:
+        width (int): Grid width.
+        height (int): Grid height.
+        torus (bool): Only False is supported.
+    """
+
+    def __init__(self, width: int, height: int, torus: bool = False):
+        if torus:
+            raise NotImplementedError("SparseMultiGrid does not support torus grids")
+        self.width = width
+        self.height = height
+        self.torus = torus
+        self._cells = {}
+        self._offsets = {}
+
+    def out_of_bounds(self, pos: tuple) -> bool:
+        x, y = pos
+        return x < 0 or x >= self.width or y < 0 or y >= self.height
+
+    def place_agent(self, agent, pos: tuple):
+        pos = (int(pos[0]), int(pos[1]))
+        cell = self._cells.get(pos)
+        if cell is None:
+            self._cells[pos] = [agent]
+        else:
+            cell.append(agent)
+        agent.pos = pos
+
+    def remove_agent(self, agent):
+        cell = self._cells[agent.pos]
+        cell.remove(agent)
+        if not cell:
+            del self._cells[agent.pos]
+        agent.pos = None
+
+    def move_agent(self, agent, pos: tuple):
+        self.remove_agent(agent)
+        self.place_agent(agent, pos)
+
+    def is_cell_empty(self, pos: tuple) -> bool:
+        return pos not in self._cells
+
+    def get_cell_list_contents(self, cell_list) -> list:
+        if isinstance(cell_list, tuple):
+            cell_list = [cell_list]
+        contents = []
+        for pos in cell_list:
+            cell = self._cells.get(pos)
+            if cell is not None:
+                contents.extend(cell)
+        return contents
+
+    def _get_offsets(self, moore: bool, radius: int) -> list:
+        offsets = self._offsets.get((moore, radius))
+        if offsets is None:
+            offsets = [
+                (dx, dy) for dx in range(-radius, radius + 1) for dy in range(-radius, radius + 1)
+                if moore or abs(dx) + abs(dy) <= radius]
+            self._offsets[(moore, radius)] = offsets
+        return offsets
+
+    def get_neighborhood(self, pos: tuple, moore: bool, include_center: bool = False, radius: int = 1) -> list:
+        """Same as `MultiGrid.get_neighborhood` (positions ordered by x, then y)."""
+        x, y = pos
+        width = self.width
+        height = self.height
+        if x >= radius and width - x > radius and y >= radius and height - y > radius:
+            neighborhood = [(x + dx, y + dy) for dx, dy in self._get_offsets(moore, radius)]
+        else:
+            neighborhood = []
+            for dx, dy in self._get_offsets(moore, radius):
+                new_x = x + dx
+                new_y = y + dy
+                if 0 <= new_x < width and 0 <= new_y < height:
+                    neighborhood.append((new_x, new_y))
+
+        if not include_center:
+            neighborhood.remove((x, y))
+
+        return neighborhood
+
+    def get_neighbors(self, pos: tuple, moore: bool, include_center: bool = False, radius: int = 1) -> list:
+        """Same as `MultiGrid.get_neighbors`.
+
+        When there are fewer occupied cells than cells in the neighborhood, the occupied
+        cells are scanned instead of the neighborhood, so the cost is bounded by the
+        number of agents rather than by the vision radius.
+        """
+        x, y = pos
+        cells = self._cells
+
+        if len(cells) < (2 * radius + 1) ** 2:
+            found = []
+            for (cx, cy), cell in cells.items():
+                dx = abs(cx - x)
+                dy = abs(cy - y)
+                if dx > radius or dy > radius:
+                    continue
+                if not moore and dx + dy > radius:
+                    continue
+                if not include_center and dx == 0 and dy == 0:
+                    continue
+                found.append(((cx, cy), cell))
+            found.sort(key=lambda item: item[0])
+            return [agent for _, cell in found for agent in cell]
+
+        neighbors = []
+        for proc_pos in self.get_neighborhood(pos, moore, include_center=include_center, radius=radius):
+            cell = cells.get(proc_pos)
+            if cell is not None:
+                neighbors.extend(cell)
+        return neighbors
+
+
+class TiledTerrain:
+    """Land/water raster stored as square tiles.
+
+    A tile that is entirely land or entirely water is stored as a single flag, only the
+    mixed (coastal) tiles keep one bit per cell (bit-packed), so memory scales with the
+    length of the coastline instead of the area of the map.
+
+    Cells are read and written like the dense terrain array, with "land"/"water" values,
+    using either `terrain[x, y]` or `terrain[x][y]`.
+
+    Args:
+        width (int): Terrain width (x).
+        height (int): Terrain height (y).
+        tile_size (int): Tile edge length in cells, must be a multiple of 8 (default: 64).
+        loader (callable, optional): Called as `loader(tx, ty)` the first time a tile is
+            accessed. It returns either a bool (uniform land/water tile) or a boolean
+            array of shape (tile_size, tile_size) indexed [x, y] (True for land).
+            Without a loader, tiles default to water.
+        classify (callable, optional): Called as `classify(tx, ty)`, returns a bool for
+            a tile known to be uniform without reading it, else None. The ice melt and
+            `has_land` use it to leave the coastal tiles nobody has touched unread.
+    """
+
+    def __init__(self, width: int, height: int, tile_size: int = 64, loader=None, classify=None):
+        if tile_size % 8 != 0:
+            raise ValueError("tile_size must be a multiple of 8")
+        self.width = width
+        self.height = height
+        self.shape = (width, height)
+        self.tile_size = tile_size
+        self._tiles = {}
+        self._loader = loader
+        self._classify = classify
+        self._land_count = None
+        # coastal tiles known from `classify` only, and the melt steps they missed
+        self._unread = set()
+        self._missed_melts = {}
+
+    @classmethod
+    def from_mask(cls, mask, tile_size: int = 64):
+        """Builds the terrain from a boolean array of shape (width, height), True for land."""
+        mask = np_asarray(mask, dtype=bool)
+        width, height = mask.shape
+        terrain = cls(width, height, tile_size=tile_size)
+        for tx in range(0, (width + tile_size - 1) // tile_size):
+            for ty in range(0, (height + tile_size - 1) // tile_size):
+                terrain._set_tile(
+                    tx, ty, mask[tx * tile_size:(tx + 1) * tile_size, ty * tile_size:(ty + 1) * tile_size])
+        return terrain
+
+    def snapshot(self, read_all: bool = False):
+        """Returns a copy of the terrain in its current state, sharing its tile loader.
+
+        The tiles not read yet are still in their original state, the copy reads them
+        from the same loader if it needs them. With `read_all`, every tile is read first
+        and the copy has no loader (e.g. to pickle it).
+        """
+        size = self.tile_size
+        if read_all:
+            for tx in range(0, (self.width + size - 1) // size):
+                for ty in range(0, (self.height + size - 1) // size):
+                    self._get_tile(tx, ty)
+        terrain = TiledTerrain(
+            self.width, self.height, tile_size=size,
+            loader=None if read_all else self._loader,
+            classify=None if read_all else self._classify)
+        terrain._tiles = {
+            key: tile if tile is True or tile is False else bytearray(tile) for key, tile in self._tiles.items()}
+        terrain._land_count = self._land_count
+        if not read_all:
+            terrain._unread = set(self._unread)
+        return terrain
+
+    def _set_tile(self, tx: int, ty: int, tile):
+        tile = np_asarray(tile, dtype=bool)
+        if tile.ndim == 0:
+            self._tiles[(tx, ty)] = bool(tile)
+            return
+
+        # cells beyond the edge of the map are always water
+        size = self.tile_size
+        inside = tile[:self.width - tx * size, :self.height - ty * size]
+        if inside.all() and inside.size == size * size:
+            self._tiles[(tx, ty)] = True
+        elif not inside.any():
+            self._tiles[(tx, ty)] = False
+        else:
+            block = np_zeros((size, size), dtype=bool)
+            block[:inside.shape[0], :inside.shape[1]] = inside
+            self._tiles[(tx, ty)] = bytearray(np_packbits(block, axis=None).tobytes())
+
+    def _get_tile(self, tx: int, ty: int):
+        tile = self._tiles.get((tx, ty))
+        if tile is None:
+            if self._loader is None:
+                tile = False
+                self._tiles[(tx, ty)] = tile
+            else:
+                self._set_tile(tx, ty, self._loader(tx, ty))
+                self._unread.discard((tx, ty))
+                tile = self._tiles[(tx, ty)]
+        return tile
+
+    def _peek_tile(self, tx: int, ty: int):
+        """Like `_get_tile`, but returns None for a coastal tile that was not read yet."""
+        tile = self._tiles.get((tx, ty))
+        if tile is not None or self._classify is None:
+            return self._get_tile(tx, ty) if tile is None else tile
+        if (tx, ty) in self._unread:
+            return None
+        tile = self._classify(tx, ty)
+        if tile is None:
+            self._unread.add((tx, ty))
+        else:
+            self._tiles[(tx, ty)] = tile
+        return tile
+
+    def is_land(self, x: int, y: int) -> bool:
+        size = self.tile_size
+        tile = self._get_tile(x // size, y // size)
+        if tile is True or tile is False:
+            return tile
+        idx = (x % size) * size + (y % size)
+        return bool((tile[idx >> 3] >> (7 - (idx & 7))) & 1)
+
+    def set_land(self, x: int, y: int, land: bool):
+        size = self.tile_size
+        tx = x // size
+        ty = y // size
+        if self.is_land(x, y) == land:
+            return
+        tile = self._get_tile(tx, ty)
+        if tile is True or tile is False:
+            tile = bytearray(b"\xff" if tile else b"\x00") * (size * size // 8)
+            self._tiles[(tx, ty)] = tile
+        if self._land_count is not None:
+            self._land_count += 1 if land else -1
+        idx = (x % size) * size + (y % size)
+        if land:
+            tile[idx >> 3] |= 1 << (7 - (idx & 7))
+        else:
+            tile[idx >> 3] &= ~(1 << (7 - (idx & 7))) & 0xFF
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            return "land" if self.is_land(key[0], key[1]) else "water"
+        return _TerrainColumn(self, key)
+
+    def __setitem__(self, key, value):
+        self.set_land(key[0], key[1], value == "land")
+
+    def tile_mask(self, tx: int, ty: int):
+        """Returns the tile (tx, ty) as a boolean array indexed [x, y]."""
+        size = self.tile_size
+        tile = self._get_tile(tx, ty)
+        if tile is True or tile is False:
+            mask = np_zeros((size, size), dtype=bool)
+            mask[:] = tile
+            return mask
+        return np_unpackbits(np_asarray(tile, dtype="uint8")).reshape(size, size).astype(bool)
+
+    def window_mask(self, x0: int, x1: int, y0: int, y1: int):
+        """Returns the cells [x0:x1, y0:y1] as a boolean array, reading only the tiles they span."""
+        size = self.tile_size
+        x0, x1 = max(0, x0), min(self.width, x1)
+        y0, y1 = max(0, y0), min(self.height, y1)
+        mask = np_zeros((max(0, x1 - x0), max(0, y1 - y0)), dtype=bool)
+        for tx in range(x0 // size, (x1 + size - 1) // size):
+            for ty in range(y0 // size, (y1 + size - 1) // size):
+                cx0, cx1 = max(x0, tx * size), min(x1, (tx + 1) * size)
+                cy0, cy1 = max(y0, ty * size), min(y1, (ty + 1) * size)
+                mask[cx0 - x0:cx1 - x0, cy0 - y0:cy1 - y0] = self.tile_mask(tx, ty)[
+                    cx0 - tx * size:cx1 - tx * size, cy0 - ty * size:cy1 - ty * size]
+        return mask
+
+    def to_mask(self):
+        """Returns the full terrain as a dense boolean array of shape (width, height)."""
+        return self.window_mask(0, self.width, 0, self.height)
+
+    def iter_land_cells(self):
+        """Yields every land cell as (x, y), tile by tile."""
+        size = self.tile_size
+        for tx in range(0, (self.width + size - 1) // size):
+            for ty in range(0, (self.height + size - 1) // size):
+                if self._get_tile(tx, ty) is False:
+                    continue
+                mask = self.tile_mask(tx, ty)
+                mask[self.width - tx * size:, :] = False
+                mask[:, self.height - ty * size:] = False
+                for lx, ly in zip(*np_nonzero(mask)):
+                    yield tx * size + int(lx), ty * size + int(ly)
+
+    def _tile_block(self, tx: int, ty: int, unread_as_land: bool = False):
+        """The tile with a one cell halo taken from its neighbors, cells outside the map are land.
+
+        With `unread_as_land`, the halo facing a coastal tile that was not read yet is
+        land too, instead of reading that tile.
+        """
+        size = self.tile_size
+        x0 = tx * size
+        y0 = ty * size
+
+        def neighbor(nx, ny):
+            if unread_as_land and self._peek_tile(nx, ny) is None:
+                return np_ones((size, size), dtype=bool)
+            return self.tile_mask(nx, ny)
+
+        block = np_ones((size + 2, size + 2), dtype=bool)
+        block[1:-1, 1:-1] = self.tile_mask(tx, ty)
+        if x0 > 0:
+            block[0, 1:-1] = neighbor(tx - 1, ty)[-1, :]
+        if x0 + size < self.width:
+            block[-1, 1:-1] = neighbor(tx + 1, ty)[0, :]
+        if y0 > 0:
+            block[1:-1, 0] = neighbor(tx, ty - 1)[:, -1]
+        if y0 + size < self.height:
+            block[1:-1, -1] = neighbor(tx, ty + 1)[:, 0]
+        block[1 + self.width - x0:, :] = True
+        block[:, 1 + self.height - y0:] = True
+        return block
+
+    def _block_edges(self, block, tx: int, ty: int):
+        size = self.tile_size
+        surrounded = block[2:, 1:-1] & block[:-2, 1:-1] & block[1:-1, 2:] & block[1:-1, :-2]
+        edges = block[1:-1, 1:-1] & ~surrounded
+        edges[self.width - tx * size:, :] = False
+        edges[:, self.height - ty * size:] = False
+        return edges
+
+    def _iter_shore_tiles(self, get_tile):
+        """Yields ((tx, ty), tile) for every tile that may hold edge cells.
+
+        Water tiles are skipped, as are uniform land tiles surrounded by uniform land
+        tiles.
+        """
+        size = self.tile_size
+        n_tx = (self.width + size - 1) // size
+        n_ty = (self.height + size - 1) // size
+        for tx in range(0, n_tx):
+            for ty in range(0, n_ty):
+                tile = get_tile(tx, ty)
+                if tile is False:
+                    continue
+                if tile is True and all(
+                        get_tile(nx, ny) is True
+                        for nx, ny in ((tx, ty + 1), (tx + 1, ty), (tx, ty - 1), (tx - 1, ty))
+                        if 0 <= nx < n_tx and 0 <= ny < n_ty):
+                    continue
+                yield (tx, ty), tile
+
+    def iter_edge_cells(self):
+        """Yields the land cells with water in their Von Neumann neighborhood.
+
+        Water tiles are skipped, as are uniform land tiles surrounded by uniform land
+        tiles, the other tiles are checked as a whole with numpy.
+        """
+        size = self.tile_size
+        for (tx, ty), _ in self._iter_shore_tiles(self._get_tile):
+            for lx, ly in zip(*np_nonzero(self._block_edges(self._tile_block(tx, ty), tx, ty))):
+                yield tx * size + int(lx), ty * size + int(ly)
+
+    def melt_edges(self, probability: float) -> list:
+        """Draws the edge cells melting in one step of the ice dynamics, without melting them.
+
+        Every edge cell melts with `probability` (one `random()` draw each, in
+        `iter_edge_cells` order). The coastal tiles that were not read yet (see
+        `classify`) are left unread: the steps they miss are counted, and played on the
+        tile, one after the other, at the first step after something reads it. Until
+        then the halo they give their neighbors is land.
+
+        Args:
+            probability (float): Melt probability of an edge cell per step.
+
+        Returns:
+            list: (x, y) of the cells to turn into water.
+        """
+        size = self.tile_size
+        melted = []
+        for (tx, ty), tile in self._iter_shore_tiles(self._peek_tile):
+            if tile is None:
+                self._missed_melts[(tx, ty)] = self._missed_melts.get((tx, ty), 0) + 1
+                continue
+            block = self._tile_block(tx, ty, unread_as_land=True)
+            for _ in range(1 + self._missed_melts.pop((tx, ty), 0)):
+                # the edges of a step are found before any of its cells melt
+                edges = self._block_edges(block, tx, ty)
+                for lx, ly in zip(*np_nonzero(edges)):
+                    if random() < probability:
+                        block[1 + lx, 1 + ly] = False
+                        melted.append((tx * size + int(lx), ty * size + int(ly)))
+
+        # tiles read since, that turned out to have no edge cell
+        for key in [key for key in self._missed_melts if key not in self._unread]:
+            del self._missed_melts[key]
+        return melted
+
+    def has_land(self) -> bool:
+        """Whether any cell is land, reading the unread coastal tiles only if no other tile has land."""
+        if self._land_count is not None:
+            return self._land_count > 0
+        size = self.tile_size
+        unread = []
+        for tx in range(0, (self.width + size - 1) // size):
+            for ty in range(0, (self.height + size - 1) // size):
+                tile = self._peek_tile(tx, ty)
+                if tile is None:
+                    unread.append((tx, ty))
+                elif tile is True or (tile is not False and any(tile)):
+                    return True
+        for tx, ty in unread:
+            tile = self._get_tile(tx, ty)
+            if tile is True or (tile is not False and any(tile)):
+                return True
+        return False
+
+    def count_land(self) -> int:
+        """Number of land cells (computed once, reading every tile, then kept up to date by `set_land`)."""
+        if self._land_count is not None:
+            return self._land_count
+        size = self.tile_size
+        total = 0
+        for tx in range(0, (self.width + size - 1) // size):
+            for ty in range(0, (self.height + size - 1) // size):
+                tile = self._get_tile(tx, ty)
+                if tile is False:
+                    continue
+                if tile is True:
+                    total += (min((tx + 1) * size, self.width) - tx * size) * (
+                        min((ty + 1) * size, self.height) - ty * size)
+                else:
+                    total += int(np_unpackbits(np_asarray(tile, dtype="uint8")).sum())
+        self._land_count = total
+        return total
+
+
+class _TerrainColumn:
+    """Lets `terrain[x][y]` work on a `TiledTerrain` like on a 2D array."""
+
+    __slots__ = ("_terrain", "_x")
+
+    def __init__(self, terrain: TiledTerrain, x: int):
+        self._terrain = terrain
+        self._x = x
+
+    def __getitem__(self, y: int) -> str:
+        return "land" if self._terrain.is_land(self._x, y) else "water"
+
+    def __setitem__(self, y: int, value: str):
+        self._terrain.set_land(self._x, y, value == "land")
+
+
+class LandCells:
+    """Set-like view of the land cells of a `TiledTerrain`.
+
+    Stands in for the `land_cells` set of the dense model without keeping one tuple per
+    land cell. Since it is a view, removing a cell turns it into water, and removing a
+    cell that is already water (e.g. after `terrain[x][y] = "water"`) is a no-op.
+    """
+
+    def __init__(self, terrain: TiledTerrain):
+        self._terrain = terrain
+
+    def __iter__(self):
+        return self._terrain.iter_land_cells()
+
+    def __len__(self) -> int:
+        return self._terrain.count_land()
+
+    def __bool__(self) -> bool:
+        return self._terrain.has_land()
+
+    def __contains__(self, pos: tuple) -> bool:
+        x, y = pos
+        return 0 <= x < self._terrain.width and 0 <= y < self._terrain.height and self._terrain.is_land(x, y)
+
+    def add(self, pos: tuple):
+        self._terrain.set_land(pos[0], pos[1], True)
+
+    def discard(self, pos: tuple):
+        if pos in self:
+            self._terrain.set_land(pos[0], pos[1], False)
+
+    def remove(self, pos: tuple):
+        self.discard(pos)
@@ -0,0 +1,189 @@
+from json import dump as json_dump
+from json import load as json_load
+from os import makedirs
+from os.path import join
+from numpy import array as np_array
+from numpy import concatenate as np_concatenate
+from numpy import int8 as np_int8
+from numpy import int32 as np_int32
+from numpy import int64 as np_int64
+from numpy import lexsort as np_lexsort
+from numpy import load as np_load
+from numpy import save as np_save
+from numpy import searchsorted as np_searchsorted
+from numpy import unique as np_unique
+from numpy import where as np_where
+from pandas import Categorical, DataFrame
+from process.animal import TYPE_NAMES, STATUS_NAMES
+from process.analytics import get_agent_keys
+
+STORE_VERSION = 1
+
+# rows sorted by time, then type and id: a time step is one contiguous slice
+FRAME_COLUMNS = {
+    "time": np_int32, "type": np_int8, "id": np_int32, "status": np_int8, "x": np_int32, "y": np_int32, "land": bool}
+# the same rows sorted by agent, then time: an agent's track is one contiguous slice
+TRACK_COLUMNS = {"time": np_int32, "status": np_int8, "x": np_int32, "y": np_int32, "land": bool}
+
+
+class TrajectoryStore:
+    """A `run_model` output as sorted columns with per-time step and per-agent offsets.
+
+    The rows are kept twice as numpy columns (types and statuses as codes, see
+    `TYPE_NAMES`): once sorted by time (`frame`) and once sorted by agent then time
+    (`track`, for the positions only). A time step or an agent track is then a slice of
+    each column, i.e. a view (no copy, no filtering of the whole output), so getting a
+    frame costs the same at step 10 and at step 10,000.
+
+    Saved stores are a directory of .npy files (`save`) that `load` memory-maps by
+    default, so only the frames or tracks actually read are paged in.
+
+    Unlike `TrajectoryIndex` (process/analytics.py), which indexes a DataFrame in memory
+    for the analytics, the store only holds numeric arrays.
+
+    Args:
+        frames (dict): `FRAME_COLUMNS` arrays sorted by time, type and id.
+        tracks (dict): `TRACK_COLUMNS` arrays sorted by type, id and time.
+        times (numpy.ndarray): Sorted unique time steps.
+        time_offsets (numpy.ndarray): Time `times[i]` is rows `time_offsets[i]:time_offsets[i + 1]`.
+        agent_keys (numpy.ndarray): Sorted agent keys (`get_agent_keys`).
+        agent_offsets (numpy.ndarray): Agent `agent_keys[i]` is track rows
+            `agent_offsets[i]:agent_offsets[i + 1]`.
+    """
+
+    def __init__(self, frames: dict, tracks: dict, times, time_offsets, agent_keys, agent_offsets):
+        self.frames = frames
+        self.tracks = tracks
+        self.times = times
+        self.time_offsets = time_offsets
+        self.agent_keys = agent_keys
+        self.agent_offsets = agent_offsets
+        # consecutive time steps (the usual case) are looked up without a search
+        self._first_time = int(times[0]) if len(times) else 0
+        self._contiguous = len(times) == 0 or int(times[-1]) - self._first_time == len(times) - 1
+
+    def __len__(self) -> int:
+        return len(self.frames["time"])
+
+    @classmethod
+    def from_output(cls, output: DataFrame):
+        """Sorts a `run_model` output (or `EventLog.to_trajectory`) into a store."""
+        columns = {
+            "time": output["time"].to_numpy(dtype=np_int64),
+            "type": Categorical(output["type"], categories=TYPE_NAMES).codes.astype(np_int64),
+            "id": output["id"].to_numpy(dtype=np_int64),
+            "status": Categorical(output["status"], categories=STATUS_NAMES).codes.astype(np_int64),
+            "x": output["x"].to_numpy(dtype=np_int64),
+            "y": output["y"].to_numpy(dtype=np_int64),
+            "land": output["terrain"].to_numpy() == "land",
+        }
+
+        order = np_lexsort((columns["id"], columns["type"], columns["time"]))
+        frames = {name: columns[name][order].astype(dtype) for name, dtype in FRAME_COLUMNS.items()}
+        times, time_offsets = np_unique(frames["time"], return_index=True)
+        time_offsets = np_concatenate((time_offsets, [len(order)]))
+
+        keys = get_agent_keys(columns["type"], columns["id"])
+        order = np_lexsort((columns["time"], keys))
+        tracks = {name: columns[name][order].astype(dtype) for name, dtype in TRACK_COLUMNS.items()}
+        agent_keys, agent_offsets = np_unique(keys[order], return_index=True)
+        agent_offsets = np_concatenate((agent_offsets, [len(order)]))
+
+        return cls(frames, tracks, times, time_offsets, agent_keys, agent_offsets)
+
+    def _time_slice(self, time: int) -> slice:
+        if self._contiguous:
+            i = time - self._first_time
+            if not 0 <= i < len(self.times):
+                raise KeyError(time)
+        else:
+            i = int(np_searchsorted(self.times, time))
+            if i == len(self.times) or self.times[i] != time:
+                raise KeyError(time)
+        return slice(int(self.time_offsets[i]), int(self.time_offsets[i + 1]))
+
+    def frame(self, time: int) -> dict:
+        """All the agents at one time step, as views of the `FRAME_COLUMNS` (sorted by type and id)."""
+        rows = self._time_slice(time)
+        return {name: values[rows] for name, values in self.frames.items()}
+
+    def track(self, agent_type: str or int, agent_id: int, stop: int or None = None) -> dict:
+        """Track of one agent, as views of the `TRACK_COLUMNS` (sorted by time).
+
+        Args:
+            agent_type (str or int): Type name or code.
+            agent_id (int): Agent id (within its type).
+            stop (int, optional): Only the steps up to `stop` (included).
+        """
+        if isinstance(agent_type, str):
+            agent_type = TYPE_NAMES.index(agent_type)
+        key = get_agent_keys(np_array([agent_type]), np_array([agent_id]))[0]
+        i = int(np_searchsorted(self.agent_keys, key))
+        if i == len(self.agent_keys) or self.agent_keys[i] != key:
+            raise KeyError((TYPE_NAMES[agent_type], agent_id))
+        start, end = int(self.agent_offsets[i]), int(self.agent_offsets[i + 1])
+        if stop is not None:
+            end = start + int(np_searchsorted(self.tracks["time"][start:end], stop, side="right"))
+        return {name: values[start:end] for name, values in self.tracks.items()}
+
+    def agents(self, agent_type: str or int) -> list:
+        """Ids of the agents of one type (sorted)."""
+        if isinstance(agent_type, str):
+            agent_type = TYPE_NAMES.index(agent_type)
+        first, last = np_searchsorted(
+            self.agent_keys, get_agent_keys(np_array([agent_type, agent_type + 1]), np_array([0, 0])))
+        return (self.agent_keys[first:last] - get_agent_keys(np_array([agent_type]), np_array([0]))[0]).tolist()
+
+    def to_output(self, time: int or None = None) -> DataFrame:
+        """Back to the `run_model` format (one time step, or all of them, ordered by time)."""
+        columns = self.frames if time is None else self.frame(time)
+        return DataFrame({
+            "id": columns["id"].astype(np_int64),
+            "time": columns["time"].astype(np_int64),
+            "type": np_array(TYPE_NAMES, dtype=object)[columns["type"]],
+            "status": np_array(STATUS_NAMES, dtype=object)[columns["status"]],
+            "x": columns["x"].astype(np_int64),
+            "y": columns["y"].astype(np_int64),
+            "terrain": np_where(columns["land"], "land", "water").astype(object),
+        })
+
+    def save(self, path: str):
+        """Writes the store to directory `path` (one .npy file per array)."""
+        makedirs(path, exist_ok=True)
+        arrays = {
+            **{f"frame_{name}": values for name, values in self.frames.items()},
+            **{f"track_{name}": values for name, values in self.tracks.items()},
+            "times": self.times,
+            "time_offsets": self.time_offsets,
+            "agent_keys": self.agent_keys,
+            "agent_offsets": self.agent_offsets,
+        }
+        for name, values in arrays.items():
+            np_save(join(path, f"{name}.npy"), values)
+        with open(join(path, "store.json"), "w") as fid:
+            json_dump({"version": STORE_VERSION, "rows": len(self), "arrays": sorted(arrays)}, fid, indent=2)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True):
+        """Opens a store written by `save`, memory-mapped unless `mmap` is False."""
+        with open(join(path, "store.json")) as fid:
+            meta = json_load(fid)
+        if meta["version"] != STORE_VERSION:
+            raise ValueError(f"unsupported trajectory store version {meta['version']}")
+
+        mmap_mode = "r" if mmap else None
+        arrays = {name: np_load(join(path, f"{name}.npy"), mmap_mode=mmap_mode) for name in meta["arrays"]}
+        return cls(
+            {name: arrays[f"frame_{name}"] for name in FRAME_COLUMNS},
+            {name: arrays[f"track_{name}"] for name in TRACK_COLUMNS},
+            arrays["times"],
+            arrays["time_offsets"],
+            arrays["agent_keys"],
+            arrays["agent_offsets"])
+
+
+def get_store(output) -> TrajectoryStore:
+    """Returns `output` if it is already a store, else sorts it into one."""
+    if isinstance(output, TrajectoryStore):
+        return output
+    return TrajectoryStore.from_output(output)
@@ -0,0 +1,186 @@
+from os import makedirs
+from os.path import exists, getmtime, join
+from numpy import flipud as np_flipud
+from numpy import load as np_load
+from numpy import savez_compressed as np_savez_compressed
+from numpy import stack as np_stack
+from numpy import maximum as np_maximum
+from numpy import minimum as np_minimum
+from rasterio import open as rasterio_open
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+from process.space import TiledTerrain
+
+
+class TerrainPyramid:
+    """Multi-resolution land/water pyramid read lazily from a basemap GeoTIFF.
+
+    The simulated grid (width x height cells) is mapped onto `region`, a window of the
+    basemap (e.g. a sub-region of `scott_base.tif`, or any file written by
+    `download_clean_ross_sea_basemap`). Nothing is kept at full resolution up front:
+
+    - level k of the pyramid holds, for every block of 2**k x 2**k cells, whether all
+      and whether any of the basemap pixels under the block are land. It is computed
+      the first time it is needed, reading the region strip by strip (and optionally
+      cached on disk),
+    - a terrain tile whose footprint (plus a one cell halo) is all land, or has no land
+      at all, at the coarse level is taken as a land or water tile without any further
+      read. Since every cell is sampled from one of the pixels under it, this is exact,
+    - the other tiles (the coastline) are read from their own rasterio window at full
+      resolution, only when the simulation first touches them.
+
+    Args:
+        width (int): Grid width (x).
+        height (int): Grid height (y).
+        path (str): Basemap GeoTIFF (default: "scott_base.tif").
+        region (tuple, optional): (col_off, row_off, n_cols, n_rows) window of the basemap
+            in pixels. Defaults to the whole raster.
+        tile_size (int): Edge length of the terrain tiles in cells (default: 64).
+        coarse_level (int): Pyramid level used to classify the tiles, 0 reads every
+            tile at full resolution (default: 3).
+        threshold (int): Pixel value above which a cell is land (default: 100).
+        cache_dir (str, optional): Directory where the pyramid levels are cached.
+    """
+
+    def __init__(
+            self,
+            width: int,
+            height: int,
+            path: str = "scott_base.tif",
+            region: tuple or None = None,
+            tile_size: int = 64,
+            coarse_level: int = 3,
+            threshold: int = 100,
+            cache_dir: str or None = None):
+        self.width = width
+        self.height = height
+        self.path = path
+        self.tile_size = tile_size
+        self.coarse_level = coarse_level
+        self.threshold = threshold
+        self.cache_dir = cache_dir
+        self.levels = {}
+        self.tiles_read = 0
+
+        if region is None:
+            with rasterio_open(path) as src:
+                region = (0, 0, src.width, src.height)
+        self.region = tuple(region)
+
+    def _read(self, window: Window, out_shape: tuple):
+        with rasterio_open(self.path) as src:
+            img_data = src.read(1, window=window, out_shape=out_shape, resampling=Resampling.nearest)
+
+        # Image rows go from top to bottom, the grid y axis goes from bottom to top
+        return (np_flipud(img_data) > self.threshold).T
+
+    def _cache_path(self, level: int) -> str:
+        name = "terrain_bounds_{}_{}_{}_{}_{}_{}_{}_{}_{}.npz".format(
+            int(getmtime(self.path)), *self.region, self.width, self.height, self.threshold, level)
+        return join(self.cache_dir, name)
+
+    def level(self, level: int) -> tuple:
+        """Returns the land bounds of the whole region at pyramid level `level`.
+
+        Args:
+            level (int): 0 is the grid resolution, each level halves it.
+
+        Returns:
+            tuple: (all_land, any_land), boolean masks of shape (ceil(width / 2**level),
+                ceil(height / 2**level)) indexed [x, y], True where all (any) of the
+                basemap pixels under the block are land.
+        """
+        if level in self.levels:
+            return self.levels[level]
+
+        cache_path = None
+        if self.cache_dir is not None:
+            cache_path = self._cache_path(level)
+            if exists(cache_path):
+                cached = np_load(cache_path)
+                self.levels[level] = (cached["all_land"], cached["any_land"])
+                return self.levels[level]
+
+        factor = 2 ** level
+        col_off, row_off, n_cols, n_rows = self.region
+        scale_x = n_cols / self.width
+        scale_y = n_rows / self.height
+
+        # first basemap column of every block, and first image row of every block from
+        # the top (image rows go from top to bottom, blocks from the bottom of the grid)
+        col_starts = [int(x * scale_x) for x in range(0, self.width, factor)]
+        row_starts = [
+            int((self.height - min(y + factor, self.height)) * scale_y)
+            for y in reversed(range(0, self.height, factor))]
+        row_stops = row_starts[1:] + [n_rows]
+
+        lows = []
+        highs = []
+        with rasterio_open(self.path) as src:
+            for start, stop in zip(row_starts, row_stops):
+                stop = min(n_rows, max(stop, start + 1))
+                strip = src.read(1, window=Window(col_off, row_off + start, n_cols, stop - start))
+                lows.append(np_minimum.reduceat(strip.min(axis=0), col_starts))
+                highs.append(np_maximum.reduceat(strip.max(axis=0), col_starts))
+
+        all_land = (np_flipud(np_stack(lows)) > self.threshold).T
+        any_land = (np_flipud(np_stack(highs)) > self.threshold).T
+
+        if cache_path is not None:
+            makedirs(self.cache_dir, exist_ok=True)
+            np_savez_compressed(cache_path, all_land=all_land, any_land=any_land)
+
+        self.levels[level] = (all_land, any_land)
+        return self.levels[level]
+
+    def read_tile(self, tx: int, ty: int):
+        """Reads the tile (tx, ty) at grid resolution from its own window of the basemap."""
+        size = self.tile_size
+        x0 = tx * size
+        y0 = ty * size
+        n_x = min(size, self.width - x0)
+        n_y = min(size, self.height - y0)
+
+        col_off, row_off, n_cols, n_rows = self.region
+        scale_x = n_cols / self.width
+        scale_y = n_rows / self.height
+        window = Window(
+            col_off + x0 * scale_x,
+            row_off + (self.height - y0 - n_y) * scale_y,
+            n_x * scale_x,
+            n_y * scale_y)
+
+        self.tiles_read += 1
+        return self._read(window, (n_y, n_x))
+
+    def classify_tile(self, tx: int, ty: int) -> bool or None:
+        """True (False) if the tile (tx, ty) is all land (water) at the coarse level, else None."""
+        if self.coarse_level == 0:
+            return None
+
+        all_land, any_land = self.level(self.coarse_level)
+        factor = 2 ** self.coarse_level
+        size = self.tile_size
+        x0 = max(0, (tx * size) // factor - 1)
+        y0 = max(0, (ty * size) // factor - 1)
+        x1 = -(-((tx + 1) * size) // factor) + 1
+        y1 = -(-((ty + 1) * size) // factor) + 1
+
+        if all_land[x0:x1, y0:y1].all():
+            return True
+        if not any_land[x0:x1, y0:y1].any():
+            return False
+        return None
+
+    def load_tile(self, tx: int, ty: int):
+        """Tile loader for `TiledTerrain`: a bool for uniform tiles, a mask for coastal ones."""
+        tile = self.classify_tile(tx, ty)
+        if tile is None:
+            return self.read_tile(tx, ty)
+        return tile
+
+    def to_terrain(self) -> TiledTerrain:
+        """Returns a `TiledTerrain` whose tiles are loaded from the pyramid on first access."""
+        return TiledTerrain(
+            self.width, self.height, tile_size=self.tile_size, loader=self.load_tile,
+            classify=self.classify_tile)
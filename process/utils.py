@@ -1,47 +1,89 @@
 
-from math import sqrt as math_sqrt
 from random import choices as random_choices
 from random import choice as random_choice
-from pandas import DataFrame
-from process import TOTAL_TIMESTEPS
+from process import TOTAL_TIMESTEPS, SPACE_VARS
 from random import random as random_random
 from numpy import linspace as np_linspace   
 from numpy import full as np_full
 from numpy import flipud as np_flipud
-from rasterio import open as rasterio_open
-from rasterio.enums import Resampling
+from numpy import array as np_array
+from numpy import nonzero as np_nonzero
+from numpy import load as np_load
+from numpy import savez_compressed as np_savez_compressed
+from os import makedirs
+from os.path import exists, getmtime, join
+from process.space import LandCells
+from process.animal import decode_output
+from process.melt import TerrainHistory
+from process.kernels import nearest_indices, farthest_indices, neighborhood, threshold_mask
+
+def get_terrain_type(width, height, tiled: bool = False, tile_size: int = 64) -> str:
+    if tiled:
+        # rasterio is only imported when the terrain is actually read
+        from process.terrain import TerrainPyramid
+
+        # Tiled terrain: tiles are read lazily from the basemap pyramid and only coastal
+        # tiles keep per-cell data, land cells are a view on it
+        terrain = TerrainPyramid(
+            width,
+            height,
+            path=SPACE_VARS["basemap"],
+            region=SPACE_VARS["terrain_region"],
+            tile_size=tile_size,
+            coarse_level=SPACE_VARS["terrain_coarse_level"],
+            cache_dir=SPACE_VARS["terrain_cache_dir"]).to_terrain()
+        return terrain, LandCells(terrain)
 
-def get_terrain_type(width, height) -> str:
     # Separate terrain grid (water everywhere, land based on Basemap TIFF)
     terrain = np_full((width, height), "water", dtype=object)
     land_cells = set()
     
-    # 1. Read the downloaded basemap using rasterio
-    # Note: Ensure "scott_base.tif" is in the same directory, or provide the correct path.
-    with rasterio_open("scott_base.tif") as src:
-        # Read the first band (Red/Grayscale) and automatically resample it to MAP_SIZE
-        img_data = src.read(
-            1, 
-            out_shape=(height, width),
-            resampling=Resampling.nearest
-        )
+    # The thresholded mask can be cached, so short runs don't have to import rasterio
+    # and resample the basemap every time
+    cache_path = None
+    if SPACE_VARS["terrain_cache_dir"] is not None:
+        cache_path = join(
+            SPACE_VARS["terrain_cache_dir"],
+            f"terrain_dense_{int(getmtime('scott_base.tif'))}_{width}_{height}.npz")
+
+    if cache_path is not None and exists(cache_path):
+        land_mask = np_load(cache_path)["mask"]
+    else:
+        from rasterio import open as rasterio_open
+        from rasterio.enums import Resampling
+
+        # 1. Read the downloaded basemap using rasterio
+        # Note: Ensure "scott_base.tif" is in the same directory, or provide the correct path.
+        with rasterio_open("scott_base.tif") as src:
+            # Read the first band (Red/Grayscale) and automatically resample it to MAP_SIZE
+            img_data = src.read(
+                1, 
+                out_shape=(height, width),
+                resampling=Resampling.nearest
+            )
+            
+        # 2. Coordinate Alignment: Image origin (0,0) is at the top-left, 
+        # but Mesa grids use (0,0) at the bottom-left. We flip the image vertically to match.
+        img_data = np_flipud(img_data)
         
-    # 2. Coordinate Alignment: Image origin (0,0) is at the top-left, 
-    # but Mesa grids use (0,0) at the bottom-left. We flip the image vertically to match.
-    img_data = np_flipud(img_data)
-    
-    # 3. Apply Threshold: Dark ocean pixels are roughly <50, bright ice is >200.
-    # A threshold of 100 perfectly divides land and water.
-    for x in range(width):
-        for y in range(height):
-            # Note numpy arrays are indexed [row, col] which corresponds to [y, x]
-            if img_data[y, x] > 100: 
-                terrain[x][y] = "land"
-                land_cells.add((x, y))
+        # 3. Apply Threshold: Dark ocean pixels are roughly <50, bright ice is >200.
+        # A threshold of 100 perfectly divides land and water.
+        land_mask = threshold_mask(img_data, 100)
+
+        if cache_path is not None:
+            makedirs(SPACE_VARS["terrain_cache_dir"], exist_ok=True)
+            np_savez_compressed(cache_path, mask=land_mask)
+
+    terrain[land_mask] = "land"
+
+    # land cells are added in the same (x, then y) order as the original loop
+    land_xs, land_ys = np_nonzero(land_mask)
+    for x, y in zip(land_xs.tolist(), land_ys.tolist()):
+        land_cells.add((x, y))
 
     return terrain, land_cells
 
-def run_model(model) -> DataFrame:
+def run_model(model, monitor=None, timesteps: int or None = None, verbose: bool = True) -> tuple:
     """Runs a simulation model for 100 steps and collects agent data into a DataFrame.
 
     Executes the model for 100 time steps, collecting data about each agent's position,
@@ -51,6 +93,10 @@ def run_model(model) -> DataFrame:
         model: A simulation model object with a `step()` method and a `schedule` attribute
             containing `agents`. Each agent must have `pos` (tuple of x,y coordinates),
             `type`, and `status` attributes.
+        monitor (LiveMonitor, optional): Started live monitor, the changes of each step are
+            streamed to its clients.
+        timesteps (int, optional): Number of steps (default: `TOTAL_TIMESTEPS`).
+        verbose (bool): Print the step number at every step (default: True).
 
     Returns:
         DataFrame: A pandas DataFrame with columns:
@@ -59,6 +105,8 @@ def run_model(model) -> DataFrame:
             - status: Agent status
             - x (float): Agent x-coordinate
             - y (float): Agent y-coordinate
+        TerrainHistory: The land cells by timestep (read like a dict of lists, each step
+            is rebuilt from the melted cells when it is looked up).
 
     Raises:
         AttributeError: If model doesn't have required methods/attributes or if agents
@@ -76,13 +124,24 @@ def run_model(model) -> DataFrame:
     """
     output = {"id": [], "time": [], "type": [], "status": [], "x": [], "y": [], "terrain": []}
 
-    terrain_history = {}
+    # land cells per step, rebuilt from the melted cells when asked
+    terrain_history = TerrainHistory.from_model(model)
+
+    if monitor is not None:
+        monitor.publish(model, -1)
+
+    if timesteps is None:
+        timesteps = TOTAL_TIMESTEPS
 
-    for i in range(TOTAL_TIMESTEPS):
-        print(f"step {i}")
+    for i in range(timesteps):
+        if verbose:
+            print(f"step {i}")
         model.step()
 
-        terrain_history[i] = list(model.land_cells)
+        if monitor is not None:
+            monitor.publish(model, i)
+
+        terrain_history.record(i, model.melted_cells)
 
         for agent in model.schedule.agents:
             x, y = agent.pos
@@ -92,10 +151,11 @@ def run_model(model) -> DataFrame:
             output["status"].append(agent.status )
             output["x"].append(x)
             output["y"].append(y)
-            output["terrain"].append(model.terrain[x][y])
+            output["terrain"].append(model.terrain[x, y])
 
 
-    output = DataFrame.from_dict(output)
+    from pandas import DataFrame
+    output = DataFrame.from_dict(decode_output(output))
 
     return output, terrain_history
 
@@ -130,19 +190,13 @@ def get_nearest_position(
         >>> get_nearest_position(possible, target)
         (1, 1)  # Example output, actual result may vary due to randomness
     """
-    all_new_positions = []
-    for proc_possible_pos in possible_pos:
-        proc_dist = math_sqrt(
-            (target_pos[0] - proc_possible_pos[0]) ** 2 + (target_pos[1] - proc_possible_pos[1]) ** 2)
-        all_new_positions.append(proc_dist)
-
-    if len(all_new_positions) < len(probabilies):
-        probabilies = probabilies[0:len(all_new_positions)]
+    if len(possible_pos) < len(probabilies):
+        probabilies = probabilies[0:len(possible_pos)]
     probabilies = [x / sum(probabilies) for x in probabilies]
 
-    indices, _ = zip(*sorted(
-        enumerate(all_new_positions), key=lambda x: x[1])[:len(probabilies)])
-    selected_items = [possible_pos[i] for i in indices]
+    all_pos = np_array(possible_pos)
+    indices = nearest_indices(all_pos[:, 0], all_pos[:, 1], target_pos[0], target_pos[1], len(probabilies))
+    selected_items = [possible_pos[i] for i in indices.tolist()]
 
     new_position = random_choices(selected_items, weights=probabilies, k=1)[0]
     
@@ -184,19 +238,15 @@ def escape_strategy(all_enemies, possible_pos: list, probabilies: list = [0.3, 0
     """
 
     probabilies = np_linspace(0.3, 0.1, len(all_enemies))
+    if len(possible_pos) < len(probabilies):
+        probabilies = probabilies[0:len(possible_pos)]
     probabilies = probabilies / sum(probabilies)
     probabilies = probabilies.tolist()
 
-    all_dis = []
-    for proc_position in possible_pos:
-        total_dis = 0
-        for proc_enemy in all_enemies:
-            total_dis += math_sqrt((proc_enemy.pos[0] - proc_position[0]) ** 2 + (proc_enemy.pos[1] - proc_position[1]) ** 2)
-        all_dis.append(total_dis)
-
-    indices, _ = zip(*sorted(
-        enumerate(all_dis), key=lambda x: x[1], reverse=True)[:len(probabilies)])
-
+    all_pos = np_array(possible_pos)
+    enemy_pos = np_array([proc_enemy.pos for proc_enemy in all_enemies])
+    indices = farthest_indices(
+        all_pos[:, 0], all_pos[:, 1], enemy_pos[:, 0], enemy_pos[:, 1], len(probabilies)).tolist()
 
     selected_items = [possible_pos[i] for i in indices]
 
@@ -205,6 +255,35 @@ def escape_strategy(all_enemies, possible_pos: list, probabilies: list = [0.3, 0
     return new_position
 
 
+def get_terrain_neighborhood(
+        model, pos: tuple, radius, terrain_type: str or None = None, include_center: bool = False) -> list:
+    """Returns the cells of the Moore neighborhood of `pos`, optionally only those of one terrain type.
+
+    Same cells and same order as `model.grid.get_neighborhood` followed by a terrain filter.
+    On the dense backend the window is scanned by the `neighborhood` kernel on `model.land_mask`.
+
+    Args:
+        model: The model (grid, terrain and, for the dense backend, `land_mask`).
+        pos (tuple): Center of the neighborhood.
+        radius (int): Neighborhood radius in cells.
+        terrain_type (str, optional): "land" or "water" to keep only cells of that type.
+        include_center (bool): Whether `pos` itself is part of the neighborhood (default: False).
+
+    Returns:
+        list: (x, y) positions.
+    """
+    if model.land_mask is None:
+        possible_pos = model.grid.get_neighborhood(
+            pos, moore=True, include_center=include_center, radius=int(radius))
+        if terrain_type is None:
+            return possible_pos
+        return [proc_pos for proc_pos in possible_pos if model.terrain[proc_pos[0], proc_pos[1]] == terrain_type]
+
+    want_land = -1 if terrain_type is None else int(terrain_type == "land")
+    cells = neighborhood(pos[0], pos[1], int(radius), model.land_mask, include_center, want_land)
+    return [(x, y) for x, y in cells.tolist()]
+
+
 def get_random_move_position(model, proc_pos, speed, terrain_type: str or None = None) -> tuple:
     """
     Selects a random position within a specified radius from the current position.
@@ -236,13 +315,11 @@ def get_random_move_position(model, proc_pos, speed, terrain_type: str or None =
         >>> get_random_move_position(model, (0, 0), 1)
         (1, 0)  # Example output, actual result may vary due to randomness
     """
-    possible_steps = model.grid.get_neighborhood(
-        proc_pos, moore=True, include_center=True, radius=int(speed))
-    
     if terrain_type is None:
+        possible_steps = get_terrain_neighborhood(model, proc_pos, speed, include_center=True)
         return random_choice(possible_steps)
     
-    terrain_steps = [pos for pos in possible_steps if model.terrain[pos[0]][pos[1]] == terrain_type]
+    terrain_steps = get_terrain_neighborhood(model, proc_pos, speed, terrain_type, include_center=True)
     if terrain_steps:
         new_position = random_choice(terrain_steps)
         return new_position
@@ -251,11 +328,7 @@ def get_random_move_position(model, proc_pos, speed, terrain_type: str or None =
     
 
 def chase_or_home(model, start_pos, target_pos, speed, terrain_type: str or None = None) -> tuple:
-    possible_positions = model.grid.get_neighborhood(
-       start_pos, moore=True, include_center=False, radius=int(speed))
-
-    if terrain_type is not None:
-        possible_positions = [pos for pos in possible_positions if model.terrain[pos[0]][pos[1]] == terrain_type]
+    possible_positions = get_terrain_neighborhood(model, start_pos, speed, terrain_type)
 
     if possible_positions:
         new_position = get_nearest_position(possible_positions, target_pos)
@@ -264,6 +337,31 @@ def chase_or_home(model, start_pos, target_pos, speed, terrain_type: str or None
     return start_pos
 
 
+def go_home(model, start_pos, home, speed, terrain_type: str or None = None, route_terrain: str or None = None) -> tuple:
+    """Step towards `home`, along the model's shared flow fields when it has some.
+
+    Args:
+        model: The model (`model.homing` is None with the "greedy" homing method).
+        start_pos (tuple): Current position.
+        home (tuple): Home cell.
+        speed (float): Step radius (truncated to cells).
+        terrain_type (str, optional): Terrain of the cells `chase_or_home` may step on.
+        route_terrain (str, optional): Terrain the flow field routes through (default:
+            `terrain_type`).
+
+    Returns:
+        tuple: New position (x, y).
+    """
+    if int(speed) < 1:
+        # nothing within reach (the current cell is not part of the neighborhood)
+        return start_pos
+    if model.homing is not None:
+        new_position = model.homing.step(
+            start_pos, home, int(speed), terrain_type if route_terrain is None else route_terrain)
+        if new_position is not None:
+            return new_position
+    return chase_or_home(model, start_pos, home, speed, terrain_type)
+
 
 def success_rate(rate: float = 0.6) -> bool:
     """Determine success based on a given probability rate.
@@ -2,14 +2,19 @@ from mesa import Agent, Model
 from mesa.time import RandomActivation
 from mesa.space import MultiGrid
 from mesa.datacollection import DataCollector
-import numpy as np
 from process.fish import Fish
 from process.penguin import Penguin
 from process.seal import Seal
-from vis import simple_vis, plot_summary_charts
-from random import gauss, random
-from pandas import DataFrame
-from process import CLIMATE_VARS, MAP_SIZE, POPULATION, INITIAL_LOCATIONS, LAND_LOCATIONS
+from random import gauss, random, getrandbits
+from numpy.random import default_rng
+from process import CLIMATE_VARS, MAP_SIZE, POPULATION, INITIAL_LOCATIONS, SPACE_VARS, MONITOR_VARS, PLACEMENT_VARS, PARAMS, HOMING_VARS
+from process.animal import TYPE_NAMES, FISH
+from process.placement import sample_cells
+from process.pool import AgentPool
+from process.homing import HomingFields
+from process.space import SparseMultiGrid
+from process.registry import PreyRegistry
+from process import kernels
 from process.utils import run_model, get_terrain_type
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning)
@@ -22,53 +27,82 @@ class SealPenguinFishModel(Model):
             N_fish=POPULATION["fish"], 
             width=MAP_SIZE, 
             height=MAP_SIZE, 
-            init_loc = INITIAL_LOCATIONS):
+            init_loc = INITIAL_LOCATIONS,
+            space_backend = SPACE_VARS["backend"],
+            melt_timeline = None):
         
         self.current_step = 0
+        self.melted_cells = []
+        self.event_log = None
+        # (predator, prey, predator energy before the kill) of the step, kept by the
+        # partitioned runs to settle kills made on ghosts (see process/partition.py)
+        self.kill_log = None
+        # spatial summaries accumulated while stepping (see process/heatmap.py)
+        self.heatmaps = None
+        # pre-generated melt (see process/melt.py), replayed instead of the live ice dynamics
+        self.melt_timeline = None
 
         self.num_penguins = N_penguins
         self.num_seals = N_seals
         self.num_fish = N_fish
-        self.grid = MultiGrid(width, height, torus=False)
+        self.sparse = space_backend == "sparse"
+        if self.sparse:
+            self.grid = SparseMultiGrid(width, height, torus=False)
+        else:
+            self.grid = MultiGrid(width, height, torus=False)
         self.schedule = RandomActivation(self)
 
-        # Separate terrain grid (water everywhere, land in the middle)
-        self.terrain = np.full((width, height), "water", dtype=object)
-        self.land_cells = set()
-        for proc_land in LAND_LOCATIONS:
-            for x in range(proc_land[0][0], proc_land[0][1]):
-                for y in range(proc_land[1][0], proc_land[1][1]):
-                    self.terrain[x][y] = "land"
-                    self.land_cells.add((x, y))
-        
-        self.terrain, self.land_cells = get_terrain_type(width, height)
-
-
-        # Create fish (in water only)
-        for i in range(self.num_fish):
-            fish = Fish(i, self)
-            if fish.home is not None:
-                self.grid.place_agent(fish, (fish.home["x"], fish.home["y"]))
-                self.schedule.add(fish)
-
-        # Create penguins (in both water and land)
-        for i in range(self.num_penguins):
-            penguin = Penguin(i, self)
-            if penguin.home is not None:
-                self.grid.place_agent(penguin, (penguin.home["x"], penguin.home["y"]))
-                self.schedule.add(penguin)
-
-
-        # Create seals (in water only)
-        for i in range(self.num_seals):
-            seal = Seal(i, self)
-            while True:
-                x = max(0, min(width - 1, int(gauss(mu=init_loc["seal"][0], sigma=3))))
-                y = max(0, min(height - 1, int(gauss(mu=init_loc["seal"][1], sigma=3))))
-                if self.terrain[x][y] == "water":
-                    self.grid.place_agent(seal, (x, y))
-                    self.schedule.add(seal)
-                    break
+        self.terrain, self.land_cells = get_terrain_type(
+            width, height, tiled=self.sparse, tile_size=SPACE_VARS["terrain_tile_size"])
+        # bool land mask for the numeric kernels (dense backend only)
+        self.land_mask = None if self.sparse else self.terrain == "land"
+        self.registry = PreyRegistry(self)
+        # shared flow fields for the agents heading home (dense backend only)
+        self.homing = HomingFields(self) if HOMING_VARS["method"] == "flow" and not self.sparse else None
+
+        if melt_timeline is not None:
+            self.set_melt_timeline(melt_timeline)
+
+
+        if PLACEMENT_VARS["method"] == "batch":
+            self.place_populations(init_loc)
+        else:
+            # Create fish (in water only)
+            for i in range(self.num_fish):
+                fish = Fish(i, self)
+                if fish.home is not None:
+                    self.grid.place_agent(fish, fish.home)
+                    self.schedule.add(fish)
+                    self.registry.add(fish)
+
+            # Create penguins (in both water and land)
+            for i in range(self.num_penguins):
+                penguin = Penguin(i, self)
+                if penguin.home is not None:
+                    self.grid.place_agent(penguin, penguin.home)
+                    self.schedule.add(penguin)
+                    self.registry.add(penguin)
+
+
+            # Create seals (in water only)
+            for i in range(self.num_seals):
+                seal = Seal(i, self)
+                while True:
+                    x = max(0, min(width - 1, int(gauss(mu=init_loc["seal"][0], sigma=3))))
+                    y = max(0, min(height - 1, int(gauss(mu=init_loc["seal"][1], sigma=3))))
+                    if self.terrain[x, y] == "water":
+                        self.grid.place_agent(seal, (x, y))
+                        self.schedule.add(seal)
+                        self.registry.add(seal)
+                        break
+
+        # births recycle the dead agents (see process/pool.py), only set up when enabled
+        self.pools = {}
+        for agent_cls in (Fish, Penguin):
+            rules = PARAMS[TYPE_NAMES[agent_cls.type]]["reproduction"]
+            if rules["rate"] > 0:
+                self.pools[agent_cls.type] = AgentPool(self, agent_cls, retire_after=rules["retire_after"])
+        self.birth_rng = default_rng(getrandbits(64)) if self.pools else None
 
         # Data collector
         self.datacollector = DataCollector(
@@ -79,39 +113,150 @@ class SealPenguinFishModel(Model):
             }
         )
 
+    def place_populations(self, init_loc: dict):
+        """Creates and places all the agents, with their cells drawn in batch.
+
+        Each population is drawn at once among the cells of its terrain, weighted by a
+        Gaussian around its initial location (see `sample_cells`), so exactly `num_fish`,
+        `num_penguins` and `num_seals` agents are placed. Seals start near
+        `init_loc["seal"]` and have their home drawn like the other agents.
+        """
+        # the sparse terrain is passed as is, so only the tiles near the agents are read
+        land_mask = self.land_mask if self.land_mask is not None else self.terrain
+        rng = default_rng(getrandbits(64))
+        sigma = max(3, self.grid.width / 10.0)
+
+        for agent_cls, n, name, terrain_type in (
+                (Fish, self.num_fish, "fish", "water"),
+                (Penguin, self.num_penguins, "penguin", "land"),
+                (Seal, self.num_seals, "seal", "water")):
+            xs, ys = sample_cells(land_mask, terrain_type, INITIAL_LOCATIONS[name], sigma, n, rng)
+            homes = list(zip(xs.tolist(), ys.tolist()))
+            positions = homes
+            if agent_cls is Seal:
+                xs, ys = sample_cells(land_mask, "water", init_loc["seal"], 3, n, rng)
+                positions = list(zip(xs.tolist(), ys.tolist()))
+
+            agents = [agent_cls(i, self, home=home) for i, home in enumerate(homes)]
+            for agent, pos in zip(agents, positions):
+                self.grid.place_agent(agent, pos)
+                self.schedule.add(agent)
+            self.registry.add_many(agents)
+
+    def set_melt_timeline(self, melt_timeline, timesteps: int or None = None):
+        """Replays `melt_timeline` instead of the live ice dynamics.
+
+        Raises:
+            ValueError: If the timeline was made for another terrain or stability index,
+                or covers fewer than `timesteps` steps (see `MeltTimeline.check`).
+        """
+        if self.current_step != 0:
+            raise ValueError("a melt timeline can only be set before the first step")
+        melt_timeline.check(
+            self.land_mask if self.land_mask is not None else self.terrain.to_mask(),
+            stability_index=CLIMATE_VARS["ice_stability_index"],
+            timesteps=timesteps)
+        self.melt_timeline = melt_timeline
+
     def update_ice_dynamics(self):
         self.current_step += 1
+
+        if self.melt_timeline is not None:
+            self.apply_melt(self.melt_timeline.cells_at(self.current_step - 1))
+            return
         
-        edges_to_melt = []
-        for x, y in self.land_cells:
-            # Check 4 adjacent directions for water (Von Neumann neighborhood)
-            is_edge = False
-            for dx, dy in [(0,1), (1,0), (0,-1), (-1,0)]:
-                nx, ny = x + dx, y + dy
-                if 0 <= nx < self.grid.width and 0 <= ny < self.grid.height:
-                    if self.terrain[nx][ny] == "water":
-                        is_edge = True
-                        break
-            if is_edge:
-                edges_to_melt.append((x, y))
+        if self.sparse:
+            # only the coastal tiles are scanned, those not read yet melt once they are
+            self.apply_melt(self.terrain.melt_edges(CLIMATE_VARS["ice_stability_index"]))
+            return
+
+        edge_mask = kernels.edge_mask(self.land_mask)
+        # keep the land_cells order, so the random draws below go to the same cells
+        edges_to_melt = [(x, y) for x, y in self.land_cells if edge_mask[x, y]]
 
         # Apply the stability index probability to the edges
-        for mx, my in edges_to_melt:
-            if random() < CLIMATE_VARS["ice_stability_index"]:
-                self.terrain[mx][my] = "water"
-                self.land_cells.remove((mx, my))
+        self.apply_melt([
+            (mx, my) for mx, my in edges_to_melt if random() < CLIMATE_VARS["ice_stability_index"]])
+
+    def apply_melt(self, cells: list):
+        """Turns the given land cells into water (also used to replay a melt computed elsewhere)."""
+        for mx, my in cells:
+            self.terrain[mx, my] = "water"
+            self.land_cells.remove((mx, my))
+            if self.land_mask is not None:
+                self.land_mask[mx, my] = False
+        self.melted_cells = list(cells)
+        self.registry.on_melt(self.melted_cells)
+        if self.homing is not None:
+            self.homing.on_melt(self.melted_cells)
+
+    def record_kill(self, predator, prey):
+        """Called by a predator when a hunt succeeds, passed on to the event log, heatmaps and kill log."""
+        if self.event_log is not None:
+            self.event_log.record_kill(predator, prey)
+        if self.kill_log is not None:
+            self.kill_log.append((predator, prey, predator.energy))
+        if self.heatmaps is not None:
+            self.heatmaps.record_kill(predator, prey)
+
+    def on_death(self, agent):
+        """Called by an agent when it dies, passed on to the pool of its type (if any)."""
+        pool = self.pools.get(agent.type)
+        if pool is not None:
+            pool.on_death(agent)
+
+    def update_births(self):
+        """Fish spawning and penguin fledging, see `PARAMS[...]["reproduction"]`.
+
+        The number of births is binomial over the eligible parents (live fish, live
+        penguins on land), capped so the live population stays within `capacity`. The
+        newborns start at their parent's cell with the parent's home.
+        """
+        for agent_type, pool in self.pools.items():
+            rules = PARAMS[TYPE_NAMES[agent_type]]["reproduction"]
+            if self.current_step % rules["interval"]:
+                continue
+            if agent_type == FISH:
+                parents = self.registry.members("alive_fish")
+            else:
+                parents = [
+                    agent for agent in self.registry.members("live_penguins")
+                    if self.terrain[agent.pos[0], agent.pos[1]] == "land"]
+
+            n = int(self.birth_rng.binomial(len(parents), rules["rate"]))
+            if rules["capacity"] is not None:
+                live = self.registry.count("alive_fish" if agent_type == FISH else "live_penguins")
+                n = min(n, max(0, rules["capacity"] - live))
+            if n == 0:
+                continue
+            for i in self.birth_rng.choice(len(parents), size=n, replace=False).tolist():
+                parent = parents[i]
+                pool.spawn(parent.pos, parent.home)
 
     def step(self):
 
         self.update_ice_dynamics()
         self.datacollector.collect(self)
         self.schedule.step()
+        if self.pools:
+            self.update_births()
+        if self.heatmaps is not None:
+            self.heatmaps.update(self, self.current_step - 1)
         if sum(1 for a in self.schedule.agents if isinstance(a, Penguin)) == 0:
             self.running = False
 
 if __name__ == "__main__":
     model = SealPenguinFishModel()
-    output, terrain_history = run_model(model) 
+    monitor = None
+    if MONITOR_VARS["enabled"]:
+        from process.monitor import LiveMonitor
+        monitor = LiveMonitor(
+            MONITOR_VARS["host"], MONITOR_VARS["port"], queue_size=MONITOR_VARS["queue_size"]).start()
+    output, terrain_history = run_model(model, monitor=monitor) 
+    if monitor is not None:
+        monitor.close()
+    # plotting libraries are only imported here, headless runs use batch.py
+    from vis import simple_vis, plot_summary_charts
     simple_vis(output, terrain_history)
     plot_summary_charts(output)
     print("done")
\ No newline at end of file
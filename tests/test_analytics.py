@@ -0,0 +1,54 @@
+import random
+
+import numpy as np
+import pytest
+from pandas.testing import assert_frame_equal
+
+from process import CLIMATE_VARS
+from process.analytics import TrajectoryAnalytics, TrajectoryIndex, iter_output_chunks
+from process.utils import run_model
+from run import SealPenguinFishModel
+
+
+@pytest.fixture(scope="module")
+def output():
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setitem(CLIMATE_VARS, "ice_stability_index", 0.05)
+        random.seed(7)
+        model = SealPenguinFishModel(N_penguins=15, N_seals=2, N_fish=80)
+        model.random.seed(7)
+        return run_model(model, timesteps=25, verbose=False)[0]
+
+
+def _assert_same(analytics, expected):
+    assert_frame_equal(analytics.agent_metrics(), expected.agent_metrics())
+    assert_frame_equal(analytics.type_metrics(), expected.type_metrics())
+    assert_frame_equal(analytics.census(), expected.census())
+    assert_frame_equal(analytics.foraging_trips(None), expected.foraging_trips(None))
+
+
+@pytest.mark.parametrize("chunksize", [13, 97, 1000])
+def test_chunked_analytics_match_in_memory(output, tmp_path, chunksize):
+    path = str(tmp_path / "output.csv")
+    output.to_csv(path, index=False)
+    expected = TrajectoryAnalytics.from_output(output)
+
+    _assert_same(TrajectoryAnalytics.from_chunks(iter_output_chunks(path, chunksize=chunksize)), expected)
+    _assert_same(TrajectoryIndex(output).analytics, expected)
+
+
+def test_metrics_match_a_direct_computation(output):
+    analytics = TrajectoryAnalytics.from_output(output)
+    census = analytics.census()
+    counts = output.groupby(["time", "type", "status"]).size()
+    for (time, agent_type, status), count in counts.items():
+        assert census.loc[time, (agent_type, status)] == count
+
+    metrics = analytics.agent_metrics()
+    index = TrajectoryIndex(output)
+    for agent_type, agent_id in metrics.index[::10]:
+        rows = output[(output["type"] == agent_type) & (output["id"] == agent_id)].sort_values("time")
+        assert_frame_equal(index.agent(agent_type, agent_id).reset_index(drop=True), rows.reset_index(drop=True))
+        distance = np.hypot(np.diff(rows["x"]), np.diff(rows["y"])).sum()
+        assert metrics.loc[(agent_type, agent_id), "distance"] == pytest.approx(distance)
+        assert metrics.loc[(agent_type, agent_id), "steps"] == len(rows)
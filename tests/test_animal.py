@@ -0,0 +1,40 @@
+import pickle
+import random
+
+from process import PARAMS
+from process.animal import (
+    FISH, PENGUIN, SEAL, SPEED_MODE_NAMES, STATUS_NAMES, TYPE_NAMES, AgentType, Status, decode_output)
+from process.utils import run_model
+from run import SealPenguinFishModel
+
+
+def test_codes_map_to_the_output_names():
+    assert TYPE_NAMES == ("fish", "penguin", "seal")
+    assert STATUS_NAMES == ("alive", "dead", "hunt", "full")
+    assert set(SPEED_MODE_NAMES) == set(PARAMS["penguin"]["energy"]["burn_rate"]["water"])
+    assert all(TYPE_NAMES[code] in PARAMS for code in (FISH, PENGUIN, SEAL))
+
+    decoded = decode_output({"type": [2, 0, 1], "status": [3, 1, 0]})
+    assert list(decoded["type"]) == ["seal", "fish", "penguin"]
+    assert list(decoded["status"]) == ["full", "dead", "alive"]
+    assert decode_output({"type": [], "status": []}) == {"type": [], "status": []}
+
+
+def test_agents_keep_codes_and_the_output_names():
+    random.seed(5)
+    model = SealPenguinFishModel(N_penguins=10, N_seals=2, N_fish=50)
+    model.random.seed(5)
+    output, _ = run_model(model, timesteps=5, verbose=False)
+
+    assert set(output["type"]) == set(TYPE_NAMES)
+    assert set(output["status"]) <= set(STATUS_NAMES)
+    final = output[output["time"] == 4]
+    expected = sorted(
+        (TYPE_NAMES[agent.type], agent.id, STATUS_NAMES[agent.status]) for agent in model.schedule.agents)
+    assert sorted(zip(final["type"], final["id"], final["status"])) == expected
+
+    for agent in model.schedule.agents:
+        assert isinstance(agent.type, AgentType)
+        assert isinstance(agent.status, Status)
+        state = pickle.loads(pickle.dumps(agent.get_state()))
+        assert (state["type"], state["_status"]) == (agent.type, agent.status)
@@ -0,0 +1,31 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _run_python(code: str) -> str:
+    return subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, check=True, capture_output=True, text=True).stdout
+
+
+def test_importing_the_model_loads_no_heavy_library():
+    loaded = json.loads(_run_python(
+        "import json, sys\n"
+        "import batch, run\n"
+        "print(json.dumps([name for name in ('numba', 'matplotlib', 'PIL') if name in sys.modules]))\n"))
+    assert loaded == []
+
+
+def test_numpy_kernels_never_import_numba(tmp_path):
+    output = tmp_path / "out.csv"
+    loaded = _run_python(
+        "import sys\n"
+        "import batch\n"
+        f"batch.main(['--penguins', '5', '--fish', '20', '--seals', '1', '--timesteps', '3', "
+        f"'--seed', '1', '--map-size', '60', '--kernels', 'numpy', '--output', r'{output}'])\n"
+        "print('numba' in sys.modules)\n")
+    assert loaded.strip().splitlines()[-1] == "False"
+    assert output.exists()
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from pandas.testing import assert_frame_equal
+
+from process import PARAMS
+from process.ensemble import EnsembleModel, pick_weighted
+from process.golden import GoldenRecord, run_ensemble
+
+POPULATION = {"fish": 200, "penguin": 30, "seal": 3}
+
+
+def test_pick_weighted_draws_like_random_choices():
+    valid = np.array([[True, False, True, True], [False, False, False, False], [True, True, False, False]])
+    score = np.array([[3.0, 0.0, 1.0, 2.0], [0.0, 0.0, 0.0, 0.0], [5.0, 5.0, 0.0, 0.0]])
+    weights = np.array([0.5, 0.3, 0.2])
+
+    # u in [0, 0.5) picks the best ranked candidate, [0.5, 0.8) the second...
+    assert pick_weighted(valid, score, weights, np.array([0.1, 0.5, 0.1]))[0][[0, 2]].tolist() == [2, 0]
+    picked, found = pick_weighted(valid, score, weights, np.array([0.79, 0.5, 0.9]))
+    assert found.tolist() == [True, False, True]
+    # row 2 only has two candidates: weights 0.5 and 0.3 renormalised
+    assert picked[[0, 2]].tolist() == [3, 1]
+    assert pick_weighted(valid, score, weights, np.array([0.95, 0.5, 0.6]))[0][[0, 2]].tolist() == [0, 0]
+
+
+def test_replicates_do_not_depend_on_the_ensemble_size():
+    alone = EnsembleModel(1, N_penguins=10, N_seals=2, N_fish=50, seed=3).run(8)
+    together = EnsembleModel(3, N_penguins=10, N_seals=2, N_fish=50, seed=3).run(8)
+    assert_frame_equal(alone[0], together[0])
+    assert not together[0].equals(together[1])
+
+
+@pytest.fixture(scope="module")
+def record():
+    return GoldenRecord.record(list(range(16)), 15, POPULATION)
+
+
+def test_ensemble_matches_the_agent_model_statistically(record):
+    assert not record.check_statistical(record.run("ensemble"))["failed"].any()
+
+
+def test_statistical_check_sees_a_changed_hunt(monkeypatch, record):
+    monkeypatch.setitem(PARAMS["penguin"], "hunt_success_rate", 0.05)
+    results = record.check_statistical(run_ensemble(record.seeds, record.timesteps, record.population))
+    assert results.set_index("statistic").loc["mean penguins full", "failed"]
@@ -0,0 +1,61 @@
+import random
+
+import pytest
+
+from process import CLIMATE_VARS
+from process.events import EventLog, run_model_events
+from process.golden import compare_outputs
+from process.utils import run_model
+from run import SealPenguinFishModel
+
+STEPS = 12
+
+
+def _new_model(seed: int):
+    random.seed(seed)
+    model = SealPenguinFishModel(N_penguins=10, N_seals=2, N_fish=60)
+    model.random.seed(seed)
+    return model
+
+
+@pytest.fixture(scope="module")
+def runs():
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setitem(CLIMATE_VARS, "ice_stability_index", 0.02)
+        output, terrain_history = run_model(_new_model(0), timesteps=STEPS, verbose=False)
+        event_log = run_model_events(_new_model(0), keyframe_interval=5, timesteps=STEPS, verbose=False)
+    return output, terrain_history, event_log
+
+
+def test_trajectory_matches_run_model(runs):
+    output, terrain_history, event_log = runs
+    trajectory, history = event_log.to_trajectory()
+
+    assert compare_outputs(output, trajectory[trajectory["time"] >= 0]) is None
+    for time in range(STEPS):
+        assert set(history[time]) == set(terrain_history[time])
+
+
+@pytest.mark.parametrize("time", [0, 4, 5, 6, STEPS - 1])
+def test_state_at_matches_run_model(runs, time):
+    output, terrain_history, event_log = runs
+    agents, land_cells = event_log.state_at(time)
+
+    frame = output[output["time"] == time]
+    expected = {
+        (agent_type, agent_id): (status, x, y)
+        for agent_type, agent_id, status, x, y in zip(frame["type"], frame["id"], frame["status"], frame["x"], frame["y"])}
+    assert agents == expected
+    assert land_cells == set(terrain_history[time])
+
+
+def test_saved_log_rebuilds_the_same_states(runs, tmp_path):
+    _, _, event_log = runs
+    event_log.save(tmp_path / "events.pkl.gz")
+    loaded = EventLog.load(tmp_path / "events.pkl.gz")
+
+    assert loaded.last_time == STEPS - 1
+    for time in (-1, 3, STEPS - 1):
+        assert loaded.state_at(time) == event_log.state_at(time)
+    with pytest.raises(ValueError):
+        loaded.state_at(STEPS)
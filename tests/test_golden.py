@@ -0,0 +1,48 @@
+import random
+
+import pytest
+
+from process import PARAMS, PREY_SEARCH_VARS
+from process.golden import GoldenRecord, get_min_pvalue, permutation_test
+
+
+def test_permutation_test_detects_a_shift_with_sixteen_seeds():
+    rng = random.Random(0)
+    golden = [rng.gauss(100, 10) for _ in range(16)]
+    same = [rng.gauss(100, 10) for _ in range(16)]
+    shifted = [rng.gauss(115, 10) for _ in range(16)]
+
+    # Bonferroni over five statistics
+    assert permutation_test(golden, shifted) < 0.05 / 5
+    assert permutation_test(golden, same) > 0.05
+    assert permutation_test([3.0] * 4, [3.0] * 4) == 1.0
+
+
+def test_exact_enumeration_reaches_the_lowest_pvalue():
+    assert permutation_test([0, 1, 2], [10, 11, 12]) == pytest.approx(get_min_pvalue(3, 3)) == 0.1
+
+
+@pytest.fixture(scope="module")
+def record():
+    return GoldenRecord.record([0, 1], 3, {"fish": 20, "penguin": 4, "seal": 1})
+
+
+def test_record_checks_exact_against_itself(record):
+    assert record.check_exact(record.run("reference")) == []
+
+
+def test_too_few_seeds_are_refused(record):
+    with pytest.raises(ValueError, match="use at least 5 seeds"):
+        record.check_statistical(record.run("reference"))
+
+
+def test_other_behaviour_config_is_refused(monkeypatch, record):
+    monkeypatch.setitem(PREY_SEARCH_VARS, "mode", "other")
+    with pytest.raises(ValueError, match="PREY_SEARCH_VARS"):
+        record.run("reference")
+
+    penguin = PARAMS["penguin"]
+    monkeypatch.setitem(penguin, "target_rescan_interval", 10)
+    assert record.check_exact(record.run("reference", use_recorded_config=True)) == []
+    assert PARAMS["penguin"] is penguin
+    assert penguin["target_rescan_interval"] == 10
@@ -0,0 +1,62 @@
+import random
+
+import numpy as np
+import pytest
+
+from process import CLIMATE_VARS
+from process.animal import TYPE_NAMES
+from process.events import run_model_events
+from process.heatmap import LAYERS, SpatialHeatmaps
+from run import SealPenguinFishModel
+
+STEPS = 12
+
+
+@pytest.fixture(scope="module")
+def run():
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setitem(CLIMATE_VARS, "ice_stability_index", 0.05)
+        random.seed(8)
+        model = SealPenguinFishModel(N_penguins=20, N_seals=3, N_fish=150)
+        model.random.seed(8)
+        heatmaps = SpatialHeatmaps.from_model(model, windows=[(0, 5), (5, STEPS)])
+        model.heatmaps = heatmaps
+        event_log = run_model_events(model, timesteps=STEPS, verbose=False)
+    output, _ = event_log.to_trajectory()
+    return heatmaps, output[output["time"] >= 0], event_log.to_dataframe(), model
+
+
+def _count(xs, ys, model) -> np.ndarray:
+    raster = np.zeros((model.grid.width, model.grid.height), dtype=int)
+    np.add.at(raster, (np.asarray(xs, dtype=int), np.asarray(ys, dtype=int)), 1)
+    return raster
+
+
+def test_heatmaps_match_the_trajectory(run):
+    heatmaps, output, events, model = run
+    live = output[output["status"] != "dead"]
+    for name in TYPE_NAMES:
+        rows = live[live["type"] == name]
+        assert (heatmaps.get(name) == _count(rows["x"], rows["y"], model)).all()
+    rows = live[(live["type"] == "penguin") & (live["terrain"] == "water")]
+    assert (heatmaps.get("penguin_water") == _count(rows["x"], rows["y"], model)).all()
+
+    kills = events[events["event"] == "kill"]
+    assert len(kills)
+    for name in TYPE_NAMES[1:]:
+        rows = kills[kills["type"] == name]
+        assert (heatmaps.get(f"{name}_kills") == _count(rows["x"], rows["y"], model)).all()
+
+
+def test_windows_add_up_and_load_back(run, tmp_path):
+    heatmaps = run[0]
+    assert heatmaps.steps == {"all": STEPS, "0_5": 5, f"5_{STEPS}": STEPS - 5}
+    for layer in LAYERS:
+        assert (heatmaps.get(layer, "0_5") + heatmaps.get(layer, f"5_{STEPS}") == heatmaps.get(layer)).all()
+
+    heatmaps.save(tmp_path / "heatmaps.npz")
+    loaded = SpatialHeatmaps.load(tmp_path / "heatmaps.npz")
+    assert loaded.windows == heatmaps.windows
+    assert loaded.steps == heatmaps.steps
+    for name in heatmaps.windows:
+        assert (loaded.rasters[name] == heatmaps.rasters[name]).all()
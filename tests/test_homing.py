@@ -0,0 +1,108 @@
+import random
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from process import KERNEL_VARS
+from process.homing import FlowField, HomingFields
+from process.kernels import UNREACHABLE, distance_field, get_njit
+from process.utils import go_home
+
+BACKENDS = ["numpy"] + (["numba"] if get_njit() is not None else [])
+
+
+def _terrain(seed: int, size: int = 60):
+    rng = np.random.default_rng(seed)
+    land = rng.random((size, size)) < 0.35
+    sources = np.zeros((size, size), dtype=bool)
+    sources[size // 2:size // 2 + 4, 5:9] = True
+    return rng, land, sources
+
+
+def _descend(field, passable, x, y, radius):
+    # first cell (in neighborhood order) of lowest distance, as agents stepped before
+    width, height = field.shape
+    best, cell = UNREACHABLE, x * height + y
+    for new_x in range(max(0, x - radius), min(width, x + radius + 1)):
+        for new_y in range(max(0, y - radius), min(height, y + radius + 1)):
+            if passable[new_x, new_y] and field[new_x, new_y] < best:
+                best, cell = field[new_x, new_y], new_x * height + new_y
+    return cell
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_backends_give_the_same_distances(monkeypatch, seed):
+    _, land, sources = _terrain(seed)
+    fields = []
+    for backend in BACKENDS:
+        monkeypatch.setitem(KERNEL_VARS, "backend", backend)
+        fields.append(distance_field(~land, sources))
+    for field in fields[1:]:
+        assert (field == fields[0]).all()
+    assert (fields[0][sources & ~land] == 0).all()
+    assert (fields[0][land] == UNREACHABLE).all()
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("seed", range(3))
+def test_melting_updates_water_fields_like_a_rebuild(monkeypatch, backend, seed):
+    monkeypatch.setitem(KERNEL_VARS, "backend", backend)
+    rng, land, sources = _terrain(seed)
+    field = FlowField(~land, sources)
+    cells = [(int(x), int(y)) for x, y in zip(*np.nonzero(~land))]
+    for pos in cells[::7]:
+        field.next_cell(pos, 2)
+
+    for _ in range(5):
+        land_cells = np.argwhere(land)
+        melted = [tuple(int(v) for v in cell) for cell in land_cells[rng.choice(len(land_cells), 40, replace=False)]]
+        for x, y in melted:
+            land[x, y] = False
+        field.open_cells(melted)
+
+        rebuilt = distance_field(~land, sources)
+        assert (field.distances == rebuilt).all()
+        for x, y in [(int(x), int(y)) for x, y in zip(*np.nonzero(~land))][::3]:
+            assert field.next_cell((x, y), 2) == _descend(rebuilt, ~land, x, y, 2)
+
+
+def test_land_fields_are_only_dropped_when_a_route_melts():
+    land = np.zeros((20, 20), dtype=bool)
+    land[2:8, 2:8] = True
+    land[12:18, 12:18] = True
+    sources = np.zeros_like(land)
+    sources[3, 3] = True
+    field = FlowField(land.copy(), sources)
+
+    # the other island cannot reach the cluster
+    assert field.close_cells([(12, 12), (15, 17)])
+    assert not field.passable[12, 12]
+    assert not field.close_cells([(7, 7)])
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_flow_homing_gets_out_of_a_bay_where_greedy_homing_is_stuck(seed):
+    # a bay of land open to the west, home to the east of it
+    land = np.zeros((40, 40), dtype=bool)
+    land[25, 10:31] = True
+    land[15:26, 10] = True
+    land[15:26, 30] = True
+    home = (35, 20)
+    random.seed(seed)
+
+    tracks = {}
+    for method in ("greedy", "flow"):
+        model = SimpleNamespace(land_mask=land, grid=SimpleNamespace(width=40, height=40), homing=None)
+        if method == "flow":
+            model.homing = HomingFields(model, cluster_size=4)
+        pos = (22, 20)
+        track = [pos]
+        for _ in range(100):
+            pos = go_home(model, pos, home, 1, terrain_type="water")
+            assert not land[pos]
+            track.append(pos)
+        tracks[method] = track
+
+    assert max(x for x, _ in tracks["greedy"]) < 25
+    assert max(abs(tracks["flow"][-1][0] - home[0]), abs(tracks["flow"][-1][1] - home[1])) <= 3
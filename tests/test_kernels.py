@@ -0,0 +1,58 @@
+import random
+
+import numpy as np
+import pytest
+
+from process import CLIMATE_VARS, KERNEL_VARS, kernels
+from process.golden import compare_outputs
+from process.utils import run_model
+from run import SealPenguinFishModel
+
+HAS_NUMBA = kernels.get_njit() is not None
+
+
+def _implementations(kernel) -> list:
+    implementations = [kernel.numpy_impl, kernel.loop_impl]
+    if HAS_NUMBA:
+        implementations.append(kernels.get_njit()(cache=True)(kernel.loop_impl))
+    return implementations
+
+
+def _same(results) -> bool:
+    return all(np.array_equal(result, results[0]) for result in results[1:])
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_implementations_agree(seed):
+    rng = np.random.default_rng(seed)
+    size = 40
+    land_mask = rng.random((size, size)) < 0.6
+    xs = rng.integers(0, size, 50).astype(float)
+    ys = rng.integers(0, size, 50).astype(float)
+    enemy_xs = rng.integers(0, size, 3).astype(float)
+    enemy_ys = rng.integers(0, size, 3).astype(float)
+    img_data = rng.integers(0, 255, (30, size))
+
+    assert _same([impl(xs, ys, 7.0, 9.0, 5) for impl in _implementations(kernels.nearest_indices)])
+    assert _same([impl(xs, ys, enemy_xs, enemy_ys, 5) for impl in _implementations(kernels.farthest_indices)])
+    assert _same([impl(land_mask) for impl in _implementations(kernels.edge_mask)])
+    assert _same([impl(img_data, 100) for impl in _implementations(kernels.threshold_mask)])
+    for x, y, radius in ((0, 0, 1), (20, 21, 3), (39, 5, 10)):
+        for include_center in (False, True):
+            for want_land in (-1, 0, 1):
+                assert _same([
+                    impl(x, y, radius, land_mask, include_center, want_land)
+                    for impl in _implementations(kernels.neighborhood)])
+
+
+@pytest.mark.skipif(not HAS_NUMBA, reason="numba is not installed")
+def test_numba_run_matches_numpy_run(monkeypatch):
+    monkeypatch.setitem(CLIMATE_VARS, "ice_stability_index", 0.05)
+    outputs = []
+    for backend in ("numpy", "numba"):
+        monkeypatch.setitem(KERNEL_VARS, "backend", backend)
+        random.seed(2)
+        model = SealPenguinFishModel(N_penguins=15, N_seals=2, N_fish=100)
+        model.random.seed(2)
+        outputs.append(run_model(model, timesteps=10, verbose=False)[0])
+    assert compare_outputs(outputs[0], outputs[1]) is None
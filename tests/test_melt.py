@@ -0,0 +1,83 @@
+import random
+
+import numpy as np
+import pytest
+
+from process import CLIMATE_VARS, SPACE_VARS
+from process.kernels import edge_mask
+from process.melt import MeltTimeline
+from process.utils import run_model
+from run import SealPenguinFishModel
+
+STEPS = 10
+STABILITY_INDEX = 0.05
+
+
+@pytest.fixture(autouse=True)
+def _fast_melt(monkeypatch, tmp_path):
+    monkeypatch.setitem(CLIMATE_VARS, "ice_stability_index", STABILITY_INDEX)
+    monkeypatch.setitem(SPACE_VARS, "terrain_cache_dir", str(tmp_path))
+
+
+def _new_model(space_backend: str = "dense", **kwargs):
+    random.seed(6)
+    model = SealPenguinFishModel(N_penguins=5, N_seals=1, N_fish=30, space_backend=space_backend, **kwargs)
+    model.random.seed(6)
+    return model
+
+
+@pytest.fixture(scope="module")
+def land_mask():
+    model = SealPenguinFishModel(N_penguins=0, N_seals=0, N_fish=0)
+    return model.land_mask.copy()
+
+
+def test_timeline_only_melts_edge_cells(land_mask):
+    timeline = MeltTimeline.generate(land_mask, STEPS, stability_index=STABILITY_INDEX, seed=1)
+    assert len(timeline) == STEPS
+
+    mask = land_mask.copy()
+    for step in range(STEPS):
+        cells = timeline.cells_at(step)
+        assert cells
+        edges = edge_mask(mask)
+        assert all(edges[x, y] for x, y in cells)
+        mask[tuple(np.array(cells).T)] = False
+        assert (timeline.land_mask_at(land_mask, step) == mask).all()
+
+    again = MeltTimeline.generate(land_mask, STEPS, stability_index=STABILITY_INDEX, seed=1)
+    assert (again.cells == timeline.cells).all() and (again.offsets == timeline.offsets).all()
+
+
+def test_saved_timeline_loads_the_same(land_mask, tmp_path):
+    timeline = MeltTimeline.generate(land_mask, STEPS, stability_index=STABILITY_INDEX, seed=2)
+    timeline.save(tmp_path / "melt.npz")
+    loaded = MeltTimeline.load(tmp_path / "melt.npz")
+
+    assert [loaded.cells_at(step) for step in range(STEPS)] == [timeline.cells_at(step) for step in range(STEPS)]
+    assert (loaded.width, loaded.height, loaded.stability_index, loaded.seed, loaded.terrain_digest) == (
+        timeline.width, timeline.height, timeline.stability_index, timeline.seed, timeline.terrain_digest)
+    loaded.check(land_mask, stability_index=STABILITY_INDEX, timesteps=STEPS)
+
+
+def test_timeline_is_refused_for_another_run(land_mask):
+    timeline = MeltTimeline.generate(land_mask, STEPS, stability_index=STABILITY_INDEX, seed=3)
+    other = land_mask.copy()
+    other[tuple(np.argwhere(other)[0])] = False
+    with pytest.raises(ValueError, match="another terrain"):
+        timeline.check(other)
+    with pytest.raises(ValueError, match="ice_stability_index"):
+        timeline.check(stability_index=0.5)
+    with pytest.raises(ValueError, match="covers"):
+        timeline.check(timesteps=STEPS + 1)
+
+
+@pytest.mark.parametrize("space_backend", ["dense", "sparse"])
+def test_runs_replay_the_timeline(land_mask, space_backend):
+    timeline = MeltTimeline.generate(land_mask, STEPS, stability_index=STABILITY_INDEX, seed=4)
+    _, terrain_history = run_model(
+        _new_model(space_backend, melt_timeline=timeline), timesteps=STEPS, verbose=False)
+
+    for step in range(STEPS):
+        expected = timeline.land_mask_at(land_mask, step)
+        assert set(terrain_history[step]) == set(zip(*np.nonzero(expected)))
@@ -0,0 +1,75 @@
+import json
+import random
+import socket
+import time
+from threading import Thread
+
+from process import CLIMATE_VARS
+from process.animal import STATUS_NAMES, TYPE_NAMES
+from process.monitor import LiveMonitor, _Client, get_census
+from process.utils import run_model
+from run import SealPenguinFishModel
+
+
+def _read_stream(port: int, messages: list):
+    with socket.create_connection(("127.0.0.1", port)) as connection:
+        connection.sendall(b"GET /stream HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        stream = connection.makefile("rb")
+        while stream.readline() not in (b"\r\n", b""):
+            pass
+        for line in stream:
+            messages.append(json.loads(line))
+
+
+def test_stream_replays_to_the_model_state(monkeypatch):
+    monkeypatch.setitem(CLIMATE_VARS, "ice_stability_index", 0.05)
+    random.seed(4)
+    model = SealPenguinFishModel(N_penguins=10, N_seals=2, N_fish=80)
+    model.random.seed(4)
+
+    monitor = LiveMonitor(port=0).start()
+    messages = []
+    reader = Thread(target=_read_stream, args=(monitor.port, messages))
+    reader.start()
+    while not monitor.clients:
+        time.sleep(0.01)
+    initial_land = set(model.land_cells)
+    try:
+        run_model(model, monitor=monitor, timesteps=8, verbose=False)
+    finally:
+        monitor.close()
+    reader.join(timeout=10)
+
+    assert [message["event"] for message in messages] == ["snapshot"] + ["step"] * 9 + ["done"]
+    assert [message["time"] for message in messages[1:-1]] == list(range(-1, 8))
+
+    agents = {}
+    melted = []
+    for message in messages[:-1]:
+        for agent in message["agents"]:
+            agents[(agent[0], agent[1])] = agent
+        for key in message.get("removed", []):
+            del agents[tuple(key)]
+        melted.extend(tuple(cell) for cell in message["melted"])
+
+    assert agents == {
+        (TYPE_NAMES[agent.type], agent.id): [
+            TYPE_NAMES[agent.type], agent.id, agent.pos[0], agent.pos[1], STATUS_NAMES[agent.status]]
+        for agent in model.schedule.agents}
+    assert set(melted) == initial_land - set(model.land_cells)
+    assert messages[-1]["census"] == get_census(model)
+
+
+def test_slow_client_is_resynced_instead_of_buffering():
+    monitor = LiveMonitor(queue_size=4)
+    client = _Client(None, websocket=False)
+    monitor.clients.add(client)
+    for time_step in range(50):
+        monitor._broadcast(
+            {"event": "step", "time": time_step, "census": {}, "agents": [], "removed": [], "melted": []}, (10, 10))
+
+    # the backlog was dropped for a single snapshot request
+    assert client.resync
+    assert client.queue.qsize() == 1
+    assert client.queue.get_nowait() is None
+    assert json.loads(monitor._snapshot())["time"] == 49
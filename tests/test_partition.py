@@ -0,0 +1,113 @@
+import random
+
+import pytest
+
+from process import PARAMS
+from process.partition import Domain, Tiling, get_halo_widths, route_agent, run_partitioned
+from run import SealPenguinFishModel
+
+SIZE = 200
+
+
+def test_tiling_is_2d_and_ghosts_reach_only_neighbor_tiles():
+    tiling = Tiling(SIZE, SIZE, 4, min_size=60)
+    assert (tiling.n_x, tiling.n_y) == (2, 2)
+    assert [tiling.owner(pos) for pos in ((0, 0), (0, 199), (199, 0), (199, 199))] == [0, 1, 2, 3]
+    assert tiling.ghost_ranks((10, 10), 60) == []
+    assert tiling.ghost_ranks((95, 95), 10) == [1, 2, 3]
+    assert tiling.ghost_ranks((95, 10), 10) == [2]
+    with pytest.raises(ValueError):
+        Tiling(SIZE, SIZE, 16, min_size=60)
+
+
+def test_only_changed_ghosts_are_sent():
+    tiling = Tiling(SIZE, SIZE, 2, min_size=60)
+    halos = {0: 10}
+    owner, sent, messages = route_agent(tiling, halos, 0, (95, 50), 0, {})
+    assert (owner, messages) == (0, [(1, "new")])
+    assert route_agent(tiling, halos, 0, (95, 50), 0, sent)[2] == []
+    assert route_agent(tiling, halos, 0, (96, 50), 0, sent)[2] == [(1, "update")]
+    assert route_agent(tiling, halos, 0, (20, 50), 0, sent)[2] == [(1, "drop")]
+    # migrating: the new owner replaces its ghost, the old one gets a ghost
+    owner, sent, messages = route_agent(tiling, halos, 0, (105, 50), 0, sent)
+    assert (owner, sent, messages) == (1, {0: (105, 50, 0)}, [(0, "new")])
+
+
+def _exchange(domains, owners, time):
+    # what run_partitioned does with its workers, in process
+    kills = [[] for _ in domains]
+    for domain in domains:
+        for prey_key, predator_key, energy_change in domain.step([]):
+            kills[owners[prey_key]].append((prey_key, predator_key, energy_change))
+    messages = [[] for _ in domains]
+    rejected = []
+    for rank, domain in enumerate(domains):
+        rank_rejected, rank_messages = domain.sync(time, kills[rank])
+        rejected.extend(rank_rejected)
+        for dest, kind, payload in rank_messages:
+            if kind == "own":
+                owners[(payload[0]["type"], payload[0]["id"])] = dest
+            messages[dest].append((kind, payload))
+    rollbacks = [[] for _ in domains]
+    for predator_key, energy_change in rejected:
+        rollbacks[owners[predator_key]].append((predator_key, energy_change))
+    for rank, domain in enumerate(domains):
+        domain.load(messages[rank], rollbacks[rank])
+
+
+@pytest.mark.parametrize("seed", range(2))
+def test_ghosts_follow_their_owner(seed):
+    random.seed(seed)
+    model = SealPenguinFishModel(N_penguins=30, N_seals=4, N_fish=300)
+    halos = get_halo_widths()
+    tiling = Tiling(SIZE, SIZE, 4, min_size=max(halos.values()))
+    domains = [
+        Domain(SealPenguinFishModel(N_penguins=0, N_seals=0, N_fish=0), tiling, rank, halos)
+        for rank in range(len(tiling))]
+    owners = {}
+    messages = [[] for _ in domains]
+    for agent in model.schedule.agents:
+        owner, sent, routes = route_agent(tiling, halos, agent.type, agent.pos, agent.status, {})
+        owners[(agent.type, agent.id)] = owner
+        state = agent.get_state()
+        messages[owner].append(("own", (state, sent)))
+        for rank, _ in routes:
+            messages[rank].append(("new", {key: state[key] for key in ("id", "unique_id", "_status", "type", "pos")}))
+    for rank, domain in enumerate(domains):
+        domain.load(messages[rank])
+
+    for time in range(15):
+        _exchange(domains, owners, time)
+        owned = {}
+        for rank, domain in enumerate(domains):
+            for key in domain.owned:
+                assert key not in owned
+                agent = domain.agents[key]
+                owned[key] = (agent.pos, agent.status)
+                assert tiling.owner(agent.pos) == rank == owners[key]
+        assert len(owned) == len(model.schedule.agents)
+        for rank, domain in enumerate(domains):
+            ghosts = {key for key in domain.agents if key not in domain.owned}
+            expected = {
+                key for key, (pos, _) in owned.items()
+                if rank in tiling.ghost_ranks(pos, halos[key[0]])}
+            assert ghosts == expected
+            for key in ghosts:
+                # as last sent by the owner (rolled back predators are sent the next step)
+                agent = domain.agents[key]
+                assert agent.pos == owned[key][0]
+                assert (*agent.pos, agent.status) == domains[owners[key]].sent[key][rank]
+
+
+def test_unsupported_features_raise(monkeypatch):
+    random.seed(0)
+    monkeypatch.setitem(PARAMS["fish"], "reproduction", dict(PARAMS["fish"]["reproduction"], rate=0.1))
+    model = SealPenguinFishModel(N_penguins=5, N_seals=1, N_fish=20)
+    with pytest.raises(NotImplementedError):
+        run_partitioned(model, n_workers=2, timesteps=1, verbose=False)
+    monkeypatch.undo()
+
+    model = SealPenguinFishModel(N_penguins=5, N_seals=1, N_fish=20)
+    model.heatmaps = object()
+    with pytest.raises(NotImplementedError):
+        run_partitioned(model, n_workers=2, timesteps=1, verbose=False)
@@ -0,0 +1,53 @@
+import random
+
+import pytest
+
+from process import PARAMS
+from process.animal import DEAD, FISH, PENGUIN
+from run import SealPenguinFishModel
+
+VISION = int(PARAMS["penguin"]["vision"]["hunt"])
+
+
+@pytest.fixture
+def chase():
+    random.seed(0)
+    model = SealPenguinFishModel(N_penguins=1, N_seals=0, N_fish=1)
+    model.random.seed(0)
+    penguin = next(agent for agent in model.schedule.agents if agent.type == PENGUIN)
+    fish = next(agent for agent in model.schedule.agents if agent.type == FISH)
+    x, y = penguin.pos
+    model.grid.move_agent(fish, (x + 5 if x + 5 < model.grid.width else x - 5, y))
+    penguin.lock_target(fish)
+    return model, penguin, fish
+
+
+def test_target_is_tracked_until_the_rescan(monkeypatch, chase):
+    monkeypatch.setitem(PARAMS["penguin"], "target_rescan_interval", 3)
+    _, penguin, fish = chase
+
+    assert [penguin.track_target() for _ in range(4)] == [fish.pos] * 3 + [None]
+    assert penguin.target is None
+
+
+def test_no_tracking_by_default(chase):
+    assert PARAMS["penguin"]["target_rescan_interval"] is None
+    _, penguin, _ = chase
+    assert penguin.track_target() is None
+
+
+@pytest.mark.parametrize("change", ["dead", "reused", "out_of_vision"])
+def test_lost_target_triggers_a_rescan(monkeypatch, chase, change):
+    monkeypatch.setitem(PARAMS["penguin"], "target_rescan_interval", 10)
+    model, penguin, fish = chase
+    assert penguin.track_target() == fish.pos
+
+    if change == "dead":
+        fish.status = DEAD
+    elif change == "reused":
+        fish.id += 1000
+    else:
+        x, y = penguin.pos
+        model.grid.move_agent(fish, (x + VISION + 1 if x + VISION + 1 < model.grid.width else x - VISION - 1, y))
+    assert penguin.track_target() is None
+    assert penguin.target is None
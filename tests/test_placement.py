@@ -0,0 +1,69 @@
+import random
+
+import numpy as np
+import pytest
+
+from process import PLACEMENT_VARS, SPACE_VARS
+from process.animal import FISH, PENGUIN, SEAL
+from process.placement import sample_cells
+from run import SealPenguinFishModel
+
+POPULATION = {FISH: 2000, PENGUIN: 300, SEAL: 20}
+TERRAIN = {FISH: "water", PENGUIN: "land", SEAL: "water"}
+
+
+def _new_model(monkeypatch, method: str, space_backend: str = "dense", seed: int = 0):
+    monkeypatch.setitem(PLACEMENT_VARS, "method", method)
+    random.seed(seed)
+    return SealPenguinFishModel(
+        N_penguins=POPULATION[PENGUIN], N_seals=POPULATION[SEAL], N_fish=POPULATION[FISH],
+        space_backend=space_backend)
+
+
+def _agents(model) -> dict:
+    agents = {agent_type: [] for agent_type in POPULATION}
+    for agent in model.schedule.agents:
+        agents[agent.type].append(agent)
+    return agents
+
+
+def test_batch_places_every_agent_on_its_terrain(monkeypatch):
+    model = _new_model(monkeypatch, "batch")
+    for agent_type, agents in _agents(model).items():
+        assert len(agents) == POPULATION[agent_type]
+        assert sorted(agent.id for agent in agents) == list(range(POPULATION[agent_type]))
+        for agent in agents:
+            assert model.terrain[agent.home] == TERRAIN[agent_type]
+            assert model.terrain[agent.pos] == TERRAIN[agent_type]
+            assert model.grid.get_cell_list_contents([agent.pos]).count(agent) == 1
+        assert model.registry.count("alive_fish") == POPULATION[FISH]
+
+
+def test_batch_placement_is_the_same_on_both_backends(monkeypatch, tmp_path):
+    monkeypatch.setitem(SPACE_VARS, "terrain_cache_dir", str(tmp_path))
+    placements = []
+    for space_backend in ("dense", "sparse"):
+        model = _new_model(monkeypatch, "batch", space_backend, seed=1)
+        placements.append(sorted((agent.type, agent.id, agent.pos, agent.home) for agent in model.schedule.agents))
+    assert placements[0] == placements[1]
+
+
+@pytest.mark.parametrize("agent_type", [FISH, PENGUIN])
+def test_batch_homes_are_spread_like_the_rejection_ones(monkeypatch, agent_type):
+    homes = []
+    for method in ("rejection", "batch"):
+        homes.append(np.array([agent.home for agent in _agents(_new_model(monkeypatch, method))[agent_type]]))
+    rejection, batch = homes
+    standard_error = np.sqrt(rejection.var(axis=0) / len(rejection) + batch.var(axis=0) / len(batch))
+    assert (np.abs(rejection.mean(axis=0) - batch.mean(axis=0)) < 4 * standard_error).all()
+    assert np.allclose(rejection.std(axis=0), batch.std(axis=0), rtol=0.15)
+
+
+def test_sample_cells_falls_back_to_the_whole_grid():
+    land_mask = np.zeros((50, 40), dtype=bool)
+    land_mask[45:, 35:] = True
+    xs, ys = sample_cells(land_mask, "land", (0, 0), 3, 100, np.random.default_rng(0))
+    assert len(xs) == 100
+    assert land_mask[xs, ys].all()
+    with pytest.raises(ValueError):
+        sample_cells(np.zeros((10, 10), dtype=bool), "land", (5, 5), 3, 1, np.random.default_rng(0))
@@ -0,0 +1,69 @@
+import random
+
+import pytest
+
+from process import PARAMS
+from process.animal import ALIVE, DEAD, FISH
+from process.registry import REGISTRY_CATEGORIES
+from process.utils import run_model
+from run import SealPenguinFishModel
+
+N_FISH = 100
+STEPS = 30
+
+
+@pytest.fixture(scope="module")
+def run():
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setitem(
+            PARAMS["fish"], "reproduction", {"rate": 0.05, "interval": 1, "capacity": N_FISH, "retire_after": 2})
+        random.seed(10)
+        model = SealPenguinFishModel(N_penguins=60, N_seals=2, N_fish=N_FISH)
+        model.random.seed(10)
+        objects = set()
+        step = model.step
+
+        def step_and_check():
+            step()
+            objects.update(id(agent) for agent in model.schedule.agents if agent.type == FISH)
+            fish = [agent for agent in model.schedule.agents if agent.type == FISH]
+            # births stop at the capacity
+            assert sum(agent.status == ALIVE for agent in fish) <= N_FISH
+            for name, belongs in REGISTRY_CATEGORIES.items():
+                assert set(model.registry.members(name)) == {
+                    agent for agent in model.schedule.agents if belongs(model, agent)}
+
+        model.step = step_and_check
+        output, _ = run_model(model, timesteps=STEPS, verbose=False)
+    return model, output, objects
+
+
+def test_births_reuse_the_dead_fish(run):
+    model, _, objects = run
+    pool = model.pools[FISH]
+    assert pool.reused > 0
+    assert len(objects) == N_FISH + pool.created
+    assert pool.next_id == N_FISH + pool.created + pool.reused
+
+
+def test_ids_are_never_reused(run):
+    _, output, _ = run
+    fish = output[output["type"] == "fish"].sort_values(["id", "time"])
+    for _, rows in fish.groupby("id"):
+        # one contiguous stretch of steps, alive then dead
+        times = rows["time"].tolist()
+        assert times == list(range(times[0], times[0] + len(times)))
+        statuses = rows["status"].tolist()
+        assert statuses == sorted(statuses)
+        assert statuses[0] == "alive" or times[0] == 0
+
+
+def test_reused_objects_are_fresh_agents(run):
+    model, _, _ = run
+    ids = [agent.id for agent in model.schedule.agents if agent.type == FISH]
+    assert len(ids) == len(set(ids))
+    for agent in model.schedule.agents:
+        if agent.type == FISH and agent.id >= N_FISH:
+            assert agent.unique_id == agent.id
+            assert agent.status in (ALIVE, DEAD)
+            assert model.terrain[agent.home] == "water"
@@ -0,0 +1,125 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from process import CLIMATE_VARS, PREY_SEARCH_VARS, SPACE_VARS
+from process.animal import FISH, ALIVE, DEAD
+from process.registry import REGISTRY_CATEGORIES, PreyRegistry
+from process.utils import get_nearest_position
+from run import SealPenguinFishModel
+
+WIDTH = 200
+HEIGHT = 150
+
+
+class _Fish:
+    """The attributes of a fish the registry looks at."""
+
+    type = FISH
+
+    def __init__(self, pos: tuple, status: int = ALIVE):
+        self.pos = pos
+        self.status = status
+
+
+def _make_registry(rng: random.Random, n_fish: int, clustered: bool) -> PreyRegistry:
+    model = SimpleNamespace(grid=SimpleNamespace(width=WIDTH, height=HEIGHT), terrain=None)
+    registry = PreyRegistry(model, search_mode="exact")
+    for _ in range(n_fish):
+        if clustered:
+            # dense schools (several fish per cell) on an otherwise empty sea
+            x = min(WIDTH - 1, max(0, int(rng.gauss(rng.choice((40, 120, 170)), 8))))
+            y = min(HEIGHT - 1, max(0, int(rng.gauss(rng.choice((30, 100)), 8))))
+        else:
+            x = rng.randrange(WIDTH)
+            y = rng.randrange(HEIGHT)
+        registry.add(_Fish((x, y), ALIVE if rng.random() < 0.9 else DEAD))
+    return registry
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("clustered", [False, True])
+def test_exact_nearest_picks_like_query(monkeypatch, seed, clustered):
+    monkeypatch.setitem(PREY_SEARCH_VARS, "min_cells", 1)
+    rng = random.Random(seed)
+    registry = _make_registry(rng, 3000, clustered)
+
+    for i in range(300):
+        pos = (rng.randrange(WIDTH), rng.randrange(HEIGHT))
+        radius = rng.choice((1, 3, 10, 31, 60))
+        include_center = rng.random() < 0.2
+
+        nearby = registry.nearest("alive_fish", pos, radius, 5, include_center)
+        everything = registry.query("alive_fish", pos, radius, include_center)
+
+        # a subset of the window, in query order
+        members = set(nearby)
+        assert nearby == [agent for agent in everything if agent in members]
+        if not everything:
+            assert nearby == []
+            continue
+
+        random.seed(i)
+        picked = get_nearest_position([agent.pos for agent in nearby], pos, possible_ids=nearby)
+        random.seed(i)
+        expected = get_nearest_position([agent.pos for agent in everything], pos, possible_ids=everything)
+        assert picked == expected
+
+
+def test_pyramid_is_built_once_the_set_is_large_enough(monkeypatch):
+    monkeypatch.setitem(PREY_SEARCH_VARS, "min_cells", 100)
+    rng = random.Random(0)
+    registry = _make_registry(rng, 0, False)
+
+    def add_fish(n):
+        for _ in range(n):
+            registry.add(_Fish((rng.randrange(WIDTH), rng.randrange(HEIGHT))))
+
+    add_fish(50)
+    registry.nearest("alive_fish", (10, 10), 60, 5)
+    assert "alive_fish" not in registry._pyramids
+
+    add_fish(200)
+    registry.nearest("alive_fish", (10, 10), 60, 5)
+    pyramid = registry._pyramids["alive_fish"]
+    assert int(pyramid.levels[1].sum()) == registry.count("alive_fish")
+
+    # kept up to date once built
+    fish = registry.members("alive_fish")
+    for agent in fish[:100]:
+        agent.status = DEAD
+        registry.refresh(agent)
+    assert int(pyramid.levels[1].sum()) == registry.count("alive_fish")
+
+    # and dropped when the set shrinks well below the threshold
+    for agent in fish[100:]:
+        registry.remove(agent)
+    registry.nearest("alive_fish", (10, 10), 60, 5)
+    assert "alive_fish" not in registry._pyramids
+
+
+@pytest.mark.parametrize("space_backend", ["dense", "sparse"])
+def test_sets_follow_a_run(monkeypatch, tmp_path, space_backend):
+    monkeypatch.setitem(CLIMATE_VARS, "ice_stability_index", 0.05)
+    monkeypatch.setitem(SPACE_VARS, "terrain_cache_dir", str(tmp_path))
+    random.seed(1)
+    model = SealPenguinFishModel(N_penguins=30, N_seals=4, N_fish=300, space_backend=space_backend)
+    model.random.seed(1)
+    rng = random.Random(1)
+
+    for _ in range(10):
+        model.step()
+        agents = [agent for agent in model.schedule.agents if agent.pos is not None]
+        for name, belongs in REGISTRY_CATEGORIES.items():
+            expected = [agent for agent in agents if belongs(model, agent)]
+            assert model.registry.count(name) == len(expected)
+            assert set(model.registry.members(name)) == set(expected)
+
+            for _ in range(20):
+                pos = (rng.randrange(model.grid.width), rng.randrange(model.grid.height))
+                radius = rng.choice((1, 3, 20))
+                include_center = rng.random() < 0.5
+                neighbors = model.grid.get_neighbors(pos, moore=True, include_center=include_center, radius=radius)
+                assert model.registry.query(name, pos, radius, include_center) == [
+                    agent for agent in neighbors if belongs(model, agent)]
@@ -0,0 +1,73 @@
+import random
+
+import numpy as np
+import pytest
+from mesa.space import MultiGrid
+
+from process import kernels
+from process.space import SparseMultiGrid, TiledTerrain
+
+WIDTH = 60
+HEIGHT = 45
+
+
+class _Agent:
+    def __init__(self, unique_id: int):
+        self.unique_id = unique_id
+        self.pos = None
+
+
+@pytest.mark.parametrize("n_agents", [20, 2000])
+def test_sparse_grid_matches_multigrid(n_agents):
+    rng = random.Random(n_agents)
+    dense = MultiGrid(WIDTH, HEIGHT, torus=False)
+    sparse = SparseMultiGrid(WIDTH, HEIGHT)
+    agents = [(_Agent(i), _Agent(i)) for i in range(n_agents)]
+    for dense_agent, sparse_agent in agents:
+        pos = (rng.randrange(WIDTH), rng.randrange(HEIGHT))
+        dense.place_agent(dense_agent, pos)
+        sparse.place_agent(sparse_agent, pos)
+
+    for _ in range(300):
+        dense_agent, sparse_agent = rng.choice(agents)
+        pos = (rng.randrange(WIDTH), rng.randrange(HEIGHT))
+        dense.move_agent(dense_agent, pos)
+        sparse.move_agent(sparse_agent, pos)
+
+        pos = (rng.randrange(WIDTH), rng.randrange(HEIGHT))
+        moore = rng.random() < 0.5
+        include_center = rng.random() < 0.5
+        radius = rng.choice((1, 2, 5, 20))
+        assert sparse.get_neighborhood(pos, moore, include_center, radius) == list(dense.get_neighborhood(
+            pos, moore, include_center, radius))
+        assert [agent.unique_id for agent in sparse.get_neighbors(pos, moore, include_center, radius)] == [
+            agent.unique_id for agent in dense.get_neighbors(pos, moore, include_center, radius)]
+        assert sparse.is_cell_empty(pos) == dense.is_cell_empty(pos)
+
+
+def _island_mask(rng: random.Random) -> np.ndarray:
+    x, y = np.meshgrid(np.arange(WIDTH), np.arange(HEIGHT), indexing="ij")
+    mask = np.zeros((WIDTH, HEIGHT), dtype=bool)
+    for _ in range(4):
+        cx, cy, r = rng.randrange(WIDTH), rng.randrange(HEIGHT), rng.randrange(4, 15)
+        mask |= (x - cx) ** 2 + (y - cy) ** 2 <= r ** 2
+    return mask
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_tiled_terrain_matches_the_dense_mask(seed):
+    rng = random.Random(seed)
+    mask = _island_mask(rng)
+    terrain = TiledTerrain.from_mask(mask, tile_size=8)
+
+    for _ in range(200):
+        x, y = rng.randrange(WIDTH), rng.randrange(HEIGHT)
+        land = rng.random() < 0.3
+        mask[x, y] = land
+        terrain[x, y] = "land" if land else "water"
+
+        assert (terrain.to_mask() == mask).all()
+        assert terrain.count_land() == int(mask.sum())
+        assert terrain[x][y] == ("land" if land else "water")
+        assert set(terrain.iter_edge_cells()) == set(zip(*np.nonzero(kernels.edge_mask(mask))))
+        assert set(terrain.iter_land_cells()) == set(zip(*np.nonzero(mask)))
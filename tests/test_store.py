@@ -0,0 +1,49 @@
+import random
+
+import numpy as np
+import pytest
+
+from process.golden import compare_outputs
+from process.store import TrajectoryStore
+from process.utils import run_model
+from run import SealPenguinFishModel
+
+
+@pytest.fixture(scope="module")
+def output():
+    random.seed(9)
+    model = SealPenguinFishModel(N_penguins=10, N_seals=2, N_fish=60)
+    model.random.seed(9)
+    return run_model(model, timesteps=10, verbose=False)[0]
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_saved_store_round_trips(output, tmp_path, mmap):
+    store = TrajectoryStore.from_output(output)
+    assert compare_outputs(output, store.to_output()) is None
+
+    store.save(str(tmp_path / "store"))
+    loaded = TrajectoryStore.load(str(tmp_path / "store"), mmap=mmap)
+    assert len(loaded) == len(output)
+    assert compare_outputs(output, loaded.to_output()) is None
+    assert isinstance(loaded.frames["x"], np.memmap) == mmap
+
+
+def test_frames_and_tracks_match_the_output(output):
+    store = TrajectoryStore.from_output(output)
+    for time in (0, 4, 9):
+        assert compare_outputs(output[output["time"] == time], store.to_output(time)) is None
+    with pytest.raises(KeyError):
+        store.frame(10)
+
+    for agent_type in ("fish", "penguin", "seal"):
+        ids = store.agents(agent_type)
+        assert ids == sorted(set(output.loc[output["type"] == agent_type, "id"]))
+        for agent_id in ids[::5]:
+            rows = output[(output["type"] == agent_type) & (output["id"] == agent_id)].sort_values("time")
+            track = store.track(agent_type, agent_id)
+            assert track["time"].tolist() == rows["time"].tolist()
+            assert track["x"].tolist() == rows["x"].tolist()
+            assert track["y"].tolist() == rows["y"].tolist()
+            assert store.track(agent_type, agent_id, stop=3)["time"].tolist() == [
+                time for time in rows["time"] if time <= 3]
@@ -0,0 +1,54 @@
+import pytest
+
+from process import SPACE_VARS
+from process.terrain import TerrainPyramid
+from process.utils import get_terrain_type
+
+SIZE = 200
+
+
+@pytest.fixture(scope="module")
+def land_mask():
+    terrain, _ = get_terrain_type(SIZE, SIZE)
+    return terrain == "land"
+
+
+def _pyramid(coarse_level: int, cache_dir: str or None = None) -> TerrainPyramid:
+    return TerrainPyramid(
+        SIZE, SIZE, path=SPACE_VARS["basemap"], region=SPACE_VARS["terrain_region"], tile_size=16,
+        coarse_level=coarse_level, cache_dir=cache_dir)
+
+
+def test_level_0_bounds_the_dense_terrain(land_mask):
+    all_land, any_land = _pyramid(3).level(0)
+    assert (all_land <= land_mask).all()
+    assert (land_mask <= any_land).all()
+
+
+def test_coarse_levels_reduce_level_0(tmp_path):
+    pyramid = _pyramid(3, cache_dir=str(tmp_path))
+    all_land, any_land = pyramid.level(0)
+    for level in (1, 3):
+        factor = 2 ** level
+        n = SIZE // factor
+        coarse_all, coarse_any = pyramid.level(level)
+        assert (coarse_all == all_land.reshape(n, factor, n, factor).all(axis=(1, 3))).all()
+        assert (coarse_any == any_land.reshape(n, factor, n, factor).any(axis=(1, 3))).all()
+
+    # read back from the cache
+    cached = _pyramid(3, cache_dir=str(tmp_path)).level(3)
+    assert all((cached[i] == pyramid.level(3)[i]).all() for i in range(2))
+
+
+@pytest.mark.parametrize("coarse_level", [0, 3])
+def test_lazy_terrain_matches_the_dense_terrain(land_mask, coarse_level):
+    pyramid = _pyramid(coarse_level)
+    terrain = pyramid.to_terrain()
+
+    assert (terrain.to_mask() == land_mask).all()
+    n_tiles = (SIZE // 16 + 1) ** 2
+    if coarse_level:
+        # the uniform tiles were never read at full resolution
+        assert pyramid.tiles_read < n_tiles
+    else:
+        assert pyramid.tiles_read == n_tiles
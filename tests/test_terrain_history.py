@@ -0,0 +1,63 @@
+import pickle
+import random
+
+import pytest
+
+from process import CLIMATE_VARS, SPACE_VARS
+from process.utils import run_model
+from run import SealPenguinFishModel
+
+STEPS = 15
+
+
+def _new_model(seed: int, space_backend: str, size: int = 200):
+    random.seed(seed)
+    model = SealPenguinFishModel(
+        N_penguins=10, N_seals=1, N_fish=50, width=size, height=size, space_backend=space_backend)
+    model.random.seed(seed)
+    return model
+
+
+@pytest.fixture(autouse=True)
+def _fast_melt(monkeypatch, tmp_path):
+    monkeypatch.setitem(CLIMATE_VARS, "ice_stability_index", 0.02)
+    monkeypatch.setitem(SPACE_VARS, "terrain_cache_dir", str(tmp_path))
+    monkeypatch.setitem(SPACE_VARS, "terrain_tile_size", 16)
+
+
+def test_dense_history_matches_the_land_of_every_step():
+    model = _new_model(0, "dense")
+    frames = []
+    step = model.step
+
+    def step_and_copy():
+        step()
+        frames.append(set(model.land_cells))
+
+    model.step = step_and_copy
+    _, terrain_history = run_model(model, timesteps=STEPS, verbose=False)
+
+    assert sorted(terrain_history) == list(range(STEPS))
+    assert frames[0] != frames[-1]
+    # in order, backwards and pickled
+    for time in list(range(STEPS)) + [3, 0, STEPS - 1]:
+        assert set(terrain_history[time]) == frames[time]
+        assert terrain_history.count_at(time) == len(frames[time])
+    loaded = pickle.loads(pickle.dumps(terrain_history))
+    assert set(loaded[5]) == frames[5]
+
+
+def test_sparse_history_leaves_untouched_tiles_unread():
+    model = _new_model(0, "sparse")
+    _, terrain_history = run_model(model, timesteps=STEPS, verbose=False)
+    unread = set(model.terrain._unread)
+    assert unread
+
+    # frames are rebuilt on the history's own copy of the terrain
+    last = set(terrain_history[STEPS - 1])
+    assert model.terrain._unread == unread
+    assert terrain_history.count_at(STEPS - 1) == len(last)
+    assert last == set(model.land_cells)
+
+    loaded = pickle.loads(pickle.dumps(terrain_history))
+    assert set(loaded[STEPS - 1]) == last
@@ -3,9 +3,11 @@ import numpy as np
 from pandas import DataFrame
 from os.path import exists, join
 from os import makedirs, listdir
-from process import LAND_LOCATIONS
+from process import LAND_LOCATIONS, MAP_SIZE
 from PIL import Image
 from pandas import merge as pandas_merge
+from process.animal import TYPE_NAMES, STATUS_NAMES
+from process.store import get_store
 
 
 def plot_summary_charts(output: DataFrame, output_dir="img"):
@@ -56,7 +58,18 @@ def plot_summary_charts(output: DataFrame, output_dir="img"):
     plt.close()
 
 
-def simple_vis(output: DataFrame, terrain_history: dict, output_dir = "img", enable_traceline = True):
+def simple_vis(output, terrain_history: dict, output_dir = "img", enable_traceline = True):
+    """Draws one PNG per timestep (and an animated GIF) of the agents and the land.
+
+    Args:
+        output (DataFrame or TrajectoryStore): Output of `run_model`, or a (possibly
+            memory-mapped) store of it. Frames and tracks are read as slices of the
+            store, so the cost per frame does not grow with the length of the run.
+        terrain_history (TerrainHistory or dict): Land cells by timestep.
+        output_dir (str): Directory of the images (default: "img").
+        enable_traceline (bool): Also draw the tracks of the penguins and seals so far.
+    """
+    store = get_store(output)
 
     if not exists(output_dir):
         makedirs(output_dir)
@@ -67,11 +80,8 @@ def simple_vis(output: DataFrame, terrain_history: dict, output_dir = "img", ena
     # Define markers for different statuses
     markers = {"alive": "o", 'hunt': 'o', 'dead': 'x', "full": "*"}  # Add more statuses if needed
 
-    for timestep in range(int(output["time"].min()), output["time"].max()):
-        if enable_traceline:
-            proc_outputs = output[output["time"] <= timestep]
-        else:
-            proc_outputs = output[output["time"] == timestep]
+    for timestep in range(int(store.times[0]), int(store.times[-1])):
+        frame = store.frame(timestep)
 
         # Create the plot
         plt.figure(figsize=(10, 10))
@@ -105,21 +115,20 @@ def simple_vis(output: DataFrame, terrain_history: dict, output_dir = "img", ena
                 facecolor='brown', 
                 zorder=1))
         """
-        # Iterate through unique combinations of type and status
-        for animal_type in proc_outputs["type"].unique():
-            for status in proc_outputs["status"].unique():
-
-                proc_subsets = proc_outputs[proc_outputs["type"] == animal_type]
+        # Iterate through the combinations of type and status at this timestep
+        for type_code in np.unique(frame["type"]).tolist():
+            animal_type = TYPE_NAMES[type_code]
+            # rows of one type are contiguous in a frame
+            first, last = np.searchsorted(frame["type"], [type_code, type_code + 1])
+            type_status = frame["status"][first:last]
 
-                proc_subset = proc_subsets[(proc_subsets["time"] == timestep) & (proc_outputs["status"] == status)]
+            for status_code in np.unique(type_status).tolist():
+                status = STATUS_NAMES[status_code]
+                in_status = type_status == status_code
 
-                # Skip if no data for this combination
-                if len(proc_subset) == 0:
-                    continue
-                    
                 # Plot the current location
-                plt.scatter(proc_subset['x'], 
-                        proc_subset['y'], 
+                plt.scatter(frame["x"][first:last][in_status], 
+                        frame["y"][first:last][in_status], 
                         c=colors.get(animal_type, 'gray'),  # Default to gray if type not in colors
                         marker=markers.get(status, '.'),    # Default to dot if status not in markers
                         label=f'{animal_type} ({status})',
@@ -128,15 +137,16 @@ def simple_vis(output: DataFrame, terrain_history: dict, output_dir = "img", ena
                 if enable_traceline:
                     if animal_type != "fish":
                         # Plot track lines
-                        for id_value, group in proc_subsets.groupby("id"):
-                            plt.plot(group["x"], group["y"],  linewidth=0.15, c=colors.get(animal_type, "gray"), alpha=0.15)
+                        for id_value in frame["id"][first:last].tolist():
+                            track = store.track(type_code, id_value, stop=timestep)
+                            plt.plot(track["x"], track["y"],  linewidth=0.15, c=colors.get(animal_type, "gray"), alpha=0.15)
 
 
         # LAND_LOCATIONS = [(50, 80), (50, 100)]
 
         # Set the map boundaries [0, 20] for both x and y
-        plt.xlim(0, 200)
-        plt.ylim(0, 200)
+        plt.xlim(0, MAP_SIZE)
+        plt.ylim(0, MAP_SIZE)
 
         # Add grid, labels, and legend
         plt.grid(True)